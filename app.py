@@ -4,12 +4,19 @@ Manages background scraping and provide status updates.
 """
 import os
 import threading
-import time
 import logging
 import sys
 from flask import Flask, jsonify, request
 from subz_scraper import SubzLkScraper
 from zoom_scraper import ZoomLkScraper
+from dedup_service import get_dedup_service
+from impersonation import get_impersonation_selector
+from single_flight import get_single_flight
+from hedging import get_hedged_fetcher
+from shutdown import get_shutdown
+from jobs import JobManager
+from fair_share import get_fair_share
+from scheduler import MonitorScheduler
 
 # Configure logging
 logging.basicConfig(
@@ -26,69 +33,116 @@ scrapers = {
     'subz': None,
     'zoom': None
 }
-worker_thread = None
-job_type = "idle" # idle, full_scrape_subz, full_scrape_zoom, monitoring
+# One job per source and kind at a time; different sources (and monitoring during a backfill) run side by side
+jobs = JobManager()
+scrapers_lock = threading.Lock()
 
 def get_scraper(source='zoom'):
     """Lazily create the scraper instance with fresh credentials"""
     global scrapers
-    if not scrapers.get(source):
-        token = os.getenv('TELEGRAM_BOT_TOKEN')
-        chat_id = os.getenv('TELEGRAM_CHAT_ID')
-        if not token:
-            logger.error("Missing TELEGRAM_BOT_TOKEN")
-            return None
-            
-        if source == 'subz':
-            scrapers['subz'] = SubzLkScraper(token, chat_id)
-        elif source == 'zoom':
-            scrapers['zoom'] = ZoomLkScraper(token, chat_id)
+    with scrapers_lock:
+        if not scrapers.get(source):
+            token = os.getenv('TELEGRAM_BOT_TOKEN')
+            chat_id = os.getenv('TELEGRAM_CHAT_ID')
+            if not token:
+                logger.error("Missing TELEGRAM_BOT_TOKEN")
+                return None
+                
+            # One duplicate index for every source, loaded once
+            dedup = get_dedup_service()
+            if source == 'subz':
+                scrapers['subz'] = SubzLkScraper(token, chat_id, dedup=dedup)
+            elif source == 'zoom':
+                scrapers['zoom'] = ZoomLkScraper(token, chat_id, dedup=dedup)
             
     return scrapers.get(source)
 
-def run_job(target_type, source='zoom'):
-    """Generic wrapper to run background jobs with initialization"""
-    global job_type
-    job_type = f"{target_type}_{source}"
+# Loading a source's D1 history happens once; jobs that need it meanwhile wait instead of loading it again
+init_locks = {source: threading.Lock() for source in scrapers}
+
+def ensure_initialized(source, scraper):
+    """Initialize the scraper unless that already succeeded; True once it is ready"""
+    with init_locks[source]:
+        if scraper.initialization_status != "ready":
+            scraper.initialize()
+        return scraper.initialization_status == "ready"
+
+def run_job(job, target_type, source='zoom', limit=None):
+    """Generic wrapper to run background jobs with initialization; job is also the run's budget (cancellation)"""
+    scraper = get_scraper(source)
+    if not scraper: return None
+    # Every kind shares the scraper (a monitoring pass can run during a backfill), so all of them
+    # wait on the same one-time initialization
+    if not ensure_initialized(source, scraper):
+        # Running without the processed history would queue and upload everything again
+        logger.error(f"{source} scraper not initialized ({scraper.initialization_status}), skipping {target_type}")
+        return None
     
-    try:
-        scraper = get_scraper(source)
-        if not scraper: return
-        
-        # Non-blocking registration for status page
-        scraper.initialize()
-        
-        if target_type == "full_scrape":
-            scraper.scrape_all_categories()
-        elif target_type == "monitoring":
-            if source == 'subz':
-                scraper.monitor_new_subtitles()
-            else:
-                scraper.crawl_only(limit_pages=1) # Zoom monitoring equivalent
-            
-    except Exception as e:
-        logger.error(f"Background Job Error ({job_type}): {e}", exc_info=True)
-    finally:
-        job_type = "idle"
+    if target_type == "full_scrape":
+        return scraper.scrape_all_categories(budget=job)
+    elif target_type == "process":
+        # Work through what monitoring just queued - it sorts ahead of any backlog
+        return scraper.process_queue_mode(limit=limit, budget=job, announce=False)
+    elif target_type == "monitoring":
+        if source == 'subz':
+            return scraper.monitor_new_subtitles(budget=job)
+        return scraper.crawl_only(limit_pages=1, monitoring=True, budget=job) # Zoom monitoring equivalent
+
+def job_progress(source):
+    """Per-job progress for a full scrape: the scraper's tracker and worker pool"""
+    s = scrapers.get(source)
+    progress = {
+        'category': s.tracker.current_category,
+        'page': s.tracker.current_page,
+        'found': s.tracker.total_found,
+        'processed': s.tracker.processed,
+        'success': s.tracker.success,
+        'failed': s.tracker.failed
+    }
+    if s.work_pool:
+        progress['work_pool'] = s.work_pool.get_status()
+    return progress
+
+# Both run a worker pool on the scraper, so only one of them at a time per source
+POOL_JOBS = ("full_scrape", "process")
+
+def start_job(target_type, source, limit=None):
+    """Returns (job, None) or (None, reason it was refused)"""
+    pooled = target_type in POOL_JOBS
+    return jobs.start(source, target_type, lambda job: run_job(job, target_type, source, limit),
+                      progress=(lambda: job_progress(source)) if pooled else None,
+                      conflicts=POOL_JOBS if pooled else ())
+
+# Periodic monitoring per source (replaces pinging /trigger from outside)
+scheduler = MonitorScheduler(start_job, ['zoom', 'subz'])
+
+def start_scheduler():
+    """Called by the server entry point - gunicorn's post_worker_init or __main__ - not on import"""
+    if os.getenv('MONITOR_SCHEDULER', '1') == '1':
+        scheduler.start()
 
 @app.route('/')
 def health():
     return jsonify({
         'service': 'Baiscope Universal Scraper (Zoom/Subz)',
         'status': 'online',
-        'current_job': job_type,
-        'endpoints': ['/status', '/scrape/zoom', '/scrape/subz', '/trigger/zoom']
+        'current_jobs': [job.id for job in jobs.running()],
+        'endpoints': ['/status', '/scrape/zoom', '/scrape/subz', '/trigger/zoom', '/jobs/<job>', '/cancel/<job>']
     }), 200
 
 @app.route('/status')
 def status():
     """Live status of the scrapers"""
     res = {
-        'job_info': {
-            'type': job_type,
-            'is_running': worker_thread.is_alive() if worker_thread else False
-        },
-        'database': {}
+        'jobs': jobs.get_status(),
+        'database': {},
+        'dedup': get_dedup_service().get_status(),
+        'impersonation': get_impersonation_selector().get_status(),
+        'coalescing': get_single_flight().get_status(),
+        'hedging': get_hedged_fetcher().get_status(),
+        'shutdown': get_shutdown().get_status(),
+        'rate_limits': {name: get_fair_share(name).get_status() for name in ('telegram', 'd1')},
+        'scheduler': scheduler.get_status()
     }
     
     for source in ['zoom', 'subz']:
@@ -97,38 +151,63 @@ def status():
             res['database'][source] = {
                 'discovered': s.stats.get('discovered', 0),
                 'processed': s.stats.get('processed', 0),
-                'init_status': s.initialization_status
+                'init_status': s.initialization_status,
+                'failures': s.retry_stats
             }
+            if hasattr(s, 'download_templates'):
+                res['database'][source]['speculative_downloads'] = s.download_templates.stats
+            if hasattr(s, 'fast_path_stats'):
+                res['database'][source]['fast_path'] = s.fast_path_stats
+            if s.work_pool:
+                res['database'][source]['work_pool'] = s.work_pool.get_status()
+            if s.autoscaler:
+                res['database'][source]['autoscaler'] = s.autoscaler.get_status()
             
     return jsonify(res)
 
 @app.route('/trigger/<source>')
 def trigger(source):
     """Quick check for new subtitles"""
-    global worker_thread
     if source not in ['zoom', 'subz']:
         return jsonify({'error': 'Invalid source'}), 400
+    if get_shutdown().requested():
+        return jsonify({'error': 'Shutting down, not accepting new jobs'}), 503
         
-    if worker_thread and worker_thread.is_alive():
-        return jsonify({'error': f'Job already running: {job_type}'}), 400
-    
-    worker_thread = threading.Thread(target=run_job, args=("monitoring", source), daemon=True)
-    worker_thread.start()
-    return jsonify({'message': f'Monitoring cycle started for {source}'})
+    job, error = start_job("monitoring", source)
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify({'message': f'Monitoring cycle started for {source}', 'job': job.id})
 
 @app.route('/scrape/<source>')
 def full_scrape(source):
     """Exhaustive crawl of site history"""
-    global worker_thread
     if source not in ['zoom', 'subz']:
         return jsonify({'error': 'Invalid source'}), 400
+    if get_shutdown().requested():
+        return jsonify({'error': 'Shutting down, not accepting new jobs'}), 503
 
-    if worker_thread and worker_thread.is_alive():
-        return jsonify({'error': f'Job already running: {job_type}'}), 400
-    
-    worker_thread = threading.Thread(target=run_job, args=("full_scrape", source), daemon=True)
-    worker_thread.start()
-    return jsonify({'message': f'Full historical scrape started for {source}'})
+    job, error = start_job("full_scrape", source)
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify({'message': f'Full historical scrape started for {source}', 'job': job.id})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of one job"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/cancel/<job_id>')
+def cancel_job(job_id):
+    """Stop a job after its in-flight items; unstarted work stays queued"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    if not jobs.cancel(job_id):
+        return jsonify({'error': f'Job is not running ({job.state})'}), 400
+    return jsonify({'message': f'Cancelling {job_id}', 'job': job.id})
 
 @app.route('/reset/<source>')
 def reset_history(source):
@@ -168,7 +247,8 @@ def reset_history(source):
              
             # Reset in-memory sets
             s.processed_urls = set()
-            s.existing_filenames = set()
+            s.dedup.reset()
+            s.dedup.load_cloudflare_d1(s.d1)
             s.stats = {'discovered': 0, 'processed': 0}
             
             logger.info(f"Reset complete for {source}")
@@ -180,13 +260,7 @@ def reset_history(source):
 
     return jsonify({'message': 'D1 not enabled, memory reset only.'})
 
-def background_maintenance():
-    """15-minute loop to keep service alive"""
-    while True:
-        time.sleep(15 * 60)
-        logger.info("Maintenance Check: Heartbeat...")
-
 if __name__ == '__main__':
-    threading.Thread(target=background_maintenance, daemon=True).start()
+    start_scheduler()
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,109 @@
+"""
+Worker-count controller for WorkPool.
+Every interval it looks at the last window of work - throughput, error rate, how much of
+the time workers were busy and whether anything answered 429 - and resizes the pool between
+its bounds: one more worker while the workers are saturated and that still buys throughput,
+one fewer on errors or when the last step up didn't pay off, half as many when Telegram or
+the origin throttles.
+"""
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# An extra worker must raise throughput by at least this much to be kept
+MIN_GAIN = 1.05
+# Intervals to sit still after a step up didn't pay off
+HOLD_INTERVALS = 3
+# Share of worker time spent processing (not waiting for an item) that counts as saturated
+BUSY_UTILIZATION = 0.9
+
+
+class AutoScaler:
+    def __init__(self, pool, min_workers, max_workers, throttle_count=None, interval=30, max_error_rate=0.2):
+        """throttle_count() returns a running total of 429 responses seen anywhere the pool's work goes"""
+        self.pool = pool
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.throttle_count = throttle_count or (lambda: 0)
+        self.interval = interval
+        self.max_error_rate = max_error_rate
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_throttled = self.throttle_count()
+        self.last_tick = time.time()
+        self.last_action = None
+        self.last_throughput = 0.0
+        self.hold = 0
+        self.decision = {'workers': pool.num_workers, 'action': 'start', 'reason': 'configured size'}
+
+    def start(self):
+        self.pool.take_window()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _loop(self):
+        while not self.stop_event.wait(timeout=self.interval):
+            try:
+                self.step()
+            except Exception as e:
+                logger.error(f"Autoscaler error: {e}")
+
+    def step(self):
+        """Take one scaling decision from the window since the previous step"""
+        now = time.time()
+        elapsed, self.last_tick = max(now - self.last_tick, 1e-6), now
+        window = self.pool.take_window()
+        throttled_total = self.throttle_count()
+        throttled, self.last_throttled = throttled_total - self.last_throttled, throttled_total
+
+        current = self.pool.num_workers
+        completed = window['completed']
+        throughput = completed * 60 / elapsed
+        error_rate = window['errors'] / completed if completed else 0.0
+        worker_time = window['busy'] + window['idle']
+        utilization = window['busy'] / worker_time if worker_time else 0.0
+
+        if throttled:
+            target, reason = current // 2, f"{throttled} throttled (429) responses"
+        elif completed and error_rate > self.max_error_rate:
+            target, reason = current - 1, f"error rate {error_rate:.0%}"
+        elif self.last_action == 'grow' and throughput < self.last_throughput * MIN_GAIN:
+            target, reason = current - 1, "last extra worker added no throughput"
+            self.hold = HOLD_INTERVALS
+        elif self.hold:
+            self.hold -= 1
+            target, reason = current, "holding after an unprofitable step up"
+        elif completed and utilization >= BUSY_UTILIZATION:
+            # Workers hardly ever waited for an item: the pool is the bottleneck, not the feed.
+            # Whether the extra worker pays off is checked against MIN_GAIN on the next step
+            target, reason = current + 1, f"workers {utilization:.0%} busy"
+        else:
+            target, reason = current, "steady"
+
+        target = max(self.min_workers, min(self.max_workers, target))
+        action = 'grow' if target > current else 'shrink' if target < current else 'hold'
+        if action != 'hold':
+            logger.info(f"Autoscaler: {current} -> {target} workers ({reason}, {throughput:.1f} items/min)")
+            self.pool.resize(target)
+
+        self.last_action = action
+        self.last_throughput = throughput
+        self.decision = {
+            'workers': target,
+            'action': action,
+            'reason': reason,
+            'throughput_per_min': round(throughput, 1),
+            'error_rate': round(error_rate, 3),
+            'utilization': round(utilization, 3),
+            'throttled': throttled
+        }
+        return self.decision
+
+    def get_status(self):
+        return dict(self.decision, min_workers=self.min_workers, max_workers=self.max_workers)
@@ -2,19 +2,30 @@
 Cineru.lk Scraper - Robust Version
 Uses curl_cffi for real browser impersonation + Cookies support
 """
-from curl_cffi import requests
 from bs4 import BeautifulSoup
 import os
 import time
+import hashlib
 import logging
 import random
 import re
 import threading
 import sys
+import argparse
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from d1_database import D1Database
 from telegram_bot import TelegramBot
+from dedup_service import get_dedup_service
+from flaresolverr import FlareSolverrSolver
+from proxy_pool import ProxyPool
+from impersonation import get_impersonation_selector
+from scraper_utils import canonicalize_url
+from single_flight import get_single_flight
+from local_queue import LocalQueue, process_queue
+from hedging import get_hedged_fetcher, FETCH_TIMEOUT
+from downloads import probe, EXTENSIONS
+from deadline import RunBudget, parse_duration
+from shutdown import get_shutdown, stop_reason
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,28 +35,32 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class CineruScraper:
-    def __init__(self):
+    def __init__(self, dedup=None):
         self.base_url = 'https://cineru.lk'
         
-        # Initialize session with chrome impersonation and SOCKS5 proxy
-        self.session = requests.Session(
-            impersonate="chrome120",
-            proxies={"http": "socks5://127.0.0.1:10808", "https": "socks5://127.0.0.1:10808"}
-        )
+        # One chrome-impersonating session per proxy (CINERU_PROXIES, default local SOCKS5)
+        self.proxy_pool = ProxyPool(probe_url=self.base_url, is_blocked=self._is_challenged)
+        self.impersonation = get_impersonation_selector()
         
-        # Load cookies if available
-        cookies_json = os.getenv('CINERU_COOKIES', '{}')
+        # Each proxy keeps its own cookie jar on disk, with expiry: clearance is bound to the exit
+        # IP that solved it. CINERU_COOKIES seeds the first proxy's empty jar
+        env_cookies = {}
         try:
-            self.cookies = json.loads(cookies_json)
-            if self.cookies:
-                self.session.cookies.update(self.cookies)
-                logger.info(f"Loaded {len(self.cookies)} cookies from environment")
+            env_cookies = json.loads(os.getenv('CINERU_COOKIES', '{}'))
+            if env_cookies:
+                logger.info(f"Loaded {len(env_cookies)} cookies from environment")
         except Exception as e:
             logger.warning(f"Could not load cookies: {e}")
-            self.cookies = {}
+        
+        # Fresh cookies come from FlareSolverr when it is configured, solved through each proxy
+        solver_factory = None
+        if os.getenv('FLARESOLVERR_URL'):
+            solver_factory = lambda proxy_url: FlareSolverrSolver(self.base_url, proxy=proxy_url)
+        self.proxy_pool.attach_cookie_jars(os.getenv('CINERU_COOKIE_JAR', '.cineru_cookies.json'),
+                                           solver_factory, seed=env_cookies)
 
         # Standard headers
-        self.session.headers.update({
+        self.proxy_pool.update_headers({
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.9',
             'Cache-Control': 'max-age=0',
@@ -65,29 +80,40 @@ class CineruScraper:
         )
         
         # State
-        self.processed_urls = set()
-        self.processed_filenames = set()
+        self.processed_urls = set()  # canonical URLs
+        self.dedup = dedup or get_dedup_service()  # shared with every other scraper
         self.lock = threading.Lock()
+        self.single_flight = get_single_flight()
+        self.hedger = get_hedged_fetcher()
         
     def initialize(self):
         """Load existing data from database"""
         if self.db.enabled:
             self.db.create_tables()
-            self.processed_urls = self.db.get_processed_urls()
-            self.processed_filenames = self.db.get_processed_filenames()
+            self.processed_urls = {canonicalize_url(u) for u in self.db.get_processed_urls()}
+            if not self.dedup.load_d1_database(self.db):
+                # Running against a partial duplicate index would upload duplicates
+                logger.error("Initialization failed: duplicate index not loaded")
+                return False
         
-        logger.info(f"Cineru.lk Initialized: {len(self.processed_urls)} URLs, {len(self.processed_filenames)} files tracked")
+        logger.info(f"Cineru.lk Initialized: {len(self.processed_urls)} URLs, {self.dedup.get_status()['names']} files tracked")
+        return True
         
     def fetch_page(self, url, retries=3):
+        """Fetch url; concurrent requests for the same canonical URL share one fetch"""
+        return self.single_flight.do(canonicalize_url(url), lambda: self._fetch_page(url, retries))
+
+    def _fetch_page(self, url, retries):
         """Fetch page using curl_cffi with impersonation"""
-        for attempt in range(retries):
+        attempt = 0
+        while attempt < retries:
             try:
-                # curl_cffi requests
-                response = self.session.get(url, timeout=30)
+                # curl_cffi requests, hedged on a second proxy when the first is slow
+                response = self.hedger.get(url, lambda: self._proxy_get(url))
                 
                 if response.status_code == 200:
                     # Check for Cloudflare challenge in content
-                    if 'Checking your browser' in response.text or 'Just a moment' in response.text:
+                    if self._is_challenged(response):
                         logger.error("Got Cloudflare challenge page - Cookies needed or expired!")
                         return None
                     return response
@@ -99,11 +125,54 @@ class CineruScraper:
             except Exception as e:
                 logger.warning(f"Fetch error (attempt {attempt + 1}): {e}")
                 
-            if attempt < retries - 1:
+            attempt += 1
+            if attempt < retries:
                 time.sleep(random.uniform(2, 5))
                     
         return None
         
+    def _target(self, proxy, url):
+        # Solved cookies are bound to the solver's browser, so only pick a profile without them
+        return "chrome120" if proxy.cookie_jar.user_agent else self.impersonation.choose(url)
+
+    def _proxy_get(self, url):
+        """
+        One request through a pooled proxy with that proxy's own cookies, scored by ProxyPool.healthy.
+        A challenge first refreshes the proxy's clearance (solved through the same proxy) and retries
+        once; only a challenge that is left after that counts against the proxy.
+        """
+        proxy = self.proxy_pool.choose()
+        refresher = proxy.cookie_refresher
+        # Pause here while another worker is refreshing this proxy's cookies
+        generation = refresher.wait_ready()
+        for refreshed in (False, True):
+            target = self._target(proxy, url)
+            started = time.time()
+            try:
+                response = proxy.session.get(url, timeout=FETCH_TIMEOUT, impersonate=target)
+            except Exception as e:
+                self.impersonation.record(url, target, 'error')
+                self.proxy_pool.record(proxy, False)
+                logger.debug(f"Request via {proxy.url} failed: {e}")
+                raise
+            elapsed = time.time() - started
+            self.impersonation.record_response(url, target, response, elapsed)
+            if refreshed or not self._is_challenged(response) or not refresher.can_refresh:
+                break
+            # Expired for everyone using this proxy - refresh once instead of spending a retry
+            logger.info(f"Cloudflare challenge on {url} via {proxy.url} - refreshing its cookies")
+            if not refresher.refresh("challenge", seen_generation=generation):
+                break
+        self.proxy_pool.record(proxy, self.proxy_pool.healthy(response), elapsed)
+        return response
+
+    @staticmethod
+    def _is_challenged(response):
+        return response.status_code == 403 or (
+            response.status_code == 200 and
+            ('Checking your browser' in response.text or 'Just a moment' in response.text)
+        )
+        
     def find_categories(self):
         """Discover category pages"""
         logger.info("Discovering categories...")
@@ -139,12 +208,17 @@ class CineruScraper:
              
         return categories
         
-    def crawl_category(self, category_url):
-        """Crawl all pages in a category"""
-        found_urls = []
-        page = 1
+    def crawl_category(self, category_url, queue=None, budget=None):
+        """Crawl all pages in a category; returns how many new subtitle URLs were queued"""
+        total_new = 0
+        # Resume a category that a previous run was part-way through
+        page = int(queue.get(f"page:{category_url}", 1)) if queue else 1
         
         while True:
+            reason = stop_reason(budget)
+            if reason:
+                logger.info(f"{reason} - {category_url} resumes at page {page} next run")
+                break
             # Construct URL
             if page == 1:
                 url = category_url
@@ -179,11 +253,15 @@ class CineruScraper:
                 logger.info(f"No links found on page {page}")
                 break
                 
-            new_count = 0
-            for link in set(subtitle_links):
-                if link not in self.processed_urls and link not in found_urls:
-                    found_urls.append(link)
-                    new_count += 1
+            new_links = [link for link in {canonicalize_url(link, self.base_url) for link in subtitle_links}
+                         if link not in self.processed_urls]
+            new_count = len(new_links)
+            if queue:
+                # Persist every page as it is crawled, so a restart picks up from the next one.
+                # The queue's unique index does the cross-page dedup and counts what was really new
+                new_count = queue.put_many(new_links)
+                queue.set(f"page:{category_url}", page + 1)
+            total_new += new_count
                     
             logger.info(f"Page {page}: Found {len(subtitle_links)} links ({new_count} new)")
             
@@ -197,7 +275,21 @@ class CineruScraper:
             page += 1
             time.sleep(random.uniform(2, 4))
             
-        return found_urls
+        return total_new
+        
+    def probe_download(self, url):
+        """Range-probe a download through a pooled proxy: type, size and magic bytes without the body"""
+        proxy = self.proxy_pool.choose()
+        result = probe(url, session=proxy.session, impersonate=self._target(proxy, url))
+        if result and result.challenged and proxy.cookie_refresher.can_refresh:
+            logger.info(f"Download probe hit a challenge via {proxy.url} - refreshing its cookies: {url}")
+            if proxy.cookie_refresher.refresh("challenge on download probe"):
+                result = probe(url, session=proxy.session, impersonate=self._target(proxy, url))
+        return result
+        
+    def build_filename(self, title, ext):
+        clean_title = re.sub(r'[^\w\s-]', '', title)[:100]
+        return f"{clean_title}{ext}"
         
     def normalize_filename(self, filename):
         """Normalize filename for duplicate detection"""
@@ -239,6 +331,25 @@ class CineruScraper:
                 logger.warning(f"No download link: {url}")
                 return False
                 
+            # Probe first - HTML/blocked responses and known files never cost a full download
+            probe_result = self.probe_download(download_link)
+            if probe_result:
+                if probe_result.challenged:
+                    logger.info(f"Download probe still challenged - trying the full fetch: {download_link}")
+                elif probe_result.kind == 'html':
+                    logger.warning(f"Download returned HTML (likely error/block): {url}")
+                    return False
+                else:
+                    filename = self.build_filename(title, EXTENSIONS.get(probe_result.kind, '.zip'))
+                    normalized = self.normalize_filename(filename)
+                    reason, match = self.dedup.find_duplicate_before_download(filename, probe_result.length, normalized=normalized)
+                    if reason:
+                        logger.info(f"Duplicate ({reason}) before download: {filename}")
+                        self.db.mark_processed(url, title)
+                        with self.lock:
+                            self.processed_urls.add(canonicalize_url(url))
+                        return True
+                
             logger.info(f"Downloading from: {download_link}")
             file_response = self.fetch_page(download_link)
             
@@ -260,17 +371,34 @@ class CineruScraper:
             else:
                 ext = '.zip' # Default fallback
                 
-            clean_title = re.sub(r'[^\w\s-]', '', title)[:100]
-            filename = f"{clean_title}{ext}"
+            filename = self.build_filename(title, ext)
             normalized = self.normalize_filename(filename)
             
             # Check for duplicates
-            with self.lock:
-                if normalized in self.processed_filenames:
-                    logger.info(f"Duplicate: {filename}")
-                    self.db.mark_processed(url, title)
-                    self.processed_urls.add(url)
-                    return True
+            content_sha256 = hashlib.sha256(content).hexdigest()
+            
+            reason, match = self.dedup.find_duplicate(filename, content_sha256, normalized=normalized)
+            if reason == 'content':
+                # Same bytes already in the channel - reuse that upload
+                logger.info(f"Duplicate content: {filename}")
+                self.db.save_file(
+                    url=url,
+                    title=title,
+                    filename=filename,
+                    normalized_filename=normalized,
+                    file_id=match,
+                    file_size=len(content),
+                    content_sha256=content_sha256
+                )
+                with self.lock:
+                    self.processed_urls.add(canonicalize_url(url))
+                return True
+            if reason:
+                logger.info(f"Duplicate ({reason}): {filename}")
+                self.db.mark_processed(url, title)
+                with self.lock:
+                    self.processed_urls.add(canonicalize_url(url))
+                return True
                     
             # Upload to Telegram
             caption = f"<b>{title}</b>\n\nSource: Cineru.lk\nLink: {url}"
@@ -284,10 +412,11 @@ class CineruScraper:
                         filename=filename,
                         normalized_filename=normalized,
                         file_id=file_info['file_id'],
-                        file_size=len(content)
+                        file_size=len(content),
+                        content_sha256=content_sha256
                     )
-                    self.processed_urls.add(url)
-                    self.processed_filenames.add(normalized)
+                    self.processed_urls.add(canonicalize_url(url))
+                self.dedup.record_upload(filename, file_info['file_id'], content_sha256, normalized=normalized, size=len(content))
                     
                 logger.info(f"✓ Uploaded: {filename}")
                 return True
@@ -298,66 +427,89 @@ class CineruScraper:
             logger.error(f"Error processing {url}: {e}", exc_info=True)
             return False
             
-    def scrape_all(self, worker_threads=2):
-        """Main scraping function"""
+    def scrape_all(self, worker_threads=2, budget=None):
+        """Main scraping function; budget (deadline.RunBudget) ends the run early, with a report"""
+        # Also starts each proxy's cookie refresher; stop() closes their solvers
+        self.proxy_pool.start()
+        try:
+            self._scrape_all(worker_threads, budget)
+        finally:
+            self.proxy_pool.stop()
+            
+    def _scrape_all(self, worker_threads, budget=None):
         logger.info("=== STARTING CINERU.LK SCRAPE (curl_cffi + Cookies) ===")
         
-        if not self.cookies:
+        if not self.proxy_pool.has_cookies():
             logger.warning("No cookies loaded. Relying on browser impersonation only.")
             self.telegram.send_message("<b>Cineru.lk Scraper Started</b>\nUsing browser impersonation (No cookies)...")
         else:
             self.telegram.send_message("<b>Cineru.lk Scraper Started</b>\nUsing Cookies + Browser Impersonation...")
         
+        queue = LocalQueue('cineru')
+        resumed = queue.release_in_flight()
         categories = self.find_categories()
         
-        all_urls = []
+        # Discover into the local queue; categories finished by an interrupted run are skipped
         for category in categories:
-            urls = self.crawl_category(category)
-            all_urls.extend(urls)
-            logger.info(f"Category {category}: {len(urls)} new subtitles")
+            if queue.get(f"done:{category}"):
+                logger.info(f"Category {category}: already discovered, resuming")
+                continue
+            new_count = self.crawl_category(category, queue=queue, budget=budget)
+            if stop_reason(budget):
+                break
+            queue.set(f"done:{category}", 1)
+            logger.info(f"Category {category}: {new_count} new subtitles")
             
+        pending = queue.counts()['pending']
         logger.info(f"=== DISCOVERY COMPLETE ===")
-        logger.info(f"Total new URLs: {len(all_urls)}")
+        logger.info(f"Total new URLs: {pending} ({resumed} resumed mid-flight)")
         
-        if not all_urls:
+        if not pending and not stop_reason(budget):
             logger.info("No new subtitles found")
             self.telegram.send_message("No new cineru.lk subtitles found")
+            queue.reset()
+            queue.close()
             return
             
-        self.telegram.send_message(f"<b>Processing {len(all_urls)} cineru.lk subtitles...</b>")
-        
-        success_count = 0
-        failed_count = 0
+        self.telegram.send_message(f"<b>Processing {pending} cineru.lk subtitles...</b>")
         
-        # Use ThreadPool
-        with ThreadPoolExecutor(max_workers=worker_threads) as executor:
-            futures = {executor.submit(self.process_subtitle, url): url for url in all_urls}
-            
-            for i, future in enumerate(as_completed(futures), 1):
-                try:
-                    result = future.result()
-                    if result:
-                        success_count += 1
-                    else:
-                        failed_count += 1
-                except Exception as e:
-                     logger.error(f"Worker failed: {e}")
-                     failed_count += 1
-                    
-                if i % 25 == 0:
-                    logger.info(f"Progress: {i}/{len(all_urls)}")
-                    
-                time.sleep(random.uniform(2, 5))
+        # Workers pull from the queue as they free up, pausing between items
+        success_count, failed_count = process_queue(queue, self.process_subtitle, worker_threads,
+                                                    pace=(2, 5), name='cineru', budget=budget)
                 
+        reason = stop_reason(budget)
+        if reason:
+            # Out of time or shutting down: keep the queue, the next run picks up where this one stopped
+            left = queue.counts()['pending']
+            self.telegram.send_message(
+                f"<b>{reason}</b>\n"
+                f"Processed: {success_count + failed_count}\n"
+                f"Success: {success_count}\n"
+                f"Failed: {failed_count}\n"
+                f"Left for next run: {left}"
+            )
+            queue.close()
+            logger.info(f"=== STOPPED: {reason} ({left} pending) ===")
+            return
         self.telegram.send_message(
             f"<b>Cineru.lk Complete!</b>\n"
-            f"Processed: {len(all_urls)}\n"
+            f"Processed: {success_count + failed_count}\n"
             f"Success: {success_count}\n"
             f"Failed: {failed_count}"
         )
+        queue.reset()
+        queue.close()
         logger.info("=== SCRAPING COMPLETE ===")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone cineru.lk scraper (curl_cffi + cookies)")
+    parser.add_argument('--deadline', type=parse_duration,
+                        help="time budget for the run, e.g. 340m or 5h40m; new work stops early enough "
+                             "to finish what is in flight and report before it runs out")
+    args = parser.parse_args()
+    # SIGTERM/Ctrl-C finish the items in flight and report instead of killing them
+    get_shutdown().install()
     scraper = CineruScraper()
-    scraper.initialize()
-    scraper.scrape_all()
+    if not scraper.initialize():
+        sys.exit(1)
+    scraper.scrape_all(budget=RunBudget(args.deadline) if args.deadline else None)
@@ -1,19 +1,28 @@
 """
 Cineru.lk Scraper using FlareSolverr for Cloudflare bypass
-FlareSolverr must be running as a separate service
+FlareSolverr must be running as a separate service. It solves the challenge once;
+pages and files are then fetched with curl_cffi using the harvested clearance.
 """
-import requests
 from bs4 import BeautifulSoup
 import os
 import time
+import hashlib
+import atexit
 import logging
 import random
 import re
 import threading
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
 from d1_database import D1Database
 from telegram_bot import TelegramBot
+from dedup_service import get_dedup_service
+from flaresolverr import FlareSolverrPool, ClearanceFetcher
+from scraper_utils import canonicalize_url
+from single_flight import get_single_flight
+from local_queue import LocalQueue, process_queue
+from deadline import RunBudget, parse_duration
+from shutdown import get_shutdown, stop_reason
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,7 +32,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class CineruScraperV2:
-    def __init__(self):
+    def __init__(self, dedup=None):
         self.base_url = 'https://cineru.lk'
         
         # FlareSolverr endpoint (set as environment variable)
@@ -42,75 +51,51 @@ class CineruScraperV2:
         )
         
         # State
-        self.processed_urls = set()
-        self.processed_filenames = set()
+        self.processed_urls = set()  # canonical URLs
+        self.dedup = dedup or get_dedup_service()  # shared with every other scraper
         self.lock = threading.Lock()
-        self.session_id = None
+        self.single_flight = get_single_flight()
+        self.pool = None
+        self.fetcher = None
         
     def initialize(self):
         """Load existing data and create FlareSolverr session"""
         if self.db.enabled:
             self.db.create_tables()
-            self.processed_urls = self.db.get_processed_urls()
-            self.processed_filenames = self.db.get_processed_filenames()
+            self.processed_urls = {canonicalize_url(u) for u in self.db.get_processed_urls()}
+            if not self.dedup.load_d1_database(self.db):
+                # Running against a partial duplicate index would upload duplicates
+                logger.error("Initialization failed: duplicate index not loaded")
+                return False
         
-        # Create FlareSolverr session
-        try:
-            response = requests.post(self.flaresolverr_url, json={
-                'cmd': 'sessions.create'
-            }, timeout=30)
-            data = response.json()
-            if data.get('status') == 'ok':
-                self.session_id = data['session']
-                logger.info(f"FlareSolverr session created: {self.session_id}")
-        except Exception as e:
-            logger.warning(f"FlareSolverr not available: {e}")
-            self.session_id = None
+        # ClearanceFetcher solves one challenge at a time and workers share the
+        # clearance it gets, so a second browser session would never be used
+        self.pool = FlareSolverrPool(self.flaresolverr_url, size=1)
+        self.pool.start()
+        atexit.register(self.pool.close)
+        self.fetcher = ClearanceFetcher(self.pool, self.base_url)
             
-        logger.info(f"Cineru.lk Initialized: {len(self.processed_urls)} URLs, {len(self.processed_filenames)} files tracked")
+        logger.info(f"Cineru.lk Initialized: {len(self.processed_urls)} URLs, {self.dedup.get_status()['names']} files tracked")
+        return True
         
     def fetch_page(self, url, retries=3):
-        """Fetch page using FlareSolverr"""
-        if not self.session_id:
+        """Fetch url; concurrent requests for the same canonical URL share one fetch"""
+        return self.single_flight.do(canonicalize_url(url), lambda: self._fetch_page(url, retries))
+
+    def _fetch_page(self, url, retries):
+        """Fetch page (or file) with curl_cffi, using FlareSolverr only to refresh clearance"""
+        if not self.pool or not self.pool.available:
             logger.error("No FlareSolverr session - cannot bypass Cloudflare")
             return None
             
-        for attempt in range(retries):
-            try:
-                payload = {
-                    'cmd': 'request.get',
-                    'url': url,
-                    'session': self.session_id,
-                    'maxTimeout': 60000
-                }
-                
-                response = requests.post(self.flaresolverr_url, json=payload, timeout=70)
-                data = response.json()
-                
-                if data.get('status') == 'ok':
-                    solution = data.get('solution', {})
-                    html = solution.get('response')
-                    status = solution.get('status')
-                    
-                    if status == 200 and html:
-                        # Create mock response object
-                        class MockResponse:
-                            def __init__(self, text, status_code):
-                                self.text = text
-                                self.status_code = status_code
-                                self.content = text.encode('utf-8')
-                        return MockResponse(html, status)
-                    elif status == 404:
-                        return None
-                        
-                logger.warning(f"FlareSolverr attempt {attempt + 1} failed for {url}")
-                time.sleep(3 * (attempt + 1))
-                
-            except Exception as e:
-                logger.error(f"FlareSolverr error (attempt {attempt + 1}): {e}")
-                if attempt < retries - 1:
-                    time.sleep(5)
-                    
+        response = self.fetcher.get(url, retries=retries)
+        if response is None:
+            logger.warning(f"Fetch failed for {url}")
+            return None
+        if response.status_code == 200:
+            return response
+        if response.status_code != 404:
+            logger.warning(f"Unexpected status {response.status_code} for {url}")
         return None
         
     def find_categories(self):
@@ -145,12 +130,17 @@ class CineruScraperV2:
             f"{self.base_url}/category/tv-series"
         ]
         
-    def crawl_category(self, category_url):
-        """Crawl all pages in a category"""
-        found_urls = []
-        page = 1
+    def crawl_category(self, category_url, queue=None, budget=None):
+        """Crawl all pages in a category; returns how many new subtitle URLs were queued"""
+        total_new = 0
+        # Resume a category that a previous run was part-way through
+        page = int(queue.get(f"page:{category_url}", 1)) if queue else 1
         
         while True:
+            reason = stop_reason(budget)
+            if reason:
+                logger.info(f"{reason} - {category_url} resumes at page {page} next run")
+                break
             if page == 1:
                 url = category_url
             else:
@@ -181,17 +171,21 @@ class CineruScraperV2:
                 logger.info(f"No links found on page {page}")
                 break
                 
-            new_count = 0
-            for link in set(subtitle_links):
-                if link not in self.processed_urls and link not in found_urls:
-                    found_urls.append(link)
-                    new_count += 1
+            new_links = [link for link in {canonicalize_url(link, self.base_url) for link in subtitle_links}
+                         if link not in self.processed_urls]
+            new_count = len(new_links)
+            if queue:
+                # Persist every page as it is crawled, so a restart picks up from the next one.
+                # The queue's unique index does the cross-page dedup and counts what was really new
+                new_count = queue.put_many(new_links)
+                queue.set(f"page:{category_url}", page + 1)
+            total_new += new_count
                     
             logger.info(f"Page {page}: Found {len(subtitle_links)} links ({new_count} new)")
             page += 1
             time.sleep(random.uniform(2, 4))
             
-        return found_urls
+        return total_new
         
     def normalize_filename(self, filename):
         """Normalize filename for duplicate detection"""
@@ -247,12 +241,30 @@ class CineruScraperV2:
             filename = f"{clean_title}{ext}"
             normalized = self.normalize_filename(filename)
             
-            with self.lock:
-                if normalized in self.processed_filenames:
-                    logger.info(f"Duplicate: {filename}")
-                    self.db.mark_processed(url, title)
-                    self.processed_urls.add(url)
-                    return True
+            content_sha256 = hashlib.sha256(content).hexdigest()
+            
+            reason, match = self.dedup.find_duplicate(filename, content_sha256, normalized=normalized)
+            if reason == 'content':
+                # Same bytes already in the channel - reuse that upload
+                logger.info(f"Duplicate content: {filename}")
+                self.db.save_file(
+                    url=url,
+                    title=title,
+                    filename=filename,
+                    normalized_filename=normalized,
+                    file_id=match,
+                    file_size=len(content),
+                    content_sha256=content_sha256
+                )
+                with self.lock:
+                    self.processed_urls.add(canonicalize_url(url))
+                return True
+            if reason:
+                logger.info(f"Duplicate ({reason}): {filename}")
+                self.db.mark_processed(url, title)
+                with self.lock:
+                    self.processed_urls.add(canonicalize_url(url))
+                return True
                     
             caption = f"<b>{title}</b>\n\nSource: Cineru.lk\nLink: {url}"
             file_info = self.telegram.upload_file(content, filename, caption)
@@ -265,10 +277,11 @@ class CineruScraperV2:
                         filename=filename,
                         normalized_filename=normalized,
                         file_id=file_info['file_id'],
-                        file_size=len(content)
+                        file_size=len(content),
+                        content_sha256=content_sha256
                     )
-                    self.processed_urls.add(url)
-                    self.processed_filenames.add(normalized)
+                    self.processed_urls.add(canonicalize_url(url))
+                self.dedup.record_upload(filename, file_info['file_id'], content_sha256, normalized=normalized, size=len(content))
                     
                 logger.info(f"✓ Uploaded: {filename}")
                 return True
@@ -279,66 +292,85 @@ class CineruScraperV2:
             logger.error(f"Error processing {url}: {e}", exc_info=True)
             return False
             
-    def scrape_all(self, worker_threads=2):
-        """Main scraping function"""
+    def scrape_all(self, worker_threads=2, budget=None):
+        """Main scraping function; budget (deadline.RunBudget) ends the run early, with a report"""
+        try:
+            self._scrape_all(worker_threads, budget)
+        finally:
+            # Always release the browser sessions, even after errors
+            if self.pool:
+                self.pool.close()
+            
+    def _scrape_all(self, worker_threads, budget=None):
         logger.info("=== STARTING CINERU.LK SCRAPE (FlareSolverr) ===")
         self.telegram.send_message("<b>Cineru.lk Scraper Started</b>\nUsing FlareSolver...")
         
+        queue = LocalQueue('cineru_v2')
+        resumed = queue.release_in_flight()
         categories = self.find_categories()
         
-        all_urls = []
+        # Discover into the local queue; categories finished by an interrupted run are skipped
         for category in categories:
-            urls = self.crawl_category(category)
-            all_urls.extend(urls)
-            logger.info(f"Category {category}: {len(urls)} new subtitles")
+            if queue.get(f"done:{category}"):
+                logger.info(f"Category {category}: already discovered, resuming")
+                continue
+            new_count = self.crawl_category(category, queue=queue, budget=budget)
+            if stop_reason(budget):
+                break
+            queue.set(f"done:{category}", 1)
+            logger.info(f"Category {category}: {new_count} new subtitles")
             
+        pending = queue.counts()['pending']
         logger.info(f"=== DISCOVERY COMPLETE ===")
-        logger.info(f"Total new URLs: {len(all_urls)}")
+        logger.info(f"Total new URLs: {pending} ({resumed} resumed mid-flight)")
         
-        if not all_urls:
+        if not pending and not stop_reason(budget):
             logger.info("No new subtitles found")
             self.telegram.send_message("No new subtitles found")
+            queue.reset()
+            queue.close()
             return
             
-        self.telegram.send_message(f"<b>Processing {len(all_urls)} cineru.lk subtitles...</b>")
-        
-        success_count = 0
-        failed_count = 0
+        self.telegram.send_message(f"<b>Processing {pending} cineru.lk subtitles...</b>")
         
-        with ThreadPoolExecutor(max_workers=worker_threads) as executor:
-            futures = {executor.submit(self.process_subtitle, url): url for url in all_urls}
-            
-            for i, future in enumerate(as_completed(futures), 1):
-                result = future.result()
-                if result:
-                    success_count += 1
-                else:
-                    failed_count += 1
-                    
-                if i % 25 == 0:
-                    logger.info(f"Progress: {i}/{len(all_urls)}")
-                    
-                time.sleep(random.uniform(3, 5))
+        # Workers pull from the queue as they free up, pausing between items
+        success_count, failed_count = process_queue(queue, self.process_subtitle, worker_threads,
+                                                    pace=(3, 5), name='cineru_v2', budget=budget)
                 
+        reason = stop_reason(budget)
+        if reason:
+            # Out of time or shutting down: keep the queue, the next run picks up where this one stopped
+            left = queue.counts()['pending']
+            self.telegram.send_message(
+                f"<b>{reason}</b>\n"
+                f"Processed: {success_count + failed_count}\n"
+                f"Success: {success_count}\n"
+                f"Failed: {failed_count}\n"
+                f"Left for next run: {left}"
+            )
+            queue.close()
+            logger.info(f"=== STOPPED: {reason} ({left} pending) ===")
+            return
         self.telegram.send_message(
             f"<b>Cineru.lk Complete!</b>\n"
-            f"Processed: {len(all_urls)}\n"
+            f"Processed: {success_count + failed_count}\n"
             f"Success: {success_count}\n"
             f"Failed: {failed_count}"
         )
+        queue.reset()
+        queue.close()
         logger.info("=== SCRAPING COMPLETE ===")
-        
-        # Cleanup FlareSolverr session
-        if self.session_id:
-            try:
-                requests.post(self.flaresolverr_url, json={
-                    'cmd': 'sessions.destroy',
-                    'session': self.session_id
-                })
-            except:
-                pass
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone cineru.lk scraper (FlareSolverr)")
+    parser.add_argument('--deadline', type=parse_duration,
+                        help="time budget for the run, e.g. 340m or 5h40m; new work stops early enough "
+                             "to finish what is in flight and report before it runs out")
+    args = parser.parse_args()
+    # SIGTERM/Ctrl-C finish the items in flight and report instead of killing them
+    get_shutdown().install()
     scraper = CineruScraperV2()
-    scraper.initialize()
-    scraper.scrape_all()
+    if not scraper.initialize():
+        sys.exit(1)
+    scraper.scrape_all(budget=RunBudget(args.deadline) if args.deadline else None)
@@ -0,0 +1,175 @@
+"""
+Persistent cookie jar with expiry tracking and background refresh
+Cookies survive restarts on disk, are refreshed through a pluggable solver before
+they expire, and workers pause on a shared condition while a refresh is running
+instead of burning retries on challenge pages.
+"""
+import json
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentCookieJar:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.cookies = {}  # name -> {'value', 'expires' (epoch, 0 = unknown/session), 'domain'}
+        self.user_agent = None
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.cookies = data.get('cookies', {})
+            self.user_agent = data.get('user_agent')
+            logger.info(f"Loaded {len(self.cookies)} cookies from {self.path}")
+        except Exception as e:
+            logger.warning(f"Could not read cookie jar {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {'cookies': self.cookies, 'user_agent': self.user_agent}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save cookie jar {self.path}: {e}")
+
+    def update(self, cookies, user_agent=None):
+        """
+        Accepts a {name: value} dict (no expiry known) or a list of browser-style cookie
+        dicts with name/value/expires/domain, as FlareSolverr returns them.
+        """
+        with self.lock:
+            if isinstance(cookies, dict):
+                for name, value in cookies.items():
+                    self.cookies[name] = {'value': value, 'expires': 0, 'domain': ''}
+            else:
+                for cookie in cookies or []:
+                    if not cookie.get('name'):
+                        continue
+                    expires = cookie.get('expires') or 0
+                    self.cookies[cookie['name']] = {
+                        'value': cookie.get('value', ''),
+                        'expires': expires if expires > 0 else 0,
+                        'domain': cookie.get('domain', '')
+                    }
+            if user_agent:
+                self.user_agent = user_agent
+            now = time.time()
+            self.cookies = {name: c for name, c in self.cookies.items() if not c['expires'] or c['expires'] > now}
+        self.save()
+
+    def as_dict(self):
+        """Cookies that have not expired yet"""
+        now = time.time()
+        with self.lock:
+            return {name: c['value'] for name, c in self.cookies.items() if not c['expires'] or c['expires'] > now}
+
+    def earliest_expiry(self):
+        """Epoch of the first upcoming expiry, or None when no live cookie carries one"""
+        now = time.time()
+        with self.lock:
+            expiries = [c['expires'] for c in self.cookies.values() if c['expires'] > now]
+        return min(expiries) if expiries else None
+
+
+class CookieRefresher:
+    """
+    Keeps a PersistentCookieJar fresh through solver() -> {'cookies': [...], 'user_agent': str} or None.
+    Workers call wait_ready() before each request; refresh() blocks them all until it finishes.
+    """
+    def __init__(self, jar, solver=None, on_refresh=None, refresh_margin=300, check_interval=60):
+        self.jar = jar
+        self.solver = solver
+        self.on_refresh = on_refresh
+        self.refresh_margin = refresh_margin
+        self.check_interval = check_interval
+        self.condition = threading.Condition()
+        self.refreshing = False
+        self.generation = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {'refreshes': 0, 'failed_refreshes': 0, 'waits': 0}
+
+    @property
+    def can_refresh(self):
+        return self.solver is not None
+
+    def wait_ready(self, timeout=180):
+        """Block while a refresh is in progress. Returns the cookie generation to pass to refresh()."""
+        with self.condition:
+            if self.refreshing:
+                self.stats['waits'] += 1
+                self.condition.wait_for(lambda: not self.refreshing, timeout=timeout)
+            return self.generation
+
+    def refresh(self, reason, seen_generation=None):
+        """
+        Get fresh cookies from the solver. If another thread already refreshed since
+        seen_generation, or is refreshing now, just wait for that result.
+        """
+        if not self.solver:
+            return False
+
+        with self.condition:
+            if self.refreshing:
+                self.condition.wait_for(lambda: not self.refreshing, timeout=180)
+                return True
+            if seen_generation is not None and seen_generation != self.generation:
+                return True
+            self.refreshing = True
+
+        success = False
+        try:
+            logger.info(f"Refreshing cookies ({reason})...")
+            result = self.solver()
+            if result and result.get('cookies'):
+                self.jar.update(result['cookies'], result.get('user_agent'))
+                if self.on_refresh:
+                    self.on_refresh(self.jar)
+                success = True
+        except Exception as e:
+            logger.error(f"Cookie refresh failed: {e}")
+        finally:
+            with self.condition:
+                self.refreshing = False
+                if success:
+                    self.generation += 1
+                    self.stats['refreshes'] += 1
+                else:
+                    self.stats['failed_refreshes'] += 1
+                self.condition.notify_all()
+
+        if success:
+            logger.info(f"Cookies refreshed: {len(self.jar.as_dict())} active")
+        else:
+            logger.warning("Cookie refresh failed - solver returned no cookies")
+        return success
+
+    def start(self):
+        if not self.solver or (self.thread and self.thread.is_alive()):
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _refresh_loop(self):
+        while not self.stop_event.wait(timeout=self.check_interval):
+            expiry = self.jar.earliest_expiry()
+            if expiry and expiry - time.time() < self.refresh_margin:
+                self.refresh(f"expires in {int(expiry - time.time())}s")
@@ -21,7 +21,7 @@ class D1Database:
             "Content-Type": "application/json"
         }
         
-    def execute(self, sql):
+    def execute(self, sql, log_error=True):
         """Execute SQL query"""
         if not self.enabled:
             return None
@@ -37,10 +37,12 @@ class D1Database:
             if data.get('success'):
                 return data.get('result', [])
             else:
-                logger.error(f"D1 error: {data.get('errors')}")
+                if log_error:
+                    logger.error(f"D1 error: {data.get('errors')}")
                 return None
         except Exception as e:
-            logger.error(f"D1 execute error: {e}")
+            if log_error:
+                logger.error(f"D1 execute error: {e}")
             return None
             
     def create_tables(self):
@@ -56,15 +58,24 @@ class D1Database:
                 normalized_filename TEXT,
                 file_id TEXT,
                 file_size INTEGER,
+                content_sha256 TEXT,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
         """)
         
+        # Migration for tables created before content hashing (fails harmlessly if present)
+        self.execute(f"ALTER TABLE {table_name} ADD COLUMN content_sha256 TEXT", log_error=False)
+        
         self.execute(f"""
             CREATE INDEX IF NOT EXISTS idx_{self.table_prefix}normalized 
             ON {table_name}(normalized_filename)
         """)
         
+        self.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{self.table_prefix}content_sha256 
+            ON {table_name}(content_sha256)
+        """)
+        
         logger.info(f"Database table '{table_name}' ready")
         logger.info("Database table 'discovered_urls' ready")
         
@@ -132,10 +143,32 @@ class D1Database:
         """Get all normalized filenames"""
         table_name = f"{self.table_prefix}subtitles"
         result = self.execute(f"SELECT normalized_filename FROM {table_name} WHERE normalized_filename IS NOT NULL")
+        if result is None:
+            return None  # query failed - not the same as no rows
         if result:
-            return set(row.get('normalized_filename') for row in result)
+            return set(row.get('normalized_filename') for row in result[0].get('results', []))
         return set()
         
+    def get_content_hashes(self):
+        """Map of content_sha256 -> Telegram file_id for every uploaded file"""
+        table_name = f"{self.table_prefix}subtitles"
+        result = self.execute(f"SELECT content_sha256, file_id FROM {table_name} WHERE content_sha256 IS NOT NULL")
+        if result is None:
+            return None  # query failed - not the same as no rows
+        if result:
+            return {row['content_sha256']: row.get('file_id') for row in result[0].get('results', []) if row.get('content_sha256')}
+        return {}
+        
+    def get_uploaded_files(self):
+        """filename, file_size and file_id of uploaded files (for the title and size indexes)"""
+        table_name = f"{self.table_prefix}subtitles"
+        result = self.execute(f"SELECT filename, file_size, file_id FROM {table_name} WHERE filename IS NOT NULL")
+        if result is None:
+            return None  # query failed - not the same as no rows
+        if result:
+            return [row for row in result[0].get('results', []) if row.get('filename')]
+        return []
+        
     def mark_processed(self, url, title):
         """Mark URL as processed (duplicate case)"""
         table_name = f"{self.table_prefix}subtitles"
@@ -144,18 +177,20 @@ class D1Database:
             VALUES ('{url.replace("'", "''")}', '{title.replace("'", "''")[:200]}')
         """)
         
-    def save_file(self, url, title, filename, normalized_filename, file_id, file_size):
+    def save_file(self, url, title, filename, normalized_filename, file_id, file_size, content_sha256=None):
         """Save uploaded file info"""
         table_name = f"{self.table_prefix}subtitles"
+        sha_value = f"'{content_sha256}'" if content_sha256 else "NULL"
         self.execute(f"""
             INSERT OR REPLACE INTO {table_name} 
-            (url, title, filename, normalized_filename, file_id, file_size)
+            (url, title, filename, normalized_filename, file_id, file_size, content_sha256)
             VALUES (
                 '{url.replace("'", "''")}',
                 '{title.replace("'", "''")[:200]}',
                 '{filename.replace("'", "''")}',
                 '{normalized_filename}',
                 '{file_id}',
-                {file_size}
+                {file_size},
+                {sha_value}
             )
         """)
@@ -0,0 +1,84 @@
+"""
+Time budget for a scraper run.
+A scheduled job that is killed at its timeout loses whatever was in flight and never
+reports. With a budget the run stops taking new work once the time left only covers the
+items already started - estimated from how long items have actually been taking - plus a
+reserve for releasing unfinished claims, flushing the queue and sending the final summary.
+"""
+import re
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Kept back at the end for releasing claims, closing the queue and the final report
+DEFAULT_RESERVE = 120
+# Per-item estimate until enough items have finished to measure one
+DEFAULT_ITEM_SECONDS = 60
+MIN_SAMPLES = 5
+
+
+def parse_duration(text):
+    """'340m', '5h40m', '90s' or plain minutes ('340') -> seconds"""
+    text = str(text).strip().lower()
+    if re.fullmatch(r'\d+(\.\d+)?', text):
+        return float(text) * 60
+    match = re.fullmatch(r'(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?', text)
+    if not text or not match:
+        raise ValueError(f"invalid duration: {text!r}")
+    hours, minutes, seconds = (int(group or 0) for group in match.groups())
+    return float(hours * 3600 + minutes * 60 + seconds)
+
+
+class RunBudget:
+    # Headline for reports when this budget ends a run (see shutdown.stop_reason)
+    stop_label = "Time Budget Reached"
+
+    def __init__(self, seconds, reserve=DEFAULT_RESERVE, window=100):
+        self.started = time.time()
+        self.deadline = self.started + seconds
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.durations = deque(maxlen=window)  # seconds per finished item
+        self.stopped_at = None
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.time())
+
+    def observe(self, seconds):
+        """Record how long one item took"""
+        with self.lock:
+            self.durations.append(seconds)
+
+    def item_estimate(self):
+        """How long an item started now will probably take (p95 of recent items)"""
+        with self.lock:
+            samples = sorted(self.durations)
+        if len(samples) < MIN_SAMPLES:
+            return max([DEFAULT_ITEM_SECONDS] + samples)
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def exhausted(self):
+        """True once there is only time left to finish what has already started; stays True"""
+        if self.stopped_at:
+            return True
+        remaining = self.remaining()
+        estimate = self.item_estimate()
+        if remaining > self.reserve + estimate:
+            return False
+        with self.lock:
+            if not self.stopped_at:
+                self.stopped_at = time.time()
+                logger.warning(f"Time budget: {remaining:.0f}s left and items take ~{estimate:.0f}s - taking no new work")
+        return True
+
+    def get_status(self):
+        return {
+            'elapsed': round(time.time() - self.started),
+            'remaining': round(self.remaining()),
+            'item_estimate': round(self.item_estimate(), 1),
+            'items_observed': len(self.durations),
+            'exhausted': bool(self.stopped_at)
+        }
@@ -0,0 +1,220 @@
+"""
+Process-wide duplicate detection shared by every scraper.
+Holds normalized-name, content-hash, title-key and SimHash indexes across all
+sources and tables, loaded once, so a title uploaded from one site is not
+uploaded again from another.
+"""
+import threading
+import logging
+from scraper_utils import TitleIndex, normalize_filename, extract_movie_info
+from subtitle_fingerprint import SimHashIndex, fingerprint_payload, decode_hashes, get_simhash_policy
+
+logger = logging.getLogger(__name__)
+
+
+class DedupService:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.simhash_policy = get_simhash_policy()
+        self.loaded_tables = set()
+        self.load_locks = {}  # table name -> lock held for the whole load
+        self._clear()
+
+    def _clear(self):
+        self.normalized_names = set()
+        self.content_hashes = {}  # content_sha256 -> Telegram file_id
+        self.simhash_index = SimHashIndex()
+        self.title_index = TitleIndex()
+        self.sized_titles = {}  # (extract_movie_info key, file_size) -> Telegram file_id, episodes only
+        self.stats = {'content': 0, 'filename': 0, 'size': 0, 'near_duplicate': 0}
+        self.flags = {'title': 0}  # logged for review, never skipped
+
+    def _load_lock(self, table_name):
+        """Held for a table's whole load, so a second caller waits for the index instead of using it half-built"""
+        with self.lock:
+            return self.load_locks.setdefault(table_name, threading.Lock())
+
+    def load_cloudflare_d1(self, d1):
+        """
+        Load telegram_files (all sources) through scraper_utils.CloudflareD1 - once per process.
+        False if a read failed; nothing is marked loaded then, so a later call tries again.
+        """
+        if not d1.enabled:
+            return True
+        with self._load_lock('telegram_files'):
+            with self.lock:
+                if 'telegram_files' in self.loaded_tables:
+                    return True
+
+            names = d1.get_all_normalized_filenames()
+            hashes = d1.get_all_content_hashes()
+            files = d1.get_all_uploaded_files()
+            simhashes = d1.get_all_simhashes() if self.simhash_policy != 'off' else []
+            if names is None or hashes is None or files is None or simhashes is None:
+                logger.error("Dedup index: could not read telegram_files, will retry on the next load")
+                return False
+
+            with self.lock:
+                self.normalized_names.update(names)
+                self.content_hashes.update(hashes)
+            self._index_files(files)
+            for file_id, encoded in simhashes:
+                for value in decode_hashes(encoded):
+                    self.simhash_index.add(value, file_id)
+            with self.lock:
+                self.loaded_tables.add('telegram_files')
+        logger.info(f"Dedup index loaded telegram_files: {len(names)} names, {len(hashes)} hashes")
+        return True
+
+    def load_d1_database(self, db):
+        """Load a d1_database.D1Database <prefix>subtitles table - once per process; False if a read failed"""
+        if not db.enabled:
+            return True
+        table_name = f"{db.table_prefix}subtitles"
+        with self._load_lock(table_name):
+            with self.lock:
+                if table_name in self.loaded_tables:
+                    return True
+
+            names = db.get_processed_filenames()
+            hashes = db.get_content_hashes()
+            files = db.get_uploaded_files()
+            if names is None or hashes is None or files is None:
+                logger.error(f"Dedup index: could not read {table_name}, will retry on the next load")
+                return False
+
+            with self.lock:
+                self.normalized_names.update(n for n in names if n)
+                self.content_hashes.update(hashes)
+            self._index_files(files)
+            with self.lock:
+                self.loaded_tables.add(table_name)
+        logger.info(f"Dedup index loaded {table_name}: {len(names)} names, {len(hashes)} hashes")
+        return True
+
+    def _index_files(self, files):
+        """Feed uploaded-file rows (filename, file_size, file_id) into the title and size indexes"""
+        self.title_index.add_many(row['filename'] for row in files)
+        with self.lock:
+            for row in files:
+                key = self._size_key(row['filename'], row.get('file_size'))
+                if key:
+                    self.sized_titles[key] = row.get('file_id')
+
+    @staticmethod
+    def _size_key(filename, size):
+        """
+        (title key, size) for the pre-download size check, or None.
+        Only episodes qualify: a movie key can't tell an extended cut from the theatrical one,
+        and a key without both season and episode lumps a whole season together.
+        """
+        if not size:
+            return None
+        key = extract_movie_info(filename)
+        if len(key[0]) < 3 or key[2] is None or key[3] is None:
+            return None
+        return key, size
+
+    def reset(self):
+        """Drop everything; the next load_* call re-reads the tables"""
+        with self.lock:
+            self.loaded_tables = set()
+            self._clear()
+
+    def find_duplicate(self, filename, content_sha256=None, normalized=None):
+        """
+        Return (reason, match) for an exact duplicate, or (None, None).
+        reason is 'content' (match = existing file_id) or 'filename' (match = normalized name).
+        Title-key matches are only logged: the key can't tell seasons, cuts or releases apart.
+        """
+        normalized = normalized or normalize_filename(filename)
+        with self.lock:
+            if content_sha256 and content_sha256 in self.content_hashes:
+                self.stats['content'] += 1
+                return 'content', self.content_hashes[content_sha256]
+            if normalized in self.normalized_names:
+                self.stats['filename'] += 1
+                return 'filename', normalized
+
+        title_matches = self.title_index.find_exact(filename)
+        if title_matches:
+            with self.lock:
+                self.flags['title'] += 1
+            logger.info(f"Possible Duplicate: {filename} has the same title key as {title_matches[0]}")
+
+        for (similar_key, distance) in self.title_index.find_similar(filename):
+            logger.info(f"Possible Duplicate: {filename} ~ {similar_key[0]} (edit distance {distance})")
+        return None, None
+
+    def find_duplicate_before_download(self, filename, size=None, normalized=None):
+        """
+        Name checks plus (title key, size) before the body is fetched, from a probe or
+        the response headers. reason 'size' means the same episode (full key, season and
+        episode both known) with the exact same byte count.
+        """
+        reason, match = self.find_duplicate(filename, normalized=normalized)
+        key = self._size_key(filename, size)
+        if reason or not key:
+            return reason, match
+        with self.lock:
+            file_id = self.sized_titles.get(key)
+            if file_id:
+                self.stats['size'] += 1
+                return 'size', file_id
+        return None, None
+
+    def check_near_duplicate(self, content):
+        """
+        SimHash every subtitle track in the payload.
+        Returns (track_hashes, match, skip) where match is (file_id, distance) of the closest
+        known track and skip is True when policy says not to upload.
+        """
+        if self.simhash_policy == 'off':
+            return [], None, False
+
+        track_hashes = fingerprint_payload(content)
+        matches = [self.simhash_index.find(h) for h in track_hashes]
+        if not any(matches):
+            return track_hashes, None, False
+
+        with self.lock:
+            self.stats['near_duplicate'] += 1
+        match = min((m[0] for m in matches if m), key=lambda item: item[1])
+        # Only skip when every track in the payload is already known
+        return track_hashes, match, self.simhash_policy == 'skip' and all(matches)
+
+    def record_upload(self, filename, file_id, content_sha256=None, track_hashes=(), normalized=None, size=None):
+        with self.lock:
+            self.normalized_names.add(normalized or normalize_filename(filename))
+            if content_sha256:
+                self.content_hashes[content_sha256] = file_id
+            key = self._size_key(filename, size)
+            if key:
+                self.sized_titles[key] = file_id
+        for value in track_hashes:
+            self.simhash_index.add(value, file_id)
+        self.title_index.add(filename)
+
+    def get_status(self):
+        with self.lock:
+            return {
+                'tables': sorted(self.loaded_tables),
+                'names': len(self.normalized_names),
+                'content_hashes': len(self.content_hashes),
+                'simhashes': self.simhash_index.size,
+                'skipped': dict(self.stats),
+                'flagged': dict(self.flags)
+            }
+
+
+_shared_service = None
+_shared_lock = threading.Lock()
+
+
+def get_dedup_service():
+    """The one DedupService for this process"""
+    global _shared_service
+    with _shared_lock:
+        if _shared_service is None:
+            _shared_service = DedupService()
+        return _shared_service
@@ -0,0 +1,277 @@
+"""
+Streaming file downloads and uploads with flat memory use.
+Bodies are read chunk by chunk into a SpooledTemporaryFile (RAM for small subtitles,
+disk for season packs), hashed on the fly, sniffed from the first chunk so HTML error
+pages are dropped early, and capped at a maximum size. MultipartStream sends such a file
+to Telegram without building the whole multipart body in memory.
+"""
+from curl_cffi import requests as curl_requests
+import hashlib
+import io
+import os
+import random
+import tempfile
+import time
+import uuid
+import logging
+from hedging import CONNECT_TIMEOUT, FETCH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Telegram bots can't upload more than 50 MB anyway
+MAX_DOWNLOAD_BYTES = int(os.getenv('MAX_DOWNLOAD_MB', '50')) * 1024 * 1024
+SPOOL_THRESHOLD = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+EXTENSIONS = {'zip': '.zip', 'rar': '.rar', '7z': '.7z'}
+
+
+class DownloadRejected(Exception):
+    """The response is not a file we want (HTML page, blocked, too large) - retrying won't help"""
+
+
+class DownloadSkipped(Exception):
+    """inspect() decided from the headers and first bytes that the body isn't needed"""
+    def __init__(self, result):
+        super().__init__(str(result))
+        self.result = result
+
+
+def sniff_kind(head):
+    """Classify a payload from its first bytes: zip, rar, 7z, html or text"""
+    if head.startswith(b'PK\x03\x04'):
+        return 'zip'
+    if head.startswith(b'Rar!'):
+        return 'rar'
+    if head.startswith(b'7z\xbc\xaf\x27\x1c'):
+        return '7z'
+    start = head[:1024].lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if start.startswith((b'<!doctype', b'<html', b'<head', b'<body')) or b'<html' in start:
+        return 'html'
+    return 'text'
+
+
+class Download:
+    """A downloaded body: spooled file plus size, SHA-256 and sniffed kind"""
+    def __init__(self, url=None):
+        self.url = url
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+        self.content_type = ''
+        self.size = 0
+        self.head = b''
+        self._hasher = hashlib.sha256()
+
+    @classmethod
+    def from_bytes(cls, content, url=None):
+        download = cls(url)
+        download.write(content)
+        return download
+
+    def write(self, chunk):
+        if len(self.head) < 1024:
+            self.head += chunk[:1024 - len(self.head)]
+        self.file.write(chunk)
+        self._hasher.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def kind(self):
+        return sniff_kind(self.head)
+
+    @property
+    def sha256(self):
+        return self._hasher.hexdigest()
+
+    def extension(self, default='.srt'):
+        return EXTENSIONS.get(self.kind, default)
+
+    def open(self):
+        """The spooled file, rewound - for readers that stream (zipfile, uploads, the file cache)"""
+        self.file.seek(0)
+        return self.file
+
+    def read(self):
+        """Whole body as bytes - only for small payloads such as HTML pages"""
+        return self.open().read()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_download(url, impersonation=None, headers=None, timeout=FETCH_TIMEOUT, retries=3,
+                    max_bytes=None, allow_html=False, inspect=None):
+    """
+    Stream url into a Download.
+    Returns None when the request keeps failing or the server says 404, and raises
+    DownloadRejected for HTML pages (unless allow_html) or bodies over max_bytes.
+    inspect(kind, content_length) runs once the first chunk is in; a truthy result
+    aborts the transfer with DownloadSkipped(result).
+    """
+    max_bytes = max_bytes or MAX_DOWNLOAD_BYTES
+    for attempt in range(retries):
+        target = impersonation.choose(url) if impersonation else "chrome120"
+        started = time.time()
+        try:
+            response = curl_requests.get(url, impersonate=target, timeout=timeout, headers=headers, stream=True)
+        except Exception as e:
+            if impersonation:
+                impersonation.record(url, target, 'error')
+            logger.warning(f"Download retry {attempt+1}/{retries} for {url}: {e}")
+            time.sleep(random.uniform(2, 5))
+            continue
+
+        download = None
+        try:
+            if response.status_code == 404:
+                return None
+            if response.status_code != 200:
+                if impersonation:
+                    impersonation.record(url, target, 'challenge' if response.status_code in (403, 503) else 'error')
+                continue
+
+            declared = int(response.headers.get('Content-Length') or 0)
+            if declared > max_bytes:
+                raise DownloadRejected(f"{declared} bytes declared, limit is {max_bytes}")
+
+            download = Download(url)
+            download.content_type = response.headers.get('Content-Type', '').lower()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if not chunk:
+                    continue
+                first = download.size == 0
+                download.write(chunk)
+                if first and download.kind == 'html' and not allow_html:
+                    if impersonation:
+                        impersonation.record(url, target, 'challenge')
+                    raise DownloadRejected("HTML page instead of a file")
+                if first and inspect and download.kind != 'html':
+                    result = inspect(download.kind, declared or None)
+                    if result:
+                        raise DownloadSkipped(result)
+                if download.size > max_bytes:
+                    raise DownloadRejected(f"more than {max_bytes} bytes")
+
+            if impersonation:
+                impersonation.record(url, target, 'success', time.time() - started)
+            result, download = download, None
+            return result
+        except (DownloadRejected, DownloadSkipped):
+            raise
+        except Exception as e:
+            if impersonation:
+                impersonation.record(url, target, 'error')
+            logger.warning(f"Download retry {attempt+1}/{retries} for {url}: {e}")
+            time.sleep(random.uniform(2, 5))
+        finally:
+            if download:
+                download.close()
+            response.close()
+    return None
+
+
+class ProbeResult:
+    """Status, type, total size and first bytes of a resource, from a Range request"""
+    def __init__(self, status_code, content_type, length, head):
+        self.status_code = status_code
+        self.content_type = content_type
+        self.length = length
+        self.head = head
+
+    @property
+    def kind(self):
+        return sniff_kind(self.head)
+
+    @property
+    def challenged(self):
+        if self.status_code in (403, 503):
+            return True
+        return self.kind == 'html' and (b'Just a moment' in self.head or b'Checking your browser' in self.head)
+
+
+def probe(url, session=None, impersonate="chrome120", headers=None, timeout=(CONNECT_TIMEOUT, 15), probe_bytes=512):
+    """
+    GET with Range: bytes=0-(probe_bytes-1) to learn Content-Type, total size and magic bytes
+    before committing to the body. Servers that ignore Range are cut off after the first chunk.
+    Returns a ProbeResult, or None if the request failed.
+    """
+    headers = dict(headers or {})
+    headers['Range'] = f'bytes=0-{probe_bytes - 1}'
+    requester = session or curl_requests
+    try:
+        response = requester.get(url, impersonate=impersonate, headers=headers, timeout=timeout, stream=True)
+    except Exception as e:
+        logger.debug(f"Probe failed for {url}: {e}")
+        return None
+
+    try:
+        head = b''
+        for chunk in response.iter_content(chunk_size=probe_bytes):
+            head += chunk
+            if len(head) >= probe_bytes:
+                break
+
+        length = None
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code == 206 and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            length = int(total) if total.isdigit() else None
+        elif response.status_code == 200 and response.headers.get('Content-Length'):
+            length = int(response.headers['Content-Length'])
+
+        return ProbeResult(response.status_code, response.headers.get('Content-Type', '').lower(),
+                           length, head[:probe_bytes])
+    except Exception as e:
+        logger.debug(f"Probe failed for {url}: {e}")
+        return None
+    finally:
+        response.close()
+
+
+class MultipartStream:
+    """
+    multipart/form-data body that reads the file part straight from a file object.
+    requests streams any body with read() and a known length instead of buffering it.
+    """
+    def __init__(self, fields, file_field, filename, fileobj, mime_type):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+        preamble = io.BytesIO()
+        for name, value in fields.items():
+            preamble.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode('utf-8'))
+            preamble.write(str(value).encode('utf-8'))
+            preamble.write(b'\r\n')
+        safe_name = filename.replace('"', '%22').replace('\r', '').replace('\n', '')
+        preamble.write(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{safe_name}"\r\n'
+            f'Content-Type: {mime_type}\r\n\r\n'.encode('utf-8')
+        )
+        epilogue = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+        fileobj.seek(0, os.SEEK_END)
+        file_size = fileobj.tell()
+        fileobj.seek(0)
+
+        self.parts = [io.BytesIO(preamble.getvalue()), fileobj, io.BytesIO(epilogue)]
+        self.len = len(preamble.getvalue()) + file_size + len(epilogue)
+
+    def __len__(self):
+        return self.len
+
+    def read(self, size=-1):
+        chunks = []
+        while self.parts and (size < 0 or size > 0):
+            data = self.parts[0].read(size)
+            if not data:
+                self.parts.pop(0)
+                continue
+            chunks.append(data)
+            if size > 0:
+                size -= len(data)
+        return b''.join(chunks)
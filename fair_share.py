@@ -0,0 +1,95 @@
+"""
+Process-wide rate limits shared fairly between scrapers.
+Every source posts to the same Telegram chat and writes to the same D1 database, so the
+limits that matter are per process, not per scraper. Callers name their tenant (the
+source); while several tenants are waiting, grants go round-robin between them, so a
+long backfill cannot starve a monitoring pass on another source.
+"""
+import os
+import threading
+import time
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FairShare:
+    def __init__(self, name, rate, burst=1.0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled = time.time()
+        self.cond = threading.Condition()
+        self.tickets = itertools.count()
+        self.waiting = []   # (tenant, ticket)
+        self.served = {}    # tenant -> grants, the fairness clock
+        self.stats = {'grants': 0, 'wait_seconds': 0.0}
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def _next(self):
+        """The waiter to serve next: least-served tenant, oldest ticket among equals"""
+        return min(self.waiting, key=lambda waiter: (self.served[waiter[0]], waiter[1]))
+
+    def acquire(self, tenant):
+        started = time.time()
+        with self.cond:
+            if not any(waiter[0] == tenant for waiter in self.waiting):
+                # A tenant returning from idle joins level with the busiest waiting one
+                # instead of cashing in the turns it didn't need
+                active = [self.served[waiter[0]] for waiter in self.waiting]
+                self.served[tenant] = max(self.served.get(tenant, 0), min(active) if active else 0)
+            me = (tenant, next(self.tickets))
+            self.waiting.append(me)
+            self.cond.notify_all()
+            while True:
+                if self._next() == me:
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.waiting.remove(me)
+                        self.served[tenant] += 1
+                        self.stats['grants'] += 1
+                        self.stats['wait_seconds'] += time.time() - started
+                        self.cond.notify_all()
+                        return
+                    self.cond.wait((1 - self.tokens) / self.rate)
+                else:
+                    self.cond.wait()
+
+    def get_status(self):
+        with self.cond:
+            waiting = {}
+            for tenant, _ in self.waiting:
+                waiting[tenant] = waiting.get(tenant, 0) + 1
+            return {
+                'rate_per_second': self.rate,
+                'grants': self.stats['grants'],
+                'wait_seconds': round(self.stats['wait_seconds'], 1),
+                'served': dict(self.served),
+                'waiting': waiting
+            }
+
+
+_shared_shares = {}
+_shared_lock = threading.Lock()
+
+
+def get_fair_share(name):
+    """Process-wide limiter per shared resource: 'telegram' or 'd1'"""
+    with _shared_lock:
+        if name not in _shared_shares:
+            if name == 'telegram':
+                # One chat: Telegram allows about one message a second
+                rate = float(os.getenv('TELEGRAM_RATE_LIMIT', '1'))
+                _shared_shares[name] = FairShare(name, rate)
+            else:
+                # The D1 REST API allows 1200 requests per 5 minutes per account
+                rate = float(os.getenv('D1_RATE_LIMIT', '4'))
+                _shared_shares[name] = FairShare(name, rate, burst=rate * 2)
+        return _shared_shares[name]
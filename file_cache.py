@@ -0,0 +1,257 @@
+"""
+Content-addressed on-disk cache of downloaded subtitle files.
+Objects are keyed by SHA-256, compressed with zstd (zlib if zstandard is not installed)
+and indexed by source URL so re-uploads never have to touch the origin again.
+"""
+import atexit
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import logging
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# The index is rewritten after this many changes, or this many seconds after the first unsaved one
+SAVE_EVERY = 50
+SAVE_INTERVAL = 30
+
+
+class FileCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.getenv('FILE_CACHE_DIR', '.file_cache')
+        if max_bytes is None:
+            max_bytes = int(os.getenv('FILE_CACHE_MAX_MB', '512')) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.codec = 'zstd' if zstandard else 'zlib'
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # one index writer at a time, outside self.lock
+        self.stats = {'hits': 0, 'misses': 0, 'corrupt': 0, 'evicted': 0}
+
+        # objects: sha256 -> {size, stored, codec, last_access}
+        # urls: source_url -> {sha256, title, filename}
+        self.objects = {}
+        self.urls = {}
+        self.total_stored = 0  # running sum of objects[*]['stored']
+        self.dirty = 0         # index changes since the last save
+        self.last_save = time.time()
+
+        try:
+            os.makedirs(os.path.join(self.cache_dir, 'objects'), exist_ok=True)
+            self.enabled = True
+        except OSError as e:
+            logger.warning(f"File cache disabled, cannot create {self.cache_dir}: {e}")
+            self.enabled = False
+            return
+
+        self._load_index()
+        self.total_stored = sum(entry.get('stored', 0) for entry in self.objects.values())
+        logger.info(f"File cache ready: {len(self.objects)} objects, {self.total_stored / 1048576:.1f} MB ({self.codec})")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.objects = data.get('objects', {})
+            self.urls = data.get('urls', {})
+        except Exception as e:
+            logger.warning(f"File cache index unreadable, starting empty: {e}")
+            self.objects = {}
+            self.urls = {}
+
+    def _save_index(self):
+        # NOTE: Call this without the lock - it only takes it to snapshot the index
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps({'objects': self.objects, 'urls': self.urls})
+                self.dirty = 0
+                self.last_save = time.time()
+            tmp_path = f"{self.index_path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.index_path)
+            except OSError as e:
+                logger.warning(f"Failed to save file cache index: {e}")
+
+    def _changed(self):
+        """Count an index change; True when a save is due (must be called inside the lock)"""
+        self.dirty += 1
+        return self.dirty >= SAVE_EVERY or time.time() - self.last_save > SAVE_INTERVAL
+
+    def _object_path(self, sha256):
+        return os.path.join(self.cache_dir, 'objects', sha256[:2], sha256)
+
+    def _compress_stream(self, source, dest, size):
+        if self.codec == 'zstd':
+            # size goes into the frame header so _decompress can do a one-shot decompress
+            zstandard.ZstdCompressor(level=10).copy_stream(source, dest, size=size)
+            return
+        compressor = zlib.compressobj(6)
+        while True:
+            chunk = source.read(65536)
+            if not chunk:
+                break
+            dest.write(compressor.compress(chunk))
+        dest.write(compressor.flush())
+
+    def _decompress(self, data, codec):
+        if codec == 'zstd':
+            if not zstandard:
+                raise ValueError("object stored with zstd but zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def _drop(self, sha256):
+        # NOTE: This must be called inside the lock!
+        entry = self.objects.pop(sha256, None)
+        if entry:
+            self.total_stored -= entry.get('stored', 0)
+        for url in [u for u, meta in self.urls.items() if meta.get('sha256') == sha256]:
+            del self.urls[url]
+        try:
+            os.remove(self._object_path(sha256))
+        except OSError:
+            pass
+
+    def _evict(self):
+        # NOTE: This must be called inside the lock!
+        if self.total_stored <= self.max_bytes:
+            return
+        # Least recently used objects go first
+        for sha256 in sorted(self.objects, key=lambda s: self.objects[s].get('last_access', 0)):
+            if self.total_stored <= self.max_bytes:
+                break
+            self._drop(sha256)
+            self.stats['evicted'] += 1
+
+    def put(self, content, source_url=None, title=None, filename=None):
+        """Store file bytes and (optionally) map the source URL to them. Returns the SHA-256."""
+        sha256 = hashlib.sha256(content).hexdigest()
+        return self.put_file(io.BytesIO(content), sha256, len(content), source_url, title, filename)
+
+    def put_file(self, fileobj, sha256, size, source_url=None, title=None, filename=None):
+        """Like put() for a file object whose hash is already known - compresses as a stream"""
+        if not self.enabled:
+            return sha256
+
+        with self.lock:
+            known = sha256 in self.objects
+        stored = None
+        path = self._object_path(sha256)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        if not known:
+            # Compress outside the lock so workers don't queue behind each other's disk writes
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fileobj.seek(0)
+                with open(tmp_path, 'wb') as f:
+                    self._compress_stream(fileobj, f, size)
+                stored = os.path.getsize(tmp_path)
+            except OSError as e:
+                logger.warning(f"File cache write failed for {sha256[:12]}: {e}")
+                return sha256
+
+        with self.lock:
+            if stored is not None:
+                if sha256 in self.objects:
+                    # Another worker stored the same file meanwhile
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, path)
+                    self.objects[sha256] = {'size': size, 'stored': stored, 'codec': self.codec}
+                    self.total_stored += stored
+            if sha256 not in self.objects:
+                # Evicted between the check and now
+                return sha256
+            self.objects[sha256]['last_access'] = time.time()
+            if source_url:
+                self.urls[source_url] = {'sha256': sha256, 'title': title or "", 'filename': filename or ""}
+            self._evict()
+            due = self._changed()
+        if due:
+            self._save_index()
+        return sha256
+
+    def get(self, sha256):
+        """Return the cached bytes for a hash, or None if missing or corrupt"""
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            entry = self.objects.get(sha256)
+            if not entry:
+                self.stats['misses'] += 1
+                return None
+            codec = entry.get('codec', 'zlib')
+        try:
+            with open(self._object_path(sha256), 'rb') as f:
+                content = self._decompress(f.read(), codec)
+        except Exception as e:
+            logger.warning(f"File cache read failed for {sha256[:12]}: {e}")
+            content = None
+
+        # Integrity check - never hand out bytes that don't match their address
+        if content is None or hashlib.sha256(content).hexdigest() != sha256:
+            logger.warning(f"File cache object {sha256[:12]} failed integrity check, dropping")
+            with self.lock:
+                self.stats['corrupt'] += 1
+                self._drop(sha256)
+                due = self._changed()
+            if due:
+                self._save_index()
+            return None
+
+        with self.lock:
+            if sha256 in self.objects:
+                self.objects[sha256]['last_access'] = time.time()
+            self.stats['hits'] += 1
+            # Access times only matter for eviction, don't rewrite the index on every read
+            due = time.time() - self.last_save > SAVE_INTERVAL
+        if due:
+            self._save_index()
+        return content
+
+    def get_by_url(self, source_url):
+        """Return (content, meta) for a previously downloaded source URL, or (None, None)"""
+        if not self.enabled:
+            return None, None
+        with self.lock:
+            meta = self.urls.get(source_url)
+        if not meta:
+            return None, None
+        content = self.get(meta['sha256'])
+        if content is None:
+            return None, None
+        return content, meta
+
+    def flush(self):
+        if not self.enabled:
+            return
+        self._save_index()
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_file_cache():
+    """Process-wide cache instance - every scraper must share one index file"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = FileCache()
+            # The index is written in batches - save the tail on the way out
+            atexit.register(_shared_cache.flush)
+        return _shared_cache
@@ -0,0 +1,277 @@
+"""
+FlareSolverr session pool and clearance-based bulk fetcher
+Keeps N browser sessions open so parallel workers don't queue behind one headless browser.
+Sessions are recycled after a number of requests or repeated challenge failures,
+health-checked in the background and always destroyed on shutdown.
+ClearanceFetcher solves the challenge once and does the bulk of the fetching with curl_cffi.
+"""
+import requests
+from curl_cffi import requests as curl_requests
+import os
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from impersonation import is_challenge_response
+from hedging import CONNECT_TIMEOUT, FETCH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class FlareSolverrPool:
+    def __init__(self, endpoint=None, size=None, max_requests=100, max_failures=3, health_interval=120, proxy=None):
+        self.endpoint = endpoint or os.getenv('FLARESOLVERR_URL', 'http://localhost:8191/v1')
+        self.size = size or int(os.getenv('FLARESOLVERR_SESSIONS', '2'))
+        self.max_requests = max_requests
+        self.max_failures = max_failures
+        self.health_interval = health_interval
+        self.proxy = proxy  # browser sessions go out through this proxy URL
+
+        self.idle = queue.Queue()
+        self.sessions = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.health_thread = None
+        self.stats = {'requests': 0, 'failures': 0, 'recycled': 0}
+
+    def _command(self, payload, timeout=30):
+        # A dead FlareSolverr fails on connect; only a running solve gets the long read timeout
+        response = requests.post(self.endpoint, json=payload, timeout=(CONNECT_TIMEOUT, timeout))
+        return response.json()
+
+    def _create_session(self):
+        """Returns a session id, or None if FlareSolverr is unreachable"""
+        try:
+            payload = {'cmd': 'sessions.create'}
+            if self.proxy:
+                payload['proxy'] = {'url': self.proxy}
+            data = self._command(payload)
+            if data.get('status') == 'ok':
+                return data['session']
+            logger.warning(f"FlareSolverr sessions.create failed: {data.get('message')}")
+        except Exception as e:
+            logger.warning(f"FlareSolverr not available: {e}")
+        return None
+
+    def _destroy_session(self, session_id):
+        if not session_id:
+            return
+        try:
+            self._command({'cmd': 'sessions.destroy', 'session': session_id})
+        except Exception as e:
+            logger.debug(f"FlareSolverr sessions.destroy failed for {session_id}: {e}")
+
+    def start(self):
+        """Create the sessions and start the health checker. Returns the number of live sessions."""
+        for _ in range(self.size):
+            slot = {'id': self._create_session(), 'requests': 0, 'failures': 0, 'created': time.time()}
+            with self.lock:
+                self.sessions.append(slot)
+            self.idle.put(slot)
+
+        live = sum(1 for slot in self.sessions if slot['id'])
+        logger.info(f"FlareSolverr pool started: {live}/{self.size} sessions")
+
+        self.stop_event.clear()
+        self.health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self.health_thread.start()
+        return live
+
+    @property
+    def available(self):
+        return any(slot['id'] for slot in self.sessions)
+
+    def _recycle(self, slot, reason):
+        logger.info(f"Recycling FlareSolverr session {slot['id']} ({reason})")
+        self._destroy_session(slot['id'])
+        slot['id'] = self._create_session()
+        slot['requests'] = 0
+        slot['failures'] = 0
+        slot['created'] = time.time()
+        with self.lock:
+            self.stats['recycled'] += 1
+
+    @contextmanager
+    def session(self, timeout=300):
+        """Check a session out for the duration of a request"""
+        slot = self.idle.get(timeout=timeout)
+        try:
+            if not slot['id'] and not self.stop_event.is_set():
+                # Creation failed earlier (service restarting?) - try again now
+                slot['id'] = self._create_session()
+            yield slot
+        finally:
+            if not self.stop_event.is_set():
+                if slot['requests'] >= self.max_requests:
+                    self._recycle(slot, f"{slot['requests']} requests")
+                elif slot['failures'] >= self.max_failures:
+                    self._recycle(slot, f"{slot['failures']} failures")
+            self.idle.put(slot)
+
+    def request_get(self, url, max_timeout=60000):
+        """
+        Run request.get through a pooled session.
+        Returns FlareSolverr's solution dict (check solution['status']),
+        or None if the request failed or the challenge was not solved.
+        """
+        with self.session() as slot:
+            if not slot['id']:
+                return None
+            slot['requests'] += 1
+            with self.lock:
+                self.stats['requests'] += 1
+            try:
+                data = self._command({
+                    'cmd': 'request.get',
+                    'url': url,
+                    'session': slot['id'],
+                    'maxTimeout': max_timeout
+                }, timeout=max_timeout / 1000 + 10)
+            except Exception as e:
+                logger.error(f"FlareSolverr error for {url}: {e}")
+                data = {}
+
+            solution = data.get('solution') if data.get('status') == 'ok' else None
+            html = (solution or {}).get('response') or ''
+            challenged = 'Just a moment' in html or 'Checking your browser' in html
+            if not solution or challenged or solution.get('status') in (403, 503):
+                slot['failures'] += 1
+                with self.lock:
+                    self.stats['failures'] += 1
+                return None
+
+            slot['failures'] = 0
+            return solution
+
+    def _health_loop(self):
+        while not self.stop_event.wait(timeout=self.health_interval):
+            try:
+                data = self._command({'cmd': 'sessions.list'})
+                alive = set(data.get('sessions', []))
+            except Exception as e:
+                logger.warning(f"FlareSolverr health check failed: {e}")
+                continue
+
+            # Only touch sessions nobody is using right now
+            checked = []
+            while True:
+                try:
+                    slot = self.idle.get_nowait()
+                except queue.Empty:
+                    break
+                if not slot['id'] or slot['id'] not in alive:
+                    self._recycle(slot, "missing from sessions.list")
+                checked.append(slot)
+            for slot in checked:
+                self.idle.put(slot)
+
+    def get_status(self):
+        with self.lock:
+            return {
+                'endpoint': self.endpoint,
+                'sessions': [{'id': s['id'], 'requests': s['requests'], 'failures': s['failures']} for s in self.sessions],
+                'idle': self.idle.qsize(),
+                **self.stats
+            }
+
+    def close(self):
+        """Destroy every session - safe to call more than once"""
+        self.stop_event.set()
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+        for slot in sessions:
+            self._destroy_session(slot['id'])
+            slot['id'] = None
+        if sessions:
+            logger.info(f"FlareSolverr pool closed ({len(sessions)} sessions destroyed)")
+
+
+class FlareSolverrSolver:
+    """
+    Cookie solver for cookie_jar.CookieRefresher - one FlareSolverr page load per refresh.
+    With proxy set the browser solves through that proxy, so the clearance matches its exit IP.
+    """
+    def __init__(self, solve_url, pool=None, proxy=None):
+        self.solve_url = solve_url
+        self.pool = pool
+        self.owns_pool = pool is None
+        self.proxy = proxy
+
+    def __call__(self):
+        if self.pool is None:
+            self.pool = FlareSolverrPool(size=1, proxy=self.proxy)
+            self.pool.start()
+        solution = self.pool.request_get(self.solve_url)
+        if not solution or solution.get('status') != 200:
+            return None
+        return {'cookies': solution.get('cookies', []), 'user_agent': solution.get('userAgent')}
+
+    def close(self):
+        if self.owns_pool and self.pool:
+            self.pool.close()
+            self.pool = None
+
+
+class ClearanceFetcher:
+    """
+    Solve the Cloudflare challenge once through FlareSolverr, take the cf_clearance cookies
+    and user agent from the solution, and run bulk fetches through an impersonating curl_cffi
+    session. Goes back to FlareSolverr only when a challenge page or 403 shows the clearance expired.
+    """
+    def __init__(self, pool, solve_url, impersonate="chrome120"):
+        self.pool = pool
+        self.solve_url = solve_url
+        self.impersonate = impersonate
+        self.session = None
+        self.generation = 0
+        self.solve_lock = threading.Lock()
+        self.stats = {'solves': 0, 'direct': 0, 'expired': 0}
+
+    def solve(self, seen_generation=None):
+        """Refresh clearance. Callers pass the generation they saw so concurrent expiries solve only once."""
+        with self.solve_lock:
+            if seen_generation is not None and seen_generation != self.generation:
+                return self.session is not None
+
+            solution = self.pool.request_get(self.solve_url)
+            if not solution or solution.get('status') != 200:
+                logger.warning("FlareSolverr could not solve the Cloudflare challenge")
+                return False
+
+            cookies = {c['name']: c['value'] for c in solution.get('cookies', []) if c.get('name')}
+            session = curl_requests.Session(impersonate=self.impersonate)
+            # cf_clearance is bound to the user agent that solved it
+            if solution.get('userAgent'):
+                session.headers.update({'User-Agent': solution['userAgent']})
+            session.cookies.update(cookies)
+
+            self.session = session
+            self.generation += 1
+            self.stats['solves'] += 1
+            logger.info(f"Cloudflare clearance obtained (cf_clearance: {'cf_clearance' in cookies}, {len(cookies)} cookies)")
+            return True
+
+    def get(self, url, timeout=FETCH_TIMEOUT, retries=3):
+        """Fetch url with the current clearance. Returns the curl_cffi response or None."""
+        for attempt in range(retries):
+            if self.session is None and not self.solve():
+                return None
+
+            generation, session = self.generation, self.session
+            try:
+                response = session.get(url, timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Fetch error (attempt {attempt + 1}) for {url}: {e}")
+                time.sleep(2 * (attempt + 1))
+                continue
+
+            if is_challenge_response(response):
+                self.stats['expired'] += 1
+                logger.info(f"Clearance expired ({response.status_code}) - solving again")
+                self.solve(seen_generation=generation)
+                continue
+
+            self.stats['direct'] += 1
+            return response
+        return None
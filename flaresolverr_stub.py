@@ -0,0 +1,127 @@
+"""
+Local stand-in for FlareSolverr (testing only)
+Speaks the same /v1 JSON API (sessions.create/list/destroy, request.get) but fetches
+pages with plain requests instead of a headless browser, so the session pool and
+cineru scrapers can be exercised without Docker or Cloudflare.
+
+Run standalone:   python flaresolverr_stub.py --port 8191
+Or in-process:    server, url = start_stub_server()
+"""
+import argparse
+import json
+import random
+import threading
+import uuid
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+logger = logging.getLogger(__name__)
+
+STUB_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+class StubState:
+    def __init__(self, challenge_rate=0.0):
+        self.sessions = set()
+        self.challenge_rate = challenge_rate
+        self.lock = threading.Lock()
+        self.stats = {'created': 0, 'destroyed': 0, 'requests': 0}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _reply(self, payload, code=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            data = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._reply({'status': 'error', 'message': 'invalid json'}, 400)
+
+        cmd = data.get('cmd')
+        state = self.state
+        if cmd == 'sessions.create':
+            session_id = data.get('session') or str(uuid.uuid4())
+            with state.lock:
+                state.sessions.add(session_id)
+                state.stats['created'] += 1
+            return self._reply({'status': 'ok', 'session': session_id})
+
+        if cmd == 'sessions.list':
+            with state.lock:
+                return self._reply({'status': 'ok', 'sessions': sorted(state.sessions)})
+
+        if cmd == 'sessions.destroy':
+            with state.lock:
+                found = data.get('session') in state.sessions
+                state.sessions.discard(data.get('session'))
+                state.stats['destroyed'] += 1
+            if not found:
+                return self._reply({'status': 'error', 'message': 'session not found'})
+            return self._reply({'status': 'ok'})
+
+        if cmd == 'request.get':
+            with state.lock:
+                state.stats['requests'] += 1
+                known = not data.get('session') or data['session'] in state.sessions
+            if not known:
+                return self._reply({'status': 'error', 'message': 'session not found'})
+
+            if random.random() < state.challenge_rate:
+                html, status, final_url = '<html><title>Just a moment...</title></html>', 403, data.get('url')
+            else:
+                try:
+                    response = requests.get(data.get('url'), headers={'User-Agent': STUB_USER_AGENT},
+                                            timeout=data.get('maxTimeout', 60000) / 1000)
+                    html, status, final_url = response.text, response.status_code, response.url
+                except Exception as e:
+                    return self._reply({'status': 'error', 'message': str(e)})
+
+            return self._reply({
+                'status': 'ok',
+                'message': '',
+                'solution': {
+                    'url': final_url,
+                    'status': status,
+                    'response': html,
+                    'headers': {},
+                    'cookies': [{'name': 'cf_clearance', 'value': uuid.uuid4().hex, 'domain': '', 'path': '/',
+                                 'expires': -1}],
+                    'userAgent': STUB_USER_AGENT
+                }
+            })
+
+        return self._reply({'status': 'error', 'message': f'unknown cmd {cmd}'}, 400)
+
+
+def start_stub_server(port=0, challenge_rate=0.0):
+    """Start the stub in a background thread; returns (server, endpoint_url)"""
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(challenge_rate)})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local FlareSolverr stand-in")
+    parser.add_argument('--port', type=int, default=8191)
+    parser.add_argument('--challenge-rate', type=float, default=0.0,
+                        help="fraction of requests answered with a fake Cloudflare challenge")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(args.challenge_rate)})
+    print(f"FlareSolverr stub listening on http://127.0.0.1:{args.port}/v1")
+    ThreadingHTTPServer(('127.0.0.1', args.port), handler).serve_forever()
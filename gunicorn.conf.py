@@ -1,5 +1,6 @@
 # Gunicorn configuration settings
 import multiprocessing
+import os
 
 # Force single worker to maintain shared in-memory state
 workers = 1
@@ -10,6 +11,25 @@ threads = 4
 # Initial timeout
 timeout = 120
 
+# On SIGTERM the worker stops taking scraper work and waits up to SHUTDOWN_DRAIN_SECONDS
+# for in-flight uploads (worker_exit below); the master must not kill it before that
+graceful_timeout = int(float(os.getenv('SHUTDOWN_DRAIN_SECONDS', '25'))) + 5
+
 # Log to stdout
 accesslog = '-'
 errorlog = '-'
+
+
+def post_worker_init(worker):
+    """Start app.py's monitoring scheduler in the worker that serves it (new_app has none)"""
+    import sys
+    app_module = sys.modules.get('app')
+    if app_module and hasattr(app_module, 'start_scheduler'):
+        app_module.start_scheduler()
+
+
+def worker_exit(server, worker):
+    """Let background scraper jobs finish their current items before the worker process goes"""
+    from shutdown import get_shutdown
+    get_shutdown().request("gunicorn worker exit")
+    get_shutdown().drain()
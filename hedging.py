@@ -0,0 +1,167 @@
+"""
+Tiered timeouts and hedged requests for page fetches.
+Connect and read timeouts are separate, so a dead origin fails in seconds instead of
+holding a worker for the whole read timeout. When a request is still running after the
+host's observed p95 latency, a duplicate is sent on a fresh connection and whichever
+answers first wins. Hedges only go out while the per-host rate limit has room.
+"""
+import os
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.getenv('FETCH_CONNECT_TIMEOUT', '10'))
+READ_TIMEOUT = float(os.getenv('FETCH_READ_TIMEOUT', '30'))
+# (connect, read) - understood by both curl_cffi and requests
+FETCH_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+# No hedging for a host until this many latencies are known
+MIN_SAMPLES = 20
+# Never hedge sooner than this, however fast the host usually is
+MIN_HEDGE_DELAY = 0.5
+
+
+class HostRateLimiter:
+    """Token bucket per host: rate requests per second with bursts up to burst"""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate * 2)
+        self.lock = threading.Lock()
+        self.buckets = {}  # host -> [tokens, last refill]
+
+    def _refill(self, host):
+        now = time.time()
+        bucket = self.buckets.setdefault(host, [self.burst, now])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        return bucket
+
+    def try_acquire(self, host):
+        with self.lock:
+            bucket = self._refill(host)
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+            return False
+
+    def acquire(self, host):
+        while True:
+            with self.lock:
+                bucket = self._refill(host)
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                    return
+                delay = (1 - bucket[0]) / self.rate
+            time.sleep(delay)
+
+
+class HedgedFetcher:
+    def __init__(self, enabled=None, rate_limit=None, window=200):
+        if enabled is None:
+            enabled = os.getenv('HEDGE_REQUESTS', '1') == '1'
+        self.enabled = enabled
+        self.limiter = HostRateLimiter(rate_limit or float(os.getenv('HOST_RATE_LIMIT', '5')))
+        self.window = window
+        self.lock = threading.Lock()
+        self.latencies = {}  # host -> recent request durations (seconds)
+        self.stats = {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'rate_limited': 0, 'throttled': 0}
+        # Losing requests can't be aborted, they finish in the background
+        self.executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='hedge')
+
+    def p95(self, host):
+        with self.lock:
+            samples = self.latencies.get(host)
+            if not samples or len(samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    @staticmethod
+    def _timed(send):
+        started = time.time()
+        return send(), time.time() - started
+
+    def _record(self, host, result):
+        # Only the response actually used is sampled; abandoned slow losers would drag p95
+        # up until nothing qualifies for a hedge any more
+        response, elapsed = result
+        with self.lock:
+            self.latencies.setdefault(host, deque(maxlen=self.window)).append(elapsed)
+            if getattr(response, 'status_code', None) == 429:
+                self.stats['throttled'] += 1
+        return response
+
+    def get(self, url, send):
+        """
+        Run send() (one HTTP request for url) under the host's rate limit, hedging it once it
+        outlives the host's p95. Returns the first response; raises only if every attempt failed.
+        """
+        host = urlparse(url).netloc
+        self.limiter.acquire(host)
+        with self.lock:
+            self.stats['requests'] += 1
+
+        delay = self.p95(host) if self.enabled else None
+        if delay is None:
+            return self._record(host, self._timed(send))
+
+        delay = max(delay, MIN_HEDGE_DELAY)
+        started = time.time()
+        primary = self.executor.submit(self._timed, send)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return self._record(host, primary.result())
+        if not self.limiter.try_acquire(host):
+            with self.lock:
+                self.stats['rate_limited'] += 1
+            return self._record(host, primary.result())
+
+        with self.lock:
+            self.stats['hedges'] += 1
+        logger.debug(f"Hedging {url} after {delay:.1f}s")
+        hedge_offset = time.time() - started
+        hedge = self.executor.submit(self._timed, send)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self.lock:
+                            self.stats['hedge_wins'] += 1
+                        # Sample what the caller waited - the hedge's own time alone would drag p95 down
+                        response, elapsed = future.result()
+                        return self._record(host, (response, hedge_offset + elapsed))
+                    return self._record(host, future.result())
+                error = future.exception()
+        raise error
+
+    def get_status(self):
+        hosts = {}
+        with self.lock:
+            status = dict(self.stats)
+            hosts_seen = list(self.latencies)
+        for host in hosts_seen:
+            p95 = self.p95(host)
+            hosts[host] = round(p95, 3) if p95 is not None else None
+        status['enabled'] = self.enabled
+        status['p95'] = hosts
+        return status
+
+
+_shared_hedger = None
+_shared_lock = threading.Lock()
+
+
+def get_hedged_fetcher():
+    """Process-wide fetcher - latency history and rate limits are per host, not per scraper"""
+    global _shared_hedger
+    with _shared_lock:
+        if _shared_hedger is None:
+            _shared_hedger = HedgedFetcher()
+        return _shared_hedger
@@ -0,0 +1,144 @@
+"""
+Adaptive curl_cffi impersonation profile selection.
+A per-host multi-armed bandit (Thompson sampling) over browser targets: profiles that
+Cloudflare currently challenges lose weight quickly, the rest are still explored now and
+then, and the statistics persist between runs.
+"""
+import atexit
+import json
+import os
+import random
+import threading
+import time
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGETS = ["chrome110", "chrome116", "chrome120", "chrome124"]
+
+# Older evidence is halved once a profile has this many attempts, so the bandit
+# notices when Cloudflare starts (or stops) blocking a fingerprint
+DECAY_AFTER = 200
+
+
+class ImpersonationSelector:
+    def __init__(self, targets=None, path=None):
+        self.targets = list(targets or DEFAULT_TARGETS)
+        self.path = path or os.getenv('IMPERSONATION_STATS', '.impersonation_stats.json')
+        self.lock = threading.Lock()
+        # host -> target -> {successes, challenges, errors, latency (EMA seconds)}
+        self.hosts = {}
+        self.last_save = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.hosts = json.load(f)
+            logger.info(f"Loaded impersonation stats for {len(self.hosts)} hosts")
+        except Exception as e:
+            logger.warning(f"Impersonation stats unreadable, starting fresh: {e}")
+            self.hosts = {}
+
+    def _save(self):
+        with self.lock:
+            data = json.dumps(self.hosts)
+            self.last_save = time.time()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save impersonation stats: {e}")
+
+    def flush(self):
+        if self.path:
+            self._save()
+
+    def _arm(self, host, target):
+        return self.hosts.setdefault(host, {}).setdefault(
+            target, {'successes': 0, 'challenges': 0, 'errors': 0, 'latency': 0.0})
+
+    def choose(self, url):
+        """Sample every target's success rate from its Beta posterior, discount slow ones, take the best"""
+        host = urlparse(url).netloc
+        best, best_score = None, -1
+        with self.lock:
+            for target in self.targets:
+                arm = self._arm(host, target)
+                failures = arm['challenges'] + arm['errors']
+                sample = random.betavariate(arm['successes'] + 1, failures + 1)
+                score = sample / (1 + arm['latency'] / 10)
+                if score > best_score:
+                    best, best_score = target, score
+        return best
+
+    def record(self, url, target, outcome, latency=0.0):
+        """outcome is 'success', 'challenge' or 'error'"""
+        host = urlparse(url).netloc
+        with self.lock:
+            arm = self._arm(host, target)
+            key = {'success': 'successes', 'challenge': 'challenges'}.get(outcome, 'errors')
+            arm[key] += 1
+            if outcome == 'success':
+                arm['latency'] = latency if not arm['latency'] else 0.8 * arm['latency'] + 0.2 * latency
+            if arm['successes'] + arm['challenges'] + arm['errors'] > DECAY_AFTER:
+                for k in ('successes', 'challenges', 'errors'):
+                    arm[k] //= 2
+            due = self.path and time.time() - self.last_save > 30
+        if due:
+            self._save()
+
+    def record_response(self, url, target, response, latency):
+        """Classify a curl_cffi response; 404s still prove the fingerprint got through"""
+        if is_challenge_response(response):
+            outcome = 'challenge'
+        elif response.status_code in (200, 404):
+            outcome = 'success'
+        else:
+            outcome = 'error'
+        self.record(url, target, outcome, latency)
+
+    def get_status(self):
+        with self.lock:
+            status = {}
+            for host, arms in self.hosts.items():
+                status[host] = {}
+                for target, arm in arms.items():
+                    attempts = arm['successes'] + arm['challenges'] + arm['errors']
+                    status[host][target] = {
+                        'attempts': attempts,
+                        'success_rate': round(arm['successes'] / attempts, 3) if attempts else None,
+                        'challenge_rate': round(arm['challenges'] / attempts, 3) if attempts else None,
+                        'latency': round(arm['latency'], 3)
+                    }
+            return status
+
+
+def is_challenge_response(response):
+    """True when Cloudflare answered with a challenge/block page instead of the resource"""
+    content_type = response.headers.get('Content-Type', '').lower()
+    if response.status_code in (403, 503) and 'text/html' in content_type:
+        return True
+    if response.status_code == 200 and 'text/html' in content_type:
+        head = response.content[:16384]
+        return b'Just a moment' in head or b'Checking your browser' in head
+    return False
+
+
+_shared_selector = None
+_shared_lock = threading.Lock()
+
+
+def get_impersonation_selector():
+    """Process-wide selector - all scrapers learn from each other's requests"""
+    global _shared_selector
+    with _shared_lock:
+        if _shared_selector is None:
+            _shared_selector = ImpersonationSelector()
+            atexit.register(_shared_selector.flush)
+        return _shared_selector
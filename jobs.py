@@ -0,0 +1,138 @@
+"""
+Background job manager for the web controller.
+Each source runs its own jobs on its own thread, so a long subz backfill no longer blocks
+zoom - or subz monitoring. A job is identified by an id, reports its own progress and can
+be cancelled: it doubles as the run's budget (exhausted() once cancelled), so cancelling
+stops a job the same cooperative way a deadline or SIGTERM does.
+"""
+import itertools
+import threading
+import time
+import logging
+from shutdown import get_shutdown
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    stop_label = "Cancelled"
+
+    def __init__(self, job_id, source, kind, progress=None):
+        self.id = job_id
+        self.source = source
+        self.kind = kind
+        self.progress = progress  # callable returning a dict, for /status
+        self.state = 'running'
+        self.created_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.thread = None
+
+    # Budget interface (see deadline.RunBudget / shutdown.stop_reason)
+    def exhausted(self):
+        return self.cancel_event.is_set()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.items += 1
+            self.busy_seconds += seconds
+
+    def is_running(self):
+        return self.state in ('running', 'cancelling')
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        status = {
+            'id': self.id,
+            'source': self.source,
+            'kind': self.kind,
+            'state': self.state,
+            'runtime': round(end - self.created_at),
+            'items': self.items,
+            'items_per_min': round(self.items * 60 / max(end - self.created_at, 1), 1),
+            'result': self.result,
+            'error': self.error
+        }
+        if self.progress and self.is_running():
+            try:
+                status['progress'] = self.progress()
+            except Exception as e:
+                status['progress'] = {'error': str(e)[:100]}
+        return status
+
+
+class JobManager:
+    def __init__(self, history=20):
+        self.lock = threading.Lock()
+        self.jobs = {}  # id -> Job, running ones plus the most recent finished
+        self.history = history
+        self.counter = itertools.count(1)
+
+    def start(self, source, kind, target, progress=None, conflicts=()):
+        """
+        Run target(job) on a new thread unless a job of the same kind - or of one of the
+        conflicting kinds - is already running for source. Returns (job, None) or (None, reason).
+        """
+        if get_shutdown().requested():
+            return None, 'Shutting down, not accepting new jobs'
+        with self.lock:
+            for job in self.jobs.values():
+                if job.source == source and (job.kind == kind or job.kind in conflicts) and job.is_running():
+                    return None, f'Job already running: {job.id}'
+            job = Job(f"{kind}-{source}-{next(self.counter)}", source, kind, progress)
+            self.jobs[job.id] = job
+            self._prune()
+        job.thread = threading.Thread(target=self._run, args=(job, target), name=job.id, daemon=True)
+        job.thread.start()
+        return job, None
+
+    def _run(self, job, target):
+        # Registered so a stopping worker waits for the job's in-flight items (see gunicorn.conf.py)
+        get_shutdown().started(job.id)
+        logger.info(f"Job {job.id} started")
+        try:
+            job.result = target(job)
+            job.state = 'cancelled' if job.exhausted() else 'finished'
+        except Exception as e:
+            logger.error(f"Background Job Error ({job.id}): {e}", exc_info=True)
+            job.error = str(e)[:200]
+            job.state = 'failed'
+        finally:
+            job.finished_at = time.time()
+            get_shutdown().finished(job.id)
+            logger.info(f"Job {job.id} {job.state} after {job.finished_at - job.created_at:.0f}s")
+
+    def cancel(self, job_id):
+        """Ask a running job to stop; it finishes its in-flight items first. False if unknown or not running"""
+        job = self.get(job_id)
+        if not job or not job.is_running():
+            return False
+        job.state = 'cancelling'
+        job.cancel_event.set()
+        logger.info(f"Job {job_id} cancelling")
+        return True
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def running(self):
+        with self.lock:
+            return [job for job in self.jobs.values() if job.is_running()]
+
+    def _prune(self):
+        # Keep every running job and the last few finished ones (called under the lock)
+        finished = sorted((job for job in self.jobs.values() if not job.is_running()),
+                          key=lambda job: job.created_at)
+        for job in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job.id]
+
+    def get_status(self):
+        with self.lock:
+            jobs = sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+        return [job.to_dict() for job in jobs]
@@ -0,0 +1,161 @@
+"""
+Durable local work queue for the standalone scrapers.
+Discovered URLs are written to a SQLite database (WAL mode) as each listing page is
+crawled, with a per-item status, so a crash or restart resumes from the last
+acknowledged item instead of re-running discovery. Workers claim a page of items at a
+time through WorkPool, so memory stays flat however long the backlog is.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+import logging
+from work_pool import WorkPool
+
+logger = logging.getLogger(__name__)
+
+# Runs a failed item is retried in before it is dead-lettered (same setting as the D1 queue)
+MAX_ATTEMPTS = int(os.getenv('MAX_ATTEMPTS', '6'))
+
+
+class LocalQueue:
+    def __init__(self, name, directory=None):
+        directory = directory or os.getenv('LOCAL_QUEUE_DIR', '.queues')
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.sqlite3")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                status TEXT DEFAULT 'pending',
+                updated_at REAL,
+                attempts INTEGER DEFAULT 0
+            )
+        """)
+        try:
+            # Queues created before attempts were counted
+            self.conn.execute("ALTER TABLE items ADD COLUMN attempts INTEGER DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_items_status ON items(status, id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def put_many(self, urls):
+        """Queue urls not seen before; returns how many were new"""
+        now = time.time()
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO items (url, status, updated_at) VALUES (?, 'pending', ?)",
+                [(url, now) for url in urls]
+            )
+            return self.conn.total_changes - before
+
+    def claim(self, limit):
+        """Oldest pending items, marked 'processing'"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, url FROM items WHERE status = 'pending' ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE items SET status = 'processing', updated_at = ? WHERE id = ?",
+                    [(time.time(), row[0]) for row in rows]
+                )
+        return [row[1] for row in rows]
+
+    def ack(self, url, success):
+        with self.lock:
+            if success:
+                self.conn.execute("UPDATE items SET status = 'done', updated_at = ? WHERE url = ?", (time.time(), url))
+            else:
+                self.conn.execute(
+                    "UPDATE items SET status = 'failed', attempts = COALESCE(attempts, 0) + 1, updated_at = ? WHERE url = ?",
+                    (time.time(), url)
+                )
+
+    def release_in_flight(self):
+        """Items a previous run claimed but never acknowledged go back to pending"""
+        with self.lock:
+            cursor = self.conn.execute("UPDATE items SET status = 'pending' WHERE status = 'processing'")
+            return cursor.rowcount
+
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall()
+        counts = {'pending': 0, 'processing': 0, 'done': 0, 'failed': 0, 'dead': 0}
+        counts.update(dict(rows))
+        return counts
+
+    def reset(self):
+        """
+        Forget a finished run, so the next one discovers from scratch. Failed items stay, back
+        in pending, so the next run retries them even if its discovery stops short of them; after
+        MAX_ATTEMPTS failed runs they are dead-lettered. Dead items are kept, so rediscovering
+        them doesn't queue them again.
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM items WHERE status NOT IN ('failed', 'dead')")
+            dead = self.conn.execute(
+                "UPDATE items SET status = 'dead', updated_at = ? WHERE status = 'failed' AND attempts >= ?",
+                (time.time(), MAX_ATTEMPTS)
+            ).rowcount
+            self.conn.execute("UPDATE items SET status = 'pending', updated_at = ? WHERE status = 'failed'", (time.time(),))
+            self.conn.execute("DELETE FROM meta")
+        if dead:
+            logger.info(f"{dead} items failed {MAX_ATTEMPTS} runs in a row and were dead-lettered")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def process_queue(queue, process, num_workers, pace=None, name="worker", budget=None):
+    """
+    Drain queue through process(url) on a WorkPool, acknowledging each item as it finishes.
+    pace=(min, max) sleeps that many seconds after each item in every worker.
+    With a budget (deadline.RunBudget) it stops starting items in time to finish the ones in
+    flight; items claimed but not started go back to pending for the next run.
+    Returns (succeeded, failed) for this run.
+    """
+    def work(url):
+        try:
+            result = process(url)
+        except Exception as e:
+            logger.error(f"Worker failed on {url}: {e}")
+            result = False
+        queue.ack(url, bool(result))
+        if pace:
+            time.sleep(random.uniform(*pace))
+        return result
+
+    def progress(result):
+        # Runs under the pool's lock
+        done = pool.stats['processed']
+        if done % 25 == 0:
+            logger.info(f"Progress: {done} processed ({pool.stats['succeeded']} success), {queue.counts()['pending']} pending")
+
+    pool = WorkPool(fetch_batch=queue.claim, process=work, num_workers=num_workers, batch_size=20,
+                    on_result=progress, name=name, budget=budget)
+    processed = pool.run()
+    leftovers = pool.take_leftovers()
+    if leftovers:
+        # Every worker has finished, so whatever is still 'processing' was never started
+        queue.release_in_flight()
+        logger.info(f"Stopped early: {len(leftovers)} claimed items returned to the queue")
+    succeeded = pool.get_status()['succeeded']
+    return succeeded, processed - succeeded
@@ -9,6 +9,9 @@ import sys
 from flask import Flask, jsonify
 from new_scraper import SubzScraper
 from cineru_scraper import CineruScraper
+from single_flight import get_single_flight
+from hedging import get_hedged_fetcher
+from shutdown import get_shutdown
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,23 +29,25 @@ current_site = None
 def run_scraper(site='subz'):
     """Background scraper job"""
     global is_running, scraper, current_site
+    get_shutdown().started(site)
     try:
         is_running = True
         current_site = site
         
         if site == 'subz':
             scraper = SubzScraper()
-            scraper.initialize()
-            scraper.scrape_all()
+            if scraper.initialize():
+                scraper.scrape_all()
         elif site == 'cineru':
             scraper = CineruScraper()
-            scraper.initialize()
-            scraper.scrape_all()
+            if scraper.initialize():
+                scraper.scrape_all()
     except Exception as e:
         logger.error(f"{site} scraper error: {e}", exc_info=True)
     finally:
         is_running = False
         current_site = None
+        get_shutdown().finished(site)
 
 @app.route('/')
 def health():
@@ -62,6 +67,8 @@ def start_scrape_subz():
     
     if is_running:
         return jsonify({'error': f'Scraper already running for {current_site}'}), 400
+    if get_shutdown().requested():
+        return jsonify({'error': 'Shutting down, not accepting new jobs'}), 503
         
     worker_thread = threading.Thread(target=run_scraper, args=('subz',), daemon=True)
     worker_thread.start()
@@ -75,6 +82,8 @@ def start_scrape_cineru():
     
     if is_running:
         return jsonify({'error': f'Scraper already running for {current_site}'}), 400
+    if get_shutdown().requested():
+        return jsonify({'error': 'Shutting down, not accepting new jobs'}), 503
         
     worker_thread = threading.Thread(target=run_scraper, args=('cineru',), daemon=True)
     worker_thread.start()
@@ -89,7 +98,11 @@ def status():
         'current_site': current_site,
         'thread_alive': worker_thread.is_alive() if worker_thread else False,
         'processed_urls': len(scraper.processed_urls) if scraper else 0,
-        'processed_files': len(scraper.processed_filenames) if scraper else 0
+        'processed_files': scraper.dedup.get_status()['names'] if scraper else 0,
+        'proxies': scraper.proxy_pool.get_status() if hasattr(scraper, 'proxy_pool') else [],
+        'coalescing': get_single_flight().get_status(),
+        'hedging': get_hedged_fetcher().get_status(),
+        'shutdown': get_shutdown().get_status()
     })
 
 if __name__ == '__main__':
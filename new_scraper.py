@@ -6,15 +6,24 @@ from curl_cffi import requests as curl_requests
 from bs4 import BeautifulSoup
 import os
 import time
+import hashlib
 import logging
 import random
 import re
 import threading
 import sys
+import argparse
 from urllib.parse import urljoin
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from d1_database import D1Database
 from telegram_bot import TelegramBot
+from dedup_service import get_dedup_service
+from impersonation import get_impersonation_selector
+from scraper_utils import canonicalize_url
+from single_flight import get_single_flight
+from local_queue import LocalQueue, process_queue
+from hedging import get_hedged_fetcher, FETCH_TIMEOUT
+from deadline import RunBudget, parse_duration
+from shutdown import get_shutdown, stop_reason
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,9 +33,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class SubzScraper:
-    def __init__(self):
+    def __init__(self, dedup=None):
         self.base_url = 'https://subz.lk'
-        self.browser_versions = ["chrome110", "chrome116", "chrome120", "chrome124"]
+        self.impersonation = get_impersonation_selector()
         
         # Initialize components
         self.db = D1Database(
@@ -40,42 +49,61 @@ class SubzScraper:
         )
         
         # State
-        self.processed_urls = set()
-        self.processed_filenames = set()
+        self.processed_urls = set()  # canonical URLs
+        self.dedup = dedup or get_dedup_service()  # shared with every other scraper
         self.lock = threading.Lock()
+        self.single_flight = get_single_flight()
+        self.hedger = get_hedged_fetcher()
         
     def initialize(self):
         """Load existing data from database"""
         if self.db.enabled:
             self.db.create_tables()
-            self.processed_urls = self.db.get_processed_urls()
-            self.processed_filenames = self.db.get_processed_filenames()
-        logger.info(f"Initialized: {len(self.processed_urls)} URLs, {len(self.processed_filenames)} files tracked")
+            self.processed_urls = {canonicalize_url(u) for u in self.db.get_processed_urls()}
+            if not self.dedup.load_d1_database(self.db):
+                # Running against a partial duplicate index would upload duplicates
+                logger.error("Initialization failed: duplicate index not loaded")
+                return False
+        logger.info(f"Initialized: {len(self.processed_urls)} URLs, {self.dedup.get_status()['names']} files tracked")
+        return True
         
     def fetch_page(self, url, retries=5):
+        """Fetch url; concurrent requests for the same canonical URL share one fetch"""
+        return self.single_flight.do(canonicalize_url(url), lambda: self._fetch_page(url, retries))
+
+    def _fetch_page(self, url, retries):
         """Fetch a page with retries"""
         for attempt in range(retries):
+            target = self.impersonation.choose(url)
+            started = time.time()
             try:
-                response = curl_requests.get(
+                response = self.hedger.get(url, lambda: curl_requests.get(
                     url,
-                    impersonate=random.choice(self.browser_versions),
-                    timeout=30
-                )
+                    impersonate=target,
+                    timeout=FETCH_TIMEOUT
+                ))
+                self.impersonation.record_response(url, target, response, time.time() - started)
                 if response.status_code == 200:
                     return response
                 if response.status_code == 404:
                     return None
             except Exception as e:
+                self.impersonation.record(url, target, 'error')
                 if attempt < retries - 1:
                     time.sleep(2 ** attempt)
         return None
         
-    def crawl_category(self, category_path):
-        """Crawl all pages in a category and return list of subtitle URLs"""
-        found_urls = []
-        page = 1
+    def crawl_category(self, category_path, queue=None, budget=None):
+        """Crawl all pages in a category; returns how many new subtitle URLs were queued"""
+        total_new = 0
+        # Resume a category that a previous run was part-way through
+        page = int(queue.get(f"page:{category_path}", 1)) if queue else 1
         
         while True:
+            reason = stop_reason(budget)
+            if reason:
+                logger.info(f"{reason} - {category_path} resumes at page {page} next run")
+                break
             # Build page URL
             if page == 1:
                 url = f"{self.base_url}{category_path}"
@@ -102,17 +130,21 @@ class SubzScraper:
                 break
                 
             # Add new URLs
-            new_count = 0
-            for link in set(subtitle_links):
-                if link not in self.processed_urls and link not in found_urls:
-                    found_urls.append(link)
-                    new_count += 1
+            new_links = [link for link in {canonicalize_url(link, self.base_url) for link in subtitle_links}
+                         if link not in self.processed_urls]
+            new_count = len(new_links)
+            if queue:
+                # Persist every page as it is crawled, so a restart picks up from the next one.
+                # The queue's unique index does the cross-page dedup and counts what was really new
+                new_count = queue.put_many(new_links)
+                queue.set(f"page:{category_path}", page + 1)
+            total_new += new_count
                     
             logger.info(f"Page {page}: Found {len(subtitle_links)} links ({new_count} new)")
             page += 1
             time.sleep(random.uniform(0.5, 1.5))
             
-        return found_urls
+        return total_new
         
     def normalize_filename(self, filename):
         """Normalize filename for duplicate detection"""
@@ -174,12 +206,30 @@ class SubzScraper:
             normalized = self.normalize_filename(filename)
             
             # Check for duplicates
-            with self.lock:
-                if normalized in self.processed_filenames:
-                    logger.info(f"Duplicate file skipped: {filename}")
-                    self.db.mark_processed(url, title)
-                    self.processed_urls.add(url)
-                    return True
+            content_sha256 = hashlib.sha256(content).hexdigest()
+            
+            reason, match = self.dedup.find_duplicate(filename, content_sha256, normalized=normalized)
+            if reason == 'content':
+                # Same bytes already in the channel - reuse that upload
+                logger.info(f"Duplicate content: {filename}")
+                self.db.save_file(
+                    url=url,
+                    title=title,
+                    filename=filename,
+                    normalized_filename=normalized,
+                    file_id=match,
+                    file_size=len(content),
+                    content_sha256=content_sha256
+                )
+                with self.lock:
+                    self.processed_urls.add(canonicalize_url(url))
+                return True
+            if reason:
+                logger.info(f"Duplicate file skipped ({reason}): {filename}")
+                self.db.mark_processed(url, title)
+                with self.lock:
+                    self.processed_urls.add(canonicalize_url(url))
+                return True
                     
             # Upload to Telegram
             caption = f"<b>{title}</b>\n\nSource: Subz.lk\nLink: {url}"
@@ -194,10 +244,11 @@ class SubzScraper:
                         filename=filename,
                         normalized_filename=normalized,
                         file_id=file_info['file_id'],
-                        file_size=len(content)
+                        file_size=len(content),
+                        content_sha256=content_sha256
                     )
-                    self.processed_urls.add(url)
-                    self.processed_filenames.add(normalized)
+                    self.processed_urls.add(canonicalize_url(url))
+                self.dedup.record_upload(filename, file_info['file_id'], content_sha256, normalized=normalized, size=len(content))
                     
                 logger.info(f"✓ Uploaded: {filename}")
                 return True
@@ -209,60 +260,80 @@ class SubzScraper:
             logger.error(f"Error processing {url}: {e}", exc_info=True)
             return False
             
-    def scrape_all(self, worker_threads=3):
-        """Main scraping function"""
+    def scrape_all(self, worker_threads=3, budget=None):
+        """
+        Main scraping function - resumes an interrupted run from its local queue.
+        budget (deadline.RunBudget) ends the run early, with a report, instead of being killed mid-item.
+        """
         categories = ['/category/movies/', '/category/tv-shows/']
+        queue = LocalQueue('subz')
+        resumed = queue.release_in_flight()
         
         logger.info("=== STARTING FULL SCRAPE ===")
         self.telegram.send_message("<b>Scraper Started</b>\nDiscovering all subtitles...")
         
-        # Phase 1: Discover all URLs
-        all_urls = []
+        # Phase 1: Discover all URLs into the local queue (categories finished by an earlier run are skipped)
         for category in categories:
-            urls = self.crawl_category(category)
-            all_urls.extend(urls)
-            logger.info(f"Category {category}: {len(urls)} new subtitles found")
+            if queue.get(f"done:{category}"):
+                logger.info(f"Category {category}: already discovered, resuming")
+                continue
+            new_count = self.crawl_category(category, queue=queue, budget=budget)
+            if stop_reason(budget):
+                break
+            queue.set(f"done:{category}", 1)
+            logger.info(f"Category {category}: {new_count} new subtitles found")
             
+        pending = queue.counts()['pending']
         logger.info(f"\n=== DISCOVERY COMPLETE ===")
-        logger.info(f"Total new URLs to process: {len(all_urls)}")
+        logger.info(f"Total new URLs to process: {pending} ({resumed} resumed mid-flight)")
         
-        if not all_urls:
+        if not pending and not stop_reason(budget):
             logger.info("No new subtitles found")
             self.telegram.send_message("No new subtitles to process")
+            queue.reset()
+            queue.close()
             return
             
-        self.telegram.send_message(f"<b>Processing {len(all_urls)} subtitles...</b>")
-        
-        # Phase 2: Process all URLs
-        success_count = 0
-        failed_count = 0
+        self.telegram.send_message(f"<b>Processing {pending} subtitles...</b>")
         
-        with ThreadPoolExecutor(max_workers=worker_threads) as executor:
-            futures = {executor.submit(self.process_subtitle, url): url for url in all_urls}
-            
-            for i, future in enumerate(as_completed(futures), 1):
-                result = future.result()
-                if result:
-                    success_count += 1
-                else:
-                    failed_count += 1
-                    
-                # Progress update every 50 items
-                if i % 50 == 0:
-                    logger.info(f"Progress: {i}/{len(all_urls)} ({success_count} success, {failed_count} failed)")
-                    
-                time.sleep(1)  # Rate limiting
+        # Phase 2: Workers pull from the queue as fast as they finish - 1s pause per item for rate limiting
+        success_count, failed_count = process_queue(queue, self.process_subtitle, worker_threads,
+                                                    pace=(1, 1), name='subz', budget=budget)
                 
         # Final report
+        reason = stop_reason(budget)
+        if reason:
+            # Out of time or shutting down: keep the queue, the next run picks up where this one stopped
+            left = queue.counts()['pending']
+            self.telegram.send_message(
+                f"<b>{reason}</b>\n"
+                f"Processed: {success_count + failed_count}\n"
+                f"Success: {success_count}\n"
+                f"Failed: {failed_count}\n"
+                f"Left for next run: {left}"
+            )
+            queue.close()
+            logger.info(f"=== STOPPED: {reason} ({left} pending) ===")
+            return
         self.telegram.send_message(
             f"<b>Scraping Complete!</b>\n"
-            f"Processed: {len(all_urls)}\n"
+            f"Processed: {success_count + failed_count}\n"
             f"Success: {success_count}\n"
             f"Failed: {failed_count}"
         )
+        queue.reset()
+        queue.close()
         logger.info(f"=== SCRAPING COMPLETE ===")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone subz.lk scraper")
+    parser.add_argument('--deadline', type=parse_duration,
+                        help="time budget for the run, e.g. 340m or 5h40m; new work stops early enough "
+                             "to finish what is in flight and report before it runs out")
+    args = parser.parse_args()
+    # SIGTERM/Ctrl-C finish the items in flight and report instead of killing them
+    get_shutdown().install()
     scraper = SubzScraper()
-    scraper.initialize()
-    scraper.scrape_all()
+    if not scraper.initialize():
+        sys.exit(1)
+    scraper.scrape_all(budget=RunBudget(args.deadline) if args.deadline else None)
@@ -0,0 +1,194 @@
+"""
+Proxy pool with health scoring for curl_cffi scrapers
+Every proxy gets its own impersonating session and its own persistent cookie jar -
+Cloudflare clearance is bound to the exit IP that solved it, so it is solved through the
+proxy that uses it. Health is a rolling success rate and latency; requests go to healthy
+proxies weighted by score, dead proxies are ejected and re-probed in the background until
+they answer again.
+"""
+from curl_cffi import requests
+import os
+import hashlib
+import time
+import random
+import logging
+import threading
+from collections import deque
+from cookie_jar import PersistentCookieJar, CookieRefresher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROXY = 'socks5://127.0.0.1:10808'
+
+
+def get_proxy_urls():
+    """CINERU_PROXIES is a comma-separated list; defaults to the local SOCKS5 proxy"""
+    value = os.getenv('CINERU_PROXIES', DEFAULT_PROXY)
+    return [p.strip() for p in value.split(',') if p.strip()]
+
+
+class ProxyEntry:
+    def __init__(self, url, impersonate="chrome120", window=20):
+        self.url = url
+        self.session = requests.Session(impersonate=impersonate, proxies={"http": url, "https": url})
+        self.results = deque(maxlen=window)  # (success, latency seconds)
+        self.consecutive_failures = 0
+        self.alive = True
+        self.ejected_at = None
+        self.requests = 0
+        self.cookie_jar = None        # see ProxyPool.attach_cookie_jars
+        self.cookie_refresher = None
+
+    @property
+    def success_rate(self):
+        if not self.results:
+            return 1.0
+        return sum(1 for ok, _ in self.results if ok) / len(self.results)
+
+    @property
+    def latency(self):
+        latencies = [t for ok, t in self.results if ok]
+        return sum(latencies) / len(latencies) if latencies else 0.0
+
+    @property
+    def score(self):
+        # Success rate dominates; latency breaks ties between equally reliable proxies
+        return self.success_rate / (1 + self.latency / 5)
+
+    def reset(self):
+        self.results.clear()
+        self.consecutive_failures = 0
+        self.alive = True
+        self.ejected_at = None
+
+
+class ProxyPool:
+    def __init__(self, proxy_urls=None, impersonate="chrome120", probe_url=None,
+                 max_consecutive_failures=3, min_success_rate=0.3, probe_interval=60, is_blocked=None):
+        urls = proxy_urls or get_proxy_urls()
+        self.proxies = [ProxyEntry(url, impersonate) for url in urls]
+        self.probe_url = probe_url
+        self.max_consecutive_failures = max_consecutive_failures
+        self.min_success_rate = min_success_rate
+        self.probe_interval = probe_interval
+        self.is_blocked = is_blocked or (lambda response: False)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.probe_thread = None
+        logger.info(f"Proxy pool: {len(self.proxies)} proxies")
+
+    def update_headers(self, headers):
+        for proxy in self.proxies:
+            proxy.session.headers.update(headers)
+
+    def attach_cookie_jars(self, path, solver_factory=None, seed=None):
+        """
+        Give every proxy its own PersistentCookieJar (path, or path with a per-proxy suffix when
+        there are several) and CookieRefresher. solver_factory(proxy_url) must solve through that
+        proxy. seed ({name: value}, copied from a browser on one connection) only goes into the
+        first proxy's jar, and only while it is empty.
+        """
+        root, ext = os.path.splitext(path)
+        for index, proxy in enumerate(self.proxies):
+            jar_path = path
+            if len(self.proxies) > 1:
+                jar_path = f"{root}.{hashlib.sha1(proxy.url.encode()).hexdigest()[:8]}{ext}"
+            proxy.cookie_jar = PersistentCookieJar(jar_path)
+            if seed and index == 0 and not proxy.cookie_jar.as_dict():
+                proxy.cookie_jar.update(seed)
+                logger.info(f"Seeded {proxy.url} with {len(seed)} cookies")
+            solver = solver_factory(proxy.url) if solver_factory else None
+            proxy.cookie_refresher = CookieRefresher(proxy.cookie_jar, solver,
+                                                     on_refresh=lambda jar, proxy=proxy: self._apply_cookies(proxy, jar))
+            self._apply_cookies(proxy, proxy.cookie_jar)
+
+    @staticmethod
+    def _apply_cookies(proxy, jar):
+        """Push the jar's live cookies (and the user agent they were issued to) into the proxy's session"""
+        proxy.session.cookies.update(jar.as_dict())
+        if jar.user_agent:
+            proxy.session.headers.update({'User-Agent': jar.user_agent})
+
+    def has_cookies(self):
+        return any(p.cookie_jar and p.cookie_jar.as_dict() for p in self.proxies)
+
+    def healthy(self, response):
+        """
+        The one health policy for both scoring and re-probing: a proxy is working when it gets a
+        real answer - no 5xx and no block. Callers refresh the proxy's own clearance before judging
+        a challenge, so a challenge that is left means the proxy's exit IP itself is blocked.
+        """
+        return response.status_code < 500 and not self.is_blocked(response)
+
+    def choose(self):
+        """Pick a live proxy weighted by score. With every proxy ejected, use the one ejected longest ago."""
+        with self.lock:
+            alive = [p for p in self.proxies if p.alive]
+            if not alive:
+                return min(self.proxies, key=lambda p: p.ejected_at or 0)
+            weights = [max(p.score, 0.01) for p in alive]
+            proxy = random.choices(alive, weights=weights)[0]
+            proxy.requests += 1
+            return proxy
+
+    def record(self, proxy, success, latency=0.0):
+        with self.lock:
+            proxy.results.append((success, latency))
+            if success:
+                proxy.consecutive_failures = 0
+                return
+            proxy.consecutive_failures += 1
+            unhealthy = (proxy.consecutive_failures >= self.max_consecutive_failures or
+                         (len(proxy.results) >= 5 and proxy.success_rate < self.min_success_rate))
+            if proxy.alive and unhealthy and len(self.proxies) > 1:
+                proxy.alive = False
+                proxy.ejected_at = time.time()
+                logger.warning(f"Ejected proxy {proxy.url} (success rate {proxy.success_rate:.0%}, "
+                               f"{proxy.consecutive_failures} failures in a row)")
+
+    def start(self):
+        for proxy in self.proxies:
+            if proxy.cookie_refresher:
+                proxy.cookie_refresher.start()
+        if not self.probe_url or len(self.proxies) < 2 or (self.probe_thread and self.probe_thread.is_alive()):
+            return
+        self.stop_event.clear()
+        self.probe_thread = threading.Thread(target=self._probe_loop, daemon=True)
+        self.probe_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for proxy in self.proxies:
+            refresher = proxy.cookie_refresher
+            if refresher:
+                refresher.stop()
+                if refresher.solver:
+                    refresher.solver.close()
+
+    def _probe_loop(self):
+        while not self.stop_event.wait(timeout=self.probe_interval):
+            for proxy in [p for p in self.proxies if not p.alive]:
+                try:
+                    response = proxy.session.get(self.probe_url, timeout=15)
+                    refresher = proxy.cookie_refresher
+                    if self.is_blocked(response) and refresher and refresher.can_refresh:
+                        # Maybe only its clearance expired - solve through this proxy before judging it
+                        if refresher.refresh(f"probe of {proxy.url} challenged"):
+                            response = proxy.session.get(self.probe_url, timeout=15)
+                    if self.healthy(response):
+                        with self.lock:
+                            proxy.reset()
+                        logger.info(f"Proxy {proxy.url} is back (probe {response.status_code})")
+                except Exception as e:
+                    logger.debug(f"Proxy {proxy.url} still down: {e}")
+
+    def get_status(self):
+        with self.lock:
+            return [{
+                'proxy': p.url,
+                'alive': p.alive,
+                'requests': p.requests,
+                'success_rate': round(p.success_rate, 3),
+                'latency': round(p.latency, 3),
+                'score': round(p.score, 3)
+            } for p in self.proxies]
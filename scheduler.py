@@ -0,0 +1,137 @@
+"""
+In-process monitoring scheduler.
+Replaces external cron pings of /trigger/<source>: each source is checked on its own
+interval, with jitter so checks don't line up, and the interval follows how often the site
+actually posts - shorter while it is busy, drifting back towards the maximum when it is
+quiet. A tick is skipped while the previous check for that source is still running. When
+a check finds something, a processing job is started so the new items (queued at
+monitoring priority) go out right away instead of waiting for the next full scrape.
+"""
+import os
+import random
+import threading
+import time
+import logging
+from shutdown import get_shutdown
+
+logger = logging.getLogger(__name__)
+
+# Interval bounds (minutes) and the +/- fraction of jitter on every interval
+MIN_INTERVAL = float(os.getenv('MONITOR_MIN_MINUTES', '5'))
+MAX_INTERVAL = float(os.getenv('MONITOR_MAX_MINUTES', '60'))
+JITTER = 0.2
+# Weight of the latest check in the posting-rate estimate
+RATE_SMOOTHING = 0.3
+
+
+class SourceSchedule:
+    def __init__(self, source, interval):
+        self.source = source
+        self.interval = interval  # minutes
+        self.rate = None          # estimated new posts per hour
+        self.next_run = time.time() + random.uniform(30, 90)  # staggered first check after startup
+        self.last_run = None
+        self.job = None
+        self.stats = {'runs': 0, 'skipped': 0, 'found': 0, 'processing_started': 0}
+
+    def schedule_next(self):
+        self.next_run = time.time() + self.interval * 60 * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def observe(self, found, elapsed_hours):
+        """Fold one check's result into the posting rate and derive the next interval"""
+        rate = found / max(elapsed_hours, 1 / 60)
+        self.rate = rate if self.rate is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self.rate
+        # Aim for about one new post per check
+        target = 60 / self.rate if self.rate > 0 else MAX_INTERVAL
+        self.interval = max(MIN_INTERVAL, min(MAX_INTERVAL, target))
+
+
+class MonitorScheduler:
+    def __init__(self, start_job, sources, tick=5):
+        """
+        start_job(kind, source, limit=None) starts a background job and returns (job, error) - see app.start_job.
+        sources lists the sources to monitor.
+        """
+        self.start_job = start_job
+        self.tick = tick
+        self.schedules = {}
+        for source in sources:
+            interval = float(os.getenv(f"MONITOR_INTERVAL_{source.upper()}", os.getenv('MONITOR_INTERVAL_MINUTES', '15')))
+            self.schedules[source] = SourceSchedule(source, interval)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._loop, name="monitor-scheduler", daemon=True)
+        self.thread.start()
+        logger.info(f"Monitoring scheduler started for {', '.join(self.schedules)}")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _loop(self):
+        while not self.stop_event.wait(timeout=self.tick):
+            if get_shutdown().requested():
+                return
+            for schedule in list(self.schedules.values()):
+                try:
+                    self._check(schedule)
+                except Exception as e:
+                    logger.error(f"Scheduler error ({schedule.source}): {e}")
+
+    def _check(self, schedule):
+        with self.lock:
+            job = schedule.job
+            if job and not job.is_running():
+                schedule.job = None
+                self._finished(schedule, job)
+            if time.time() < schedule.next_run:
+                return
+            if schedule.job:
+                # Previous check still going - skip this tick rather than stack another one up
+                schedule.stats['skipped'] += 1
+                schedule.schedule_next()
+                return
+            job, error = self.start_job("monitoring", schedule.source)
+            if error:
+                logger.info(f"Scheduled check for {schedule.source} skipped: {error}")
+                schedule.stats['skipped'] += 1
+            else:
+                schedule.job = job
+                schedule.stats['runs'] += 1
+            schedule.schedule_next()
+
+    def _finished(self, schedule, job):
+        found = job.result if isinstance(job.result, int) else 0
+        if schedule.last_run is not None:
+            schedule.observe(found, (job.created_at - schedule.last_run) / 3600)
+        schedule.last_run = job.created_at
+        schedule.stats['found'] += found
+        if schedule.rate is not None:
+            logger.info(f"Scheduler: {schedule.source} found {found} new, ~{schedule.rate:.1f}/h, "
+                        f"next check in ~{schedule.interval:.0f} min")
+        if found:
+            # Hand the new items to a worker pool now - they are claimed first, and the limit keeps
+            # this from turning into a backfill. A running backfill claims them itself
+            _, error = self.start_job("process", schedule.source, limit=found)
+            if error:
+                logger.info(f"Scheduler: not starting processing for {schedule.source}: {error}")
+            else:
+                schedule.stats['processing_started'] += 1
+
+    def get_status(self):
+        now = time.time()
+        with self.lock:
+            return {
+                schedule.source: dict(
+                    schedule.stats,
+                    interval_minutes=round(schedule.interval, 1),
+                    next_check_in=max(0, round(schedule.next_run - now)),
+                    posts_per_hour=round(schedule.rate, 2) if schedule.rate is not None else None,
+                    running=schedule.job.id if schedule.job else None
+                )
+                for schedule in self.schedules.values()
+            }
@@ -10,6 +10,10 @@ import json
 import requests
 import threading
 import re
+from datetime import date
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode, quote, unquote
+from downloads import MultipartStream
+from fair_share import get_fair_share
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +51,74 @@ def normalize_filename(filename):
     return name
 
 
+# Tracking parameters that never change what a page returns
+_TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid)$', re.IGNORECASE)
+
+# Failed queue rows are retried after RETRY_BASE_SECONDS, doubling each time,
+# and dead-lettered after MAX_ATTEMPTS
+MAX_ATTEMPTS = int(os.getenv('MAX_ATTEMPTS', '6'))
+RETRY_BASE_SECONDS = 600
+
+# Queue priority bands: anything the homepage monitor finds outranks the whole backfill
+MONITOR_PRIORITY = 10 ** 9
+
+
+def canonicalize_url(url, base=None):
+    """
+    One spelling per resource, so the same page never passes a processed_urls check twice:
+    relative links resolved against base, https, lowercase host without www. or default port,
+    normalized percent-encoding, duplicate slashes collapsed, a trailing slash on extensionless
+    paths (WordPress permalinks), tracking parameters dropped, query sorted, fragment removed.
+    """
+    if not url:
+        return url
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        return url
+
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = re.sub(r'/{2,}', '/', quote(unquote(parts.path), safe="/%:@!$&'()*+,;=-._~")) or '/'
+    if not path.endswith('/') and '.' not in path.rsplit('/', 1)[-1]:
+        path += '/'
+
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not _TRACKING_PARAMS.match(k))
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+
+def listing_post_date(node, depth=4):
+    """Publish date of the listing card around node (a link), from the nearest <time datetime=...>"""
+    for card in [node] + list(node.parents)[:depth]:
+        stamp = card.find('time', attrs={'datetime': True}) if hasattr(card, 'find') else None
+        if stamp:
+            match = re.match(r'(\d{4})-(\d{2})-(\d{2})', stamp['datetime'])
+            if match:
+                try:
+                    return date(*map(int, match.groups()))
+                except ValueError:
+                    return None
+    return None
+
+
+def queue_priority(page, monitoring=False, posted=None):
+    """
+    Processing order for a discovered URL, highest first: monitoring finds before backfill,
+    then newer posts (when the listing shows a date), then shallower listing pages.
+    """
+    score = MONITOR_PRIORITY if monitoring else 0
+    if posted:
+        score += posted.toordinal() * 1000
+    return score + max(0, 999 - (page or 0))
+
+
 def extract_movie_info(filename):
     """
     Extract movie/show name, year, and episode info for fuzzy matching.
@@ -89,9 +161,99 @@ def extract_movie_info(filename):
     return (base_name, year, season, episode)
 
 
+def edit_distance(a, b, max_distance=None):
+    """Levenshtein distance, giving up early once it exceeds max_distance"""
+    if a == b:
+        return 0
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class TitleIndex:
+    """
+    In-memory index over extract_movie_info keys for fuzzy title matching.
+    Exact lookups go through a dict keyed by (base_name, year, season, episode);
+    near matches use a trigram index on base_name to pick candidates for an edit-distance check.
+    """
+    def __init__(self, max_edit_distance=2):
+        self.max_edit_distance = max_edit_distance
+        self.keys = {}       # (base_name, year, season, episode) -> set of filenames
+        self.trigrams = {}   # trigram -> set of base_names
+        self.bases = {}      # base_name -> set of keys
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _trigrams(base_name):
+        padded = f"  {base_name} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, filename):
+        key = extract_movie_info(filename)
+        if len(key[0]) < 3:
+            return None
+        with self.lock:
+            self.keys.setdefault(key, set()).add(filename)
+            if key[0] not in self.bases:
+                for gram in self._trigrams(key[0]):
+                    self.trigrams.setdefault(gram, set()).add(key[0])
+            self.bases.setdefault(key[0], set()).add(key)
+        return key
+
+    def add_many(self, filenames):
+        for filename in filenames:
+            if filename:
+                self.add(filename)
+
+    def find_exact(self, filename):
+        """
+        Filenames already indexed under the same (base_name, year, season, episode).
+        Keys without a year or episode are just the normalized title and never match here.
+        """
+        key = extract_movie_info(filename)
+        if len(key[0]) < 3 or not (key[1] or key[2]):
+            return []
+        with self.lock:
+            return sorted(self.keys.get(key, ()))
+
+    def find_similar(self, filename, limit=5):
+        """Likely duplicates: same year/season/episode with a base_name within max_edit_distance"""
+        base_name, year, season, episode = extract_movie_info(filename)
+        if len(base_name) < 3:
+            return []
+        grams = self._trigrams(base_name)
+        with self.lock:
+            shared = {}
+            for gram in grams:
+                for candidate in self.trigrams.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            # Each edit can destroy at most 3 trigrams, so anything sharing fewer can't be close enough
+            min_shared = len(grams) - 3 * self.max_edit_distance
+            candidates = [c for c, count in shared.items() if count >= min_shared and c != base_name]
+            keys = [k for c in candidates for k in self.bases.get(c, ()) if k[1:] == (year, season, episode)]
+
+        results = []
+        for key in keys:
+            distance = edit_distance(base_name, key[0], self.max_edit_distance)
+            if distance <= self.max_edit_distance:
+                results.append((key, distance))
+        results.sort(key=lambda item: item[1])
+        return results[:limit]
+
+
 class CloudflareD1:
-    def __init__(self, account_id, api_token, database_id):
+    def __init__(self, account_id, api_token, database_id, tenant="subz"):
         self.account_id = account_id
+        # Whose share of the process-wide D1 rate limit this connection draws on
+        self.tenant = tenant
         self.api_token = api_token
         self.database_id = database_id
         self.base_url = f"https://api.cloudflare.com/client/v4/accounts/{account_id}/d1/database/{database_id}/query"
@@ -114,6 +276,15 @@ class CloudflareD1:
                     page INTEGER,
                     source TEXT DEFAULT 'subz',
                     status TEXT DEFAULT 'pending',
+                    sub_id TEXT,
+                    nonce TEXT,
+                    title TEXT,
+                    harvested_at TEXT,
+                    claimed_at TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at TEXT,
+                    last_error TEXT,
+                    priority INTEGER DEFAULT 0,
                     discovered_at TEXT DEFAULT CURRENT_TIMESTAMP
                 )
             """)
@@ -152,13 +323,26 @@ class CloudflareD1:
                     category TEXT,
                     source TEXT DEFAULT 'subz',
                     message_id INTEGER,
+                    content_sha256 TEXT,
+                    subtitle_simhash TEXT,
                     uploaded_at TEXT DEFAULT CURRENT_TIMESTAMP
                 )
             """)
             
             # Try to add columns if they don't exist (migrations)
             schema_updates = [
-                "ALTER TABLE scraper_state ADD COLUMN source TEXT DEFAULT 'subz'"
+                "ALTER TABLE scraper_state ADD COLUMN source TEXT DEFAULT 'subz'",
+                "ALTER TABLE telegram_files ADD COLUMN content_sha256 TEXT",
+                "ALTER TABLE telegram_files ADD COLUMN subtitle_simhash TEXT",
+                "ALTER TABLE discovered_urls ADD COLUMN sub_id TEXT",
+                "ALTER TABLE discovered_urls ADD COLUMN nonce TEXT",
+                "ALTER TABLE discovered_urls ADD COLUMN title TEXT",
+                "ALTER TABLE discovered_urls ADD COLUMN harvested_at TEXT",
+                "ALTER TABLE discovered_urls ADD COLUMN claimed_at TEXT",
+                "ALTER TABLE discovered_urls ADD COLUMN attempts INTEGER DEFAULT 0",
+                "ALTER TABLE discovered_urls ADD COLUMN next_attempt_at TEXT",
+                "ALTER TABLE discovered_urls ADD COLUMN last_error TEXT",
+                "ALTER TABLE discovered_urls ADD COLUMN priority INTEGER DEFAULT 0"
             ]
             
             # Try to add columns if they don't exist (migrations)
@@ -173,8 +357,12 @@ class CloudflareD1:
             indexes = [
                 "CREATE INDEX IF NOT EXISTS idx_normalized_filename ON telegram_files(normalized_filename)",
                 "CREATE INDEX IF NOT EXISTS idx_source ON telegram_files(source)",
+                "CREATE INDEX IF NOT EXISTS idx_content_sha256 ON telegram_files(content_sha256)",
                 "CREATE INDEX IF NOT EXISTS idx_source_urls ON processed_urls(source)",
-                "CREATE INDEX IF NOT EXISTS idx_pending_urls ON discovered_urls(status, source)"
+                "CREATE INDEX IF NOT EXISTS idx_pending_urls ON discovered_urls(status, source)",
+                "CREATE INDEX IF NOT EXISTS idx_due_urls ON discovered_urls(status, source, next_attempt_at)",
+                # Claim order: highest priority first, oldest first among equals
+                "CREATE INDEX IF NOT EXISTS idx_claim_order ON discovered_urls(status, source, priority DESC, id)"
             ]
             
             for sql in indexes:
@@ -211,6 +399,7 @@ class CloudflareD1:
             if params:
                 payload["params"] = params
             
+            get_fair_share('d1').acquire(self.tenant)
             response = requests.post(self.base_url, headers=self.headers, json=payload, timeout=30)
             data = response.json()
             
@@ -225,53 +414,159 @@ class CloudflareD1:
                 logger.error(f"D1 execute error: {e}")
             return None
     
-    def add_discovered_url(self, url, category="", page=0, source="subz"):
-        return self.execute(
-            "INSERT OR IGNORE INTO discovered_urls (url, category, page, source, status) VALUES (?, ?, ?, ?, 'pending')",
-            [url, category, page, source]
+    def add_discovered_url(self, url, category="", page=0, source="subz", sub_id=None, nonce=None, title=None,
+                           priority=0):
+        """
+        Queue url. Returns 1 if it went in as a new row, 0 if the row already existed (pending,
+        backing off, dead-lettered or done) and None on error.
+        """
+        inserted = self.execute(
+            "INSERT INTO discovered_urls (url, category, page, source, status, sub_id, nonce, title, harvested_at, priority) "
+            "VALUES (?, ?, ?, ?, 'pending', ?, ?, ?, CASE WHEN ? IS NULL THEN NULL ELSE datetime('now') END, ?) "
+            "ON CONFLICT(url) DO NOTHING RETURNING id",
+            [url, category, page, source, sub_id, nonce, title, nonce, priority]
         )
+        if inserted is None:
+            return None
+        if inserted and inserted[0]["results"]:
+            return 1
+        if sub_id and nonce:
+            # Download params harvested from the listing page; a re-crawl refreshes an old nonce
+            self.execute(
+                """INSERT INTO discovered_urls (url, category, page, source, status, sub_id, nonce, title, harvested_at, priority)
+                   VALUES (?, ?, ?, ?, 'pending', ?, ?, ?, datetime('now'), ?)
+                   ON CONFLICT(url) DO UPDATE SET sub_id = excluded.sub_id, nonce = excluded.nonce,
+                       title = excluded.title, harvested_at = excluded.harvested_at,
+                       priority = MAX(COALESCE(priority, 0), excluded.priority)""",
+                [url, category, page, source, sub_id, nonce, title, priority]
+            )
+        else:
+            # A backlog row the monitor sees again on the homepage is promoted, never demoted
+            self.execute(
+                "UPDATE discovered_urls SET priority = MAX(COALESCE(priority, 0), ?) WHERE url = ?",
+                [priority, url]
+            )
+        return 0
+
+    @staticmethod
+    def _discovered_insert_sql(rows, on_conflict):
+        placeholders = ",".join(["(?, ?, ?, ?, 'pending', ?)"] * rows)
+        return (f"INSERT INTO discovered_urls (url, category, page, source, status, priority) VALUES {placeholders} "
+                f"ON CONFLICT(url) {on_conflict}")
+
+    @staticmethod
+    def _discovered_params(items, source):
+        # Flatten params: url1, cat1, page1, src, prio1, url2, cat2, page2, src, prio2...
+        params = []
+        for item in items:
+            params.extend([item[0], item[1], item[2], source, item[3] if len(item) > 3 else 0])
+        return params
 
     def add_discovered_urls_batch(self, items, source="subz"):
         """
         Batch insert multiple discovered URLs
-        items: list of (url, category, page) tuples
+        items: list of (url, category, page) or (url, category, page, priority) tuples
+        Returns how many were new rows; already known ones only get their priority promoted.
         """
         if not items:
-            return None
+            return 0
             
-        # D1 API supports multiple statements, but let's build a single multi-value INSERT for atomicity
-        # However, D1 has a limit on bind variables. Let's do batches of 10.
-        results = []
+        # D1 has a limit on bind variables, so insert in batches of 10
+        added = 0
         batch_limit = 10
         
         for i in range(0, len(items), batch_limit):
             batch = items[i:i+batch_limit]
-            placeholders = ",".join(["(?, ?, ?, ?, 'pending')"] * len(batch))
-            sql = f"INSERT OR IGNORE INTO discovered_urls (url, category, page, source, status) VALUES {placeholders}"
-            
-            # Flatten params: url1, cat1, page1, src, url2, cat2, page2, src...
-            params = []
-            for item in batch:
-                params.extend([item[0], item[1], item[2], source])
-                
-            res = self.execute(sql, params)
-            if res:
-                results.extend(res)
+            res = self.execute(self._discovered_insert_sql(len(batch), "DO NOTHING RETURNING url"),
+                               self._discovered_params(batch, source))
+            if not res:
+                continue
+            new_urls = {row["url"] for row in res[0]["results"]}
+            added += len(new_urls)
+            known = [item for item in batch if item[0] not in new_urls]
+            if known:
+                # A backlog row the monitor sees again on the homepage is promoted, never demoted
+                self.execute(self._discovered_insert_sql(len(known), "DO UPDATE SET priority = MAX(COALESCE(priority, 0), excluded.priority)"),
+                             self._discovered_params(known, source))
                 
-        return results
+        return added
     
     def get_pending_urls(self, limit=10, source="subz"):
-        """Get a list of pending URLs to process"""
+        """Get a list of pending URLs to process, highest priority first"""
         result = self.execute(
-            "SELECT url, category FROM discovered_urls WHERE status = 'pending' AND source = ? LIMIT ?", 
+            "SELECT url, category, sub_id, nonce, title FROM discovered_urls WHERE status = 'pending' AND source = ? "
+            "AND (next_attempt_at IS NULL OR next_attempt_at <= datetime('now')) "
+            "ORDER BY priority DESC, id LIMIT ?", 
             [source, limit]
         )
         if result and len(result) > 0:
             return [row for row in result[0].get("results", [])]
         return []
         
+    def claim_pending_urls(self, limit=10, source="subz"):
+        """
+        Take up to limit pending URLs and mark them 'processing' in the same statement,
+        so a prefetch running alongside the workers never hands out the same row twice.
+        Highest priority first (see queue_priority), so fresh releases overtake a draining backfill.
+        """
+        result = self.execute(
+            "UPDATE discovered_urls SET status = 'processing', claimed_at = datetime('now') "
+            "WHERE id IN (SELECT id FROM discovered_urls WHERE status = 'pending' AND source = ? "
+            "AND (next_attempt_at IS NULL OR next_attempt_at <= datetime('now')) "
+            "ORDER BY priority DESC, id LIMIT ?) "
+            "RETURNING id, url, category, sub_id, nonce, title, priority",
+            [source, limit]
+        )
+        if result and len(result) > 0:
+            # RETURNING rows come back in no particular order
+            rows = result[0].get("results", [])
+            return sorted(rows, key=lambda row: (-(row.get('priority') or 0), row.get('id') or 0))
+        return []
+
+    def release_claims(self, urls, source="subz"):
+        """Hand claimed rows that were never started back to the queue (a run stopping early)"""
+        for i in range(0, len(urls), 50):
+            batch = urls[i:i+50]
+            placeholders = ",".join(["?"] * len(batch))
+            self.execute(
+                f"UPDATE discovered_urls SET status = 'pending', claimed_at = NULL "
+                f"WHERE status = 'processing' AND source = ? AND url IN ({placeholders})",
+                [source] + batch
+            )
+
+    def release_stale_claims(self, source="subz", max_age_minutes=60):
+        """Put rows claimed by a run that died (or gave up on them) back in the queue"""
+        return self.execute(
+            "UPDATE discovered_urls SET status = 'pending' WHERE status = 'processing' AND source = ? "
+            "AND (claimed_at IS NULL OR claimed_at < datetime('now', ?))",
+            [source, f"-{max_age_minutes} minutes"]
+        )
+
+    def record_failure(self, url, error, permanent=False, source="subz"):
+        """
+        Transient failures go back to 'pending', due again after an exponential backoff;
+        permanent ones, and rows out of attempts, move to the 'dead' letter state.
+        Returns the row's new status ('pending' or 'dead'), or None if the update failed.
+        """
+        result = self.execute(
+            "UPDATE discovered_urls SET attempts = COALESCE(attempts, 0) + 1, last_error = ?, "
+            "status = CASE WHEN ? OR COALESCE(attempts, 0) + 1 >= ? THEN 'dead' ELSE 'pending' END, "
+            "next_attempt_at = datetime('now', '+' || (? << MIN(COALESCE(attempts, 0), 10)) || ' seconds') "
+            "WHERE url = ? RETURNING status",
+            [error[:200], 1 if permanent else 0, MAX_ATTEMPTS, RETRY_BASE_SECONDS, url]
+        )
+        rows = result[0].get("results", []) if result else []
+        status = rows[0].get("status") if rows else None
+        if status == 'dead':
+            # Dead letters count as processed so they aren't queued again (the error stays in last_error)
+            self.execute(
+                "INSERT OR REPLACE INTO processed_urls (url, success, title, source, processed_at) VALUES (?, 0, '', ?, datetime('now'))",
+                [url, source]
+            )
+        return status
+
     def update_url_status(self, url, status):
-        """Update status of a discovered URL (pending, processing, completed, failed)"""
+        """Update status of a discovered URL (pending, processing, completed, failed, dead)"""
         return self.execute(
             "UPDATE discovered_urls SET status = ? WHERE url = ?",
             [status, url]
@@ -313,11 +608,13 @@ class CloudflareD1:
                 return results[0].get("count", 0)
         return 0
     
-    def get_pending_count(self, source=None):
+    def get_pending_count(self, source=None, due_only=False):
+        """Pending rows; due_only leaves out failed rows still waiting for their retry time"""
+        due = " AND (next_attempt_at IS NULL OR next_attempt_at <= datetime('now'))" if due_only else ""
         if source:
-            result = self.execute("SELECT COUNT(*) as count FROM discovered_urls WHERE status = 'pending' AND source = ?", [source])
+            result = self.execute(f"SELECT COUNT(*) as count FROM discovered_urls WHERE status = 'pending' AND source = ?{due}", [source])
         else:
-            result = self.execute("SELECT COUNT(*) as count FROM discovered_urls WHERE status = 'pending'")
+            result = self.execute(f"SELECT COUNT(*) as count FROM discovered_urls WHERE status = 'pending'{due}")
         if result and len(result) > 0:
             results = result[0].get("results", [])
             if results:
@@ -363,23 +660,60 @@ class CloudflareD1:
             result = self.execute("SELECT normalized_filename FROM telegram_files WHERE normalized_filename IS NOT NULL AND source = ?", [source])
         else:
             result = self.execute("SELECT normalized_filename FROM telegram_files WHERE normalized_filename IS NOT NULL")
+        if result is None:
+            return None  # query failed - not the same as no rows
         if result and len(result) > 0:
             return set(row.get("normalized_filename", "") for row in result[0].get("results", []) if row.get("normalized_filename"))
         return set()
     
-    def save_telegram_file_with_normalized(self, file_id, file_unique_id, filename, normalized_filename, file_size, title, source_url, category, message_id, source="subz"):
+    def get_all_content_hashes(self, source=None):
+        """Map of content_sha256 -> Telegram file_id for every uploaded file"""
+        if source:
+            result = self.execute("SELECT content_sha256, file_id FROM telegram_files WHERE content_sha256 IS NOT NULL AND source = ?", [source])
+        else:
+            result = self.execute("SELECT content_sha256, file_id FROM telegram_files WHERE content_sha256 IS NOT NULL")
+        if result is None:
+            return None  # query failed - not the same as no rows
+        if result and len(result) > 0:
+            return {row["content_sha256"]: row.get("file_id", "") for row in result[0].get("results", []) if row.get("content_sha256")}
+        return {}
+    
+    def get_all_uploaded_files(self, source=None):
+        """filename, file_size and file_id of every uploaded file (for the title and size indexes)"""
+        if source:
+            result = self.execute("SELECT filename, file_size, file_id FROM telegram_files WHERE filename IS NOT NULL AND source = ?", [source])
+        else:
+            result = self.execute("SELECT filename, file_size, file_id FROM telegram_files WHERE filename IS NOT NULL")
+        if result is None:
+            return None  # query failed - not the same as no rows
+        if result and len(result) > 0:
+            return [row for row in result[0].get("results", []) if row.get("filename")]
+        return []
+    
+    def get_all_simhashes(self):
+        """List of (file_id, encoded per-track SimHashes) for near-duplicate detection"""
+        result = self.execute("SELECT file_id, subtitle_simhash FROM telegram_files WHERE subtitle_simhash IS NOT NULL AND subtitle_simhash != ''")
+        if result is None:
+            return None  # query failed - not the same as no rows
+        if result and len(result) > 0:
+            return [(row.get("file_id", ""), row["subtitle_simhash"]) for row in result[0].get("results", [])]
+        return []
+    
+    def save_telegram_file_with_normalized(self, file_id, file_unique_id, filename, normalized_filename, file_size, title, source_url, category, message_id, source="subz", content_sha256=None, subtitle_simhash=None):
         return self.execute(
             """INSERT OR REPLACE INTO telegram_files 
-               (file_id, file_unique_id, filename, normalized_filename, file_size, title, source_url, category, source, message_id, uploaded_at) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+               (file_id, file_unique_id, filename, normalized_filename, file_size, title, source_url, category, source, message_id, content_sha256, subtitle_simhash, uploaded_at) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
             [file_id, file_unique_id, filename, normalized_filename, file_size, title[:200] if title else "", 
-             source_url[:500] if source_url else "", category or "", source, message_id]
+             source_url[:500] if source_url else "", category or "", source, message_id, content_sha256, subtitle_simhash]
         )
 
 
 class TelegramUploader:
-    def __init__(self, bot_token, chat_id):
+    def __init__(self, bot_token, chat_id, tenant="subz"):
         self.bot_token = bot_token
+        # Whose share of the process-wide Telegram rate limit this uploader draws on
+        self.tenant = tenant
         self.chat_id = chat_id
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
         self.enabled = bool(bot_token and chat_id)
@@ -388,10 +722,13 @@ class TelegramUploader:
         self.min_delay = 1.0 
         self.rate_limit_delay = 2.0
         self.consecutive_429s = 0
+        self.throttled = 0  # total 429s, read by the worker autoscaler
         self.lock = threading.Lock()
         
     def _wait_for_rate_limit(self):
         # NOTE: This must be called inside the lock!
+        # Every scraper posts to the same chat: take a turn at the shared limit first
+        get_fair_share('telegram').acquire(self.tenant)
         elapsed = time.time() - self.last_request_time
         if elapsed < self.min_delay:
             time.sleep(self.min_delay - elapsed)
@@ -422,6 +759,7 @@ class TelegramUploader:
                     if response.status_code == 429:
                         retry_after = response.json().get('parameters', {}).get('retry_after', 30)
                         self.consecutive_429s += 1
+                        self.throttled += 1
                         logger.warning(f"Telegram rate limited! Retry after {retry_after}s (attempt {attempt + 1})")
                         # Sleep while holding lock to prevent others from hitting it
                         time.sleep(retry_after + 1) 
@@ -444,6 +782,7 @@ class TelegramUploader:
         return False
     
     def send_document(self, file_content, filename, caption=None, retries=5):
+        """file_content is bytes or a seekable file object (e.g. downloads.Download.open())"""
         if not self.enabled:
             return None
             
@@ -459,9 +798,6 @@ class TelegramUploader:
                     elif filename.lower().endswith('.rar'):
                         mime_type = 'application/x-rar-compressed'
                     
-                    files = {
-                        'document': (filename, io.BytesIO(file_content), mime_type)
-                    }
                     data = {
                         'chat_id': self.chat_id
                     }
@@ -469,12 +805,16 @@ class TelegramUploader:
                         data['caption'] = caption[:1024]
                         data['parse_mode'] = 'HTML'
                     
-                    response = requests.post(url, data=data, files=files, timeout=60)
+                    # Stream the file part from disk/spool instead of building the body in memory
+                    fileobj = file_content if hasattr(file_content, 'read') else io.BytesIO(file_content)
+                    body = MultipartStream(data, 'document', filename, fileobj, mime_type)
+                    response = requests.post(url, data=body, headers={'Content-Type': body.content_type}, timeout=60)
                     self.last_request_time = time.time()
                     
                     if response.status_code == 429:
                         retry_after = response.json().get('parameters', {}).get('retry_after', 30)
                         self.consecutive_429s += 1
+                        self.throttled += 1
                         logger.warning(f"Telegram rate limited on upload! Retry after {retry_after}s (attempt {attempt + 1})")
                         time.sleep(retry_after + 2)
                         continue
@@ -520,9 +860,12 @@ class ProgressTracker:
         self.thread = None
         self.current_page = 0
         self.current_category = ""
+        self.announce = True
         
-    def start(self, total_found):
+    def start(self, total_found, announce=True):
+        """announce=False counts silently - no start, progress or summary messages (small scheduled runs)"""
         # Reset counters for the new batch
+        self.announce = announce
         self.total_found = total_found
         self.processed = 0
         self.success = 0
@@ -533,6 +876,8 @@ class ProgressTracker:
         if self.thread and self.thread.is_alive():
             self.stop_event.set()
             self.thread.join(timeout=2)
+        if not announce:
+            return
             
         self.stop_event.clear()
         self.thread = threading.Thread(target=self._notification_loop, daemon=True)
@@ -554,16 +899,17 @@ class ProgressTracker:
         self.current_category = category
         self.current_page = page
             
-    def stop(self):
+    def stop(self, note=None):
+        """note replaces the 'Scraping Complete!' headline, e.g. when a time budget ended the run"""
         self.stop_event.set()
         elapsed = time.time() - self.start_time if self.start_time else 0
         hours, remainder = divmod(int(elapsed), 3600)
         minutes, seconds = divmod(remainder, 60)
         
         # Don't send final message if we didn't actually process anything (to avoid noise)
-        if self.processed > 0:
+        if self.processed > 0 and self.announce:
             self.notifier.send_message(
-                f"<b>Scraping Complete!</b>\n"
+                f"<b>{note or 'Scraping Complete!'}</b>\n"
                 f"Processed: {self.processed}/{self.total_found}\n"
                 f"Success: {self.success}\n"
                 f"Failed: {self.failed}\n"
@@ -0,0 +1,101 @@
+"""
+Cooperative shutdown for scraper runs.
+SIGTERM (a Render redeploy, a gunicorn restart) used to kill the daemon worker threads
+mid-item: a file could reach Telegram without D1 ever recording it, and the next run
+uploaded it again. Now the signal only raises a flag. Discovery loops stop at the next
+page boundary, worker pools stop starting items and hand unstarted claims back, and the
+process waits a bounded time for running jobs to finish their current items.
+"""
+import os
+import signal
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long a stopping process waits for in-flight items (keep under the platform's kill delay)
+DRAIN_SECONDS = float(os.getenv('SHUTDOWN_DRAIN_SECONDS', '25'))
+
+
+class ShutdownCoordinator:
+    def __init__(self):
+        self.event = threading.Event()
+        self.reason = None
+        self.lock = threading.Condition()
+        self.jobs = {}  # name -> running count
+
+    def requested(self):
+        return self.event.is_set()
+
+    def request(self, reason):
+        """Ask every run to stop taking new work"""
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.event.set()
+        logger.warning(f"Shutdown requested ({reason}) - finishing in-flight work")
+
+    def install(self):
+        """SIGTERM/SIGINT request a graceful stop; a second signal exits immediately"""
+        def handle(signum, frame):
+            if self.requested():
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+                return
+            self.request(signal.Signals(signum).name)
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, handle)
+
+    def started(self, name):
+        with self.lock:
+            self.jobs[name] = self.jobs.get(name, 0) + 1
+
+    def finished(self, name):
+        with self.lock:
+            self.jobs[name] = self.jobs.get(name, 1) - 1
+            if self.jobs[name] <= 0:
+                del self.jobs[name]
+            self.lock.notify_all()
+
+    def drain(self, timeout=DRAIN_SECONDS):
+        """Wait up to timeout seconds for running jobs to finish; True if they all did"""
+        deadline = time.time() + timeout
+        with self.lock:
+            while self.jobs:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.warning(f"Shutdown: gave up waiting for {', '.join(self.jobs)} after {timeout:.0f}s")
+                    return False
+                self.lock.wait(remaining)
+        logger.info("Shutdown: all jobs drained")
+        return True
+
+    def get_status(self):
+        with self.lock:
+            return {'requested': self.event.is_set(), 'reason': self.reason, 'jobs': dict(self.jobs)}
+
+
+_shared_shutdown = None
+_shared_lock = threading.Lock()
+
+
+def get_shutdown():
+    """Process-wide coordinator - one signal stops every scraper in the process"""
+    global _shared_shutdown
+    with _shared_lock:
+        if _shared_shutdown is None:
+            _shared_shutdown = ShutdownCoordinator()
+        return _shared_shutdown
+
+
+def stop_reason(budget=None):
+    """Why a run should stop taking work now - None while it can carry on"""
+    if get_shutdown().requested():
+        return "Shutting Down"
+    if budget is not None and budget.exhausted():
+        # A RunBudget, or anything else with exhausted() and a stop_label (a cancellable job)
+        return budget.stop_label
+    return None
@@ -0,0 +1,75 @@
+"""
+Request coalescing (single-flight) for page fetches.
+When several workers ask for the same canonical URL at once, only the first one goes to
+the network; the others wait for its response and share it. Nothing is kept once the
+request finishes, so later fetches still see fresh pages.
+"""
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {'fetches': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        """Run fn() for key unless a call for the same key is in flight; then wait for and share its result"""
+        with self.lock:
+            call = self.calls.get(key)
+            if call:
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self.calls[key] = _Call()
+                self.stats['fetches'] += 1
+                leader = True
+
+        if not leader:
+            logger.debug(f"Coalesced fetch: {key}")
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+    def get_status(self):
+        with self.lock:
+            return {
+                'fetches': self.stats['fetches'],
+                'saved': self.stats['coalesced'],
+                'in_flight': len(self.calls)
+            }
+
+
+_shared_flight = None
+_shared_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Process-wide instance - scrapers sharing a site also share in-flight requests"""
+    global _shared_flight
+    with _shared_lock:
+        if _shared_flight is None:
+            _shared_flight = SingleFlight()
+        return _shared_flight
@@ -0,0 +1,180 @@
+"""
+Subtitle text fingerprinting (SimHash) for near-duplicate detection.
+Opens zip/rar payloads, strips timing and watermark lines from each .srt track
+and hashes what is left, so re-packaged or re-timed copies of the same track match.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+import logging
+import zipfile
+
+try:
+    import rarfile
+except ImportError:
+    rarfile = None
+
+logger = logging.getLogger(__name__)
+
+SUBTITLE_EXTENSIONS = ('.srt', '.ass', '.ssa', '.vtt', '.sub')
+
+# Lines that carry no dialogue: cue numbers, timings and uploader watermarks
+_CUE_NUMBER = re.compile(r'^\s*\d+\s*$')
+_TIMING = re.compile(r'\d{1,2}:\d{2}:\d{2}[,.]\d{1,3}\s*-->')
+_WATERMARK = re.compile(r'(@[A-Za-z0-9_]{3,}|t\.me/|https?://|www\.|\.lk\b|subtitle[sd]?\s+by|translated\s+by|sub\s+by)', re.IGNORECASE)
+_TAGS = re.compile(r'<[^>]+>|\{[^}]*\}')
+_PUNCT = re.compile(r'[\s.,!?;:"\'()\[\]\-…“”‘’]+')
+
+# Tracks shorter than this (in words) are too small to fingerprint reliably
+MIN_WORDS = 30
+
+
+def decode_subtitle(raw):
+    """Decode subtitle bytes, trying the encodings these sites actually use"""
+    if raw.startswith(b'\xff\xfe') or raw.startswith(b'\xfe\xff'):
+        return raw.decode('utf-16', errors='replace')
+    for encoding in ('utf-8-sig', 'cp1252'):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('latin-1')
+
+
+def extract_subtitle_tracks(content):
+    """
+    Return [(name, text)] for every subtitle track inside a payload (bytes or a seekable file).
+    Zip is always supported; rar only when the rarfile module (and its unrar backend) is available.
+    """
+    if hasattr(content, 'read'):
+        source = content
+        source.seek(0)
+        head = source.read(4)
+        source.seek(0)
+    else:
+        source = io.BytesIO(content)
+        head = content[:4]
+
+    tracks = []
+    try:
+        if head == b'PK\x03\x04':
+            with zipfile.ZipFile(source) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(SUBTITLE_EXTENSIONS):
+                        tracks.append((info.filename, decode_subtitle(archive.read(info))))
+        elif head == b'Rar!':
+            if not rarfile:
+                return []
+            with rarfile.RarFile(source) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(SUBTITLE_EXTENSIONS):
+                        tracks.append((info.filename, decode_subtitle(archive.read(info))))
+        else:
+            tracks.append(("subtitle.srt", decode_subtitle(source.read())))
+    except Exception as e:
+        logger.warning(f"Could not read subtitle archive: {e}")
+    return tracks
+
+
+def clean_subtitle_text(text):
+    """Strip cue numbers, timings, formatting tags and watermark lines - return dialogue words"""
+    words = []
+    for line in text.splitlines():
+        if not line.strip() or _CUE_NUMBER.match(line) or _TIMING.search(line):
+            continue
+        if _WATERMARK.search(line):
+            continue
+        line = _TAGS.sub(' ', line).lower()
+        words.extend(w for w in _PUNCT.split(line) if w)
+    return words
+
+
+def simhash(words, bits=64):
+    """Charikar SimHash over 3-word shingles"""
+    if len(words) < 3:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[i:i + 3]) for i in range(len(words) - 2)]
+
+    weights = [0] * bits
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=bits // 8).digest(), 'big')
+        for i in range(bits):
+            weights[i] += 1 if (h >> i) & 1 else -1
+
+    value = 0
+    for i in range(bits):
+        if weights[i] > 0:
+            value |= 1 << i
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def fingerprint_payload(content):
+    """SimHash of every usable subtitle track in a downloaded file"""
+    hashes = []
+    for name, text in extract_subtitle_tracks(content):
+        words = clean_subtitle_text(text)
+        if len(words) < MIN_WORDS:
+            continue
+        hashes.append(simhash(words))
+    return hashes
+
+
+class SimHashIndex:
+    """
+    In-memory index with fast Hamming-distance lookup.
+    Hashes are split into (max_distance + 1) bands; by the pigeonhole principle two hashes
+    within max_distance share at least one identical band, so only those buckets are scanned.
+    """
+    def __init__(self, max_distance=3, bits=64):
+        self.max_distance = max_distance
+        self.bits = bits
+        self.num_bands = max_distance + 1
+        self.band_bits = bits // self.num_bands
+        self.band_mask = (1 << self.band_bits) - 1
+        self.bands = [{} for _ in range(self.num_bands)]
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def _band_keys(self, value):
+        return [(value >> (i * self.band_bits)) & self.band_mask for i in range(self.num_bands)]
+
+    def add(self, value, ref):
+        with self.lock:
+            for i, key in enumerate(self._band_keys(value)):
+                self.bands[i].setdefault(key, []).append((value, ref))
+            self.size += 1
+
+    def find(self, value):
+        """Return [(ref, distance)] of indexed hashes within max_distance, closest first"""
+        matches = {}
+        with self.lock:
+            for i, key in enumerate(self._band_keys(value)):
+                for candidate, ref in self.bands[i].get(key, ()):
+                    distance = hamming_distance(value, candidate)
+                    if distance <= self.max_distance and distance < matches.get(ref, self.bits + 1):
+                        matches[ref] = distance
+        return sorted(matches.items(), key=lambda item: item[1])
+
+
+def encode_hashes(hashes):
+    """Serialise per-track hashes for storage in D1"""
+    return ",".join(f"{h:016x}" for h in hashes)
+
+
+def decode_hashes(value):
+    if not value:
+        return []
+    return [int(h, 16) for h in value.split(",") if h]
+
+
+def get_simhash_policy():
+    """'flag' (log near-duplicates and upload anyway), 'skip' (don't upload) or 'off'"""
+    policy = os.getenv('SIMHASH_POLICY', 'flag').lower()
+    return policy if policy in ('flag', 'skip', 'off') else 'flag'
@@ -11,9 +11,20 @@ import random
 import re
 import threading
 import sys
+import argparse
 from urllib.parse import urljoin
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from scraper_utils import CloudflareD1, TelegramUploader, ProgressTracker, normalize_filename
+from scraper_utils import CloudflareD1, TelegramUploader, ProgressTracker, normalize_filename, canonicalize_url, listing_post_date, queue_priority
+from file_cache import get_file_cache
+from subtitle_fingerprint import encode_hashes
+from dedup_service import get_dedup_service
+from impersonation import get_impersonation_selector
+from single_flight import get_single_flight
+from work_pool import WorkPool
+from autoscale import AutoScaler
+from hedging import get_hedged_fetcher, FETCH_TIMEOUT
+from deadline import RunBudget, parse_duration
+from shutdown import get_shutdown, stop_reason
+from downloads import Download, DownloadRejected, DownloadSkipped, EXTENSIONS, stream_download
 
 # Force logs to stdout for Render visibility
 logging.basicConfig(
@@ -25,31 +36,44 @@ logger = logging.getLogger(__name__)
 
 class SubzLkScraper:
     def __init__(self, telegram_token, telegram_chat_id, 
-                 cf_account_id=None, cf_api_token=None, d1_database_id=None):
+                 cf_account_id=None, cf_api_token=None, d1_database_id=None, dedup=None):
         self.base_url = 'https://subz.lk'
         self.source = "subz"
         self.num_workers = 3
         self.batch_size = 50
+        # The autoscaler moves the worker count between these while a queue run is going
+        self.min_workers, self.max_workers = 1, 8
         self.lock = threading.Lock()
         
-        # Browser impersonation versions
-        self.browser_versions = ["chrome110", "chrome116", "chrome120", "chrome124"]
+        # Browser impersonation profile, picked per host from observed success
+        self.impersonation = get_impersonation_selector()
+        self.single_flight = get_single_flight()
+        self.hedger = get_hedged_fetcher()
         
         # D1 Setup
         self.cf_account_id = cf_account_id or os.getenv('CF_ACCOUNT_ID')
         self.cf_api_token = cf_api_token or os.getenv('CF_API_TOKEN')
         self.d1_database_id = d1_database_id or os.getenv('D1_DATABASE_ID')
-        self.d1 = CloudflareD1(self.cf_account_id, self.cf_api_token, self.d1_database_id)
+        self.d1 = CloudflareD1(self.cf_account_id, self.cf_api_token, self.d1_database_id, tenant=self.source)
         
         # Telegram & Tracker
-        self.telegram = TelegramUploader(telegram_token, telegram_chat_id)
+        self.telegram = TelegramUploader(telegram_token, telegram_chat_id, tenant=self.source)
         self.tracker = ProgressTracker(self.telegram, interval=120)
         
+        # Local copy of every downloaded file, shared by all scrapers
+        self.file_cache = get_file_cache()
+        
+        # Duplicate indexes across all sources, shared by all scrapers
+        self.dedup = dedup or get_dedup_service()
+        
         # Runtime State
         self.stats = {'discovered': 0, 'processed': 0}
+        self.fast_path_stats = {'hits': 0, 'rejected': 0}
+        self.work_pool = None
+        self.autoscaler = None
+        self.retry_stats = {'retry_scheduled': 0, 'dead': 0}
         self.initialization_status = "pending"
         self.processed_urls = set()
-        self.existing_filenames = set()
 
     def initialize(self):
         """Perform all heavy D1 operations in one place (non-blocking for __init__)"""
@@ -60,8 +84,11 @@ class SubzLkScraper:
             
             self.initialization_status = "loading_d1_history"
             if self.d1.enabled:
-                self.processed_urls = self.d1.get_all_processed_urls(source=self.source) or set()
-                self.existing_filenames = self.d1.get_all_normalized_filenames(source=self.source) or set()
+                self.processed_urls = {canonicalize_url(u) for u in self.d1.get_all_processed_urls(source=self.source) or ()}
+                if not self.dedup.load_cloudflare_d1(self.d1):
+                    # Processing against a partial duplicate index would upload duplicates
+                    self.initialization_status = "error: duplicate index not loaded"
+                    return False
                 self.stats['discovered'] = self.d1.get_discovered_urls_count(source=self.source)
                 self.stats['processed'] = self.d1.get_processed_urls_count(source=self.source)
                 
@@ -74,34 +101,47 @@ class SubzLkScraper:
             return False
 
     def get_page(self, url, retries=6):
+        """Fetch page; concurrent requests for the same canonical URL share one fetch"""
+        return self.single_flight.do(canonicalize_url(url), lambda: self._get_page(url, retries))
+
+    def _get_page(self, url, retries):
         """Fetch page with browser impersonation and retries"""
         for attempt in range(retries):
+            target = self.impersonation.choose(url)
+            started = time.time()
             try:
-                response = curl_requests.get(
+                response = self.hedger.get(url, lambda: curl_requests.get(
                     url, 
-                    impersonate=random.choice(self.browser_versions),
-                    timeout=30,
+                    impersonate=target,
+                    timeout=FETCH_TIMEOUT,
                     headers={'User-Agent': 'Mozilla/5.0'} # Standard fallback
-                )
+                ))
+                self.impersonation.record_response(url, target, response, time.time() - started)
                 if response.status_code == 200:
                     return response
                 if response.status_code == 404:
                     return None
             except Exception as e:
+                self.impersonation.record(url, target, 'error')
                 logger.warning(f"Retry {attempt+1}/{retries} for {url}: {e}")
                 time.sleep(random.uniform(2, 5))
         return None
 
-    def crawl_only(self, limit_pages=None):
-        """Discovery Phase: Crawl categories and save found URLs to D1"""
+    def crawl_only(self, limit_pages=None, monitoring=False, budget=None):
+        """
+        Discovery Phase: Crawl categories and save found URLs to D1.
+        monitoring=True queues what it finds ahead of any backfill (see queue_priority).
+        """
         logger.info(">>> STARTING DISCOVERY PHASE (Crawl Only) <<<")
         categories = ["/category/movies/", "/category/tv-shows/"]
         
         # Start tracker in "Discovery" mode
-        self.tracker.start(0) 
+        # Monitoring runs alongside a backfill: it leaves the backfill's tracker and resume point alone
+        if not monitoring:
+            self.tracker.start(0)
         
         # Load resume state
-        resume_cat, resume_page = self.d1.get_state(source=self.source) if self.d1.enabled else (None, None)
+        resume_cat, resume_page = self.d1.get_state(source=self.source) if self.d1.enabled and not monitoring else (None, None)
         start_tracking = False if resume_cat else True
         
         total_new = 0
@@ -116,8 +156,14 @@ class SubzLkScraper:
             
             while True:
                 if limit_pages and page > limit_pages: break
+                reason = stop_reason(budget)
+                if reason:
+                    # State is saved per page, the next run resumes here
+                    logger.info(f"{reason} during discovery at {category} page {page}")
+                    break
                 
-                self.tracker.update_page(category, page)
+                if not monitoring:
+                    self.tracker.update_page(category, page)
                 cat_url = f"{self.base_url}{category}"
                 fetch_url = cat_url if page == 1 else f"{cat_url.rstrip('/')}/page/{page}/"
                 
@@ -125,24 +171,33 @@ class SubzLkScraper:
                 if not response: break # End of category
                 
                 soup = BeautifulSoup(response.text, 'html.parser')
-                links = [a['href'] for a in soup.find_all('a', href=True) if 'sinhala-subtitle' in a['href'].lower()]
-                links = list(set(links)) # Deduplicate from page
+                anchors = {}
+                for a in soup.find_all('a', href=True):
+                    if 'sinhala-subtitle' in a['href'].lower():
+                        anchors.setdefault(canonicalize_url(a['href'], self.base_url), a)
+                links = list(anchors) # Deduplicate from page
+                harvested = self._harvest_listing(soup)
                 
                 new_on_page = 0
                 for link in links:
                     if link not in self.processed_urls:
                         if self.d1.enabled:
-                            self.d1.add_discovered_url(link, category, page, source=self.source)
+                            params = harvested.get(link, {})
+                            # Only rows that actually went in count - not ones already pending, backing off or dead
+                            total_new += self.d1.add_discovered_url(link, category, page, source=self.source,
+                                                                    sub_id=params.get('sub_id'), nonce=params.get('nonce'),
+                                                                    title=params.get('title'),
+                                                                    priority=queue_priority(page, monitoring, listing_post_date(anchors[link]))) or 0
                         new_on_page += 1
-                        total_new += 1
                 
-                logger.info(f"Category {category} Page {page}: Found {len(links)} links ({new_on_page} NEW)")
+                logger.info(f"Category {category} Page {page}: Found {len(links)} links ({new_on_page} NEW, {len(harvested)} with download params)")
                 
                 # Update tracker with newly discovered count
-                self.tracker.total_found = self.d1.get_pending_count(source=self.source)
+                if not monitoring:
+                    self.tracker.total_found = self.d1.get_pending_count(source=self.source)
                 
                 # Persistence: Save state every page
-                if self.d1.enabled:
+                if self.d1.enabled and not monitoring:
                     self.d1.save_state(category, page, source=self.source)
                 
                 # Only break if page is truly empty (no links at all)
@@ -159,70 +214,174 @@ class SubzLkScraper:
                 page += 1
                 time.sleep(random.uniform(0.5, 1.0)) # Faster discovery
 
-        logger.info(f"Discovery complete. Total new URLs found: {total_new}")
-        self.tracker.stop()
+        logger.info(f"Discovery complete. Total new URLs queued: {total_new}")
+        if not monitoring:
+            self.tracker.stop()
         return total_new
 
 
-    def _process_one(self, url):
+    def _harvest_listing(self, soup):
+        """
+        Download params (sub_id, nonce, title) that a listing page exposes next to its links.
+        Returns {detail_url: {...}}; empty when the listing has no download buttons.
+        """
+        harvested = {}
+        for btn in soup.find_all('a', class_='sub-download', href=True):
+            sub_id = re.search(r'sub_id=(\d+)', btn['href'])
+            nonce = re.search(r'nonce=([^&]+)', btn['href'])
+            if not sub_id or not nonce:
+                continue
+            # Walk up to the card that holds both the button and the detail link
+            card, link = btn.parent, None
+            for _ in range(5):
+                if card is None:
+                    break
+                link = card.find('a', href=lambda h: h and 'sinhala-subtitle' in h.lower())
+                if link:
+                    break
+                card = card.parent
+            if not link:
+                continue
+            title_node = card.find(['h2', 'h3'])
+            title = (title_node or link).get_text(strip=True).replace(' Sinhala Subtitle', '')
+            harvested[canonicalize_url(link['href'], self.base_url)] = {'sub_id': sub_id.group(1), 'nonce': nonce.group(1), 'title': title or None}
+        return harvested
+
+    def download_file(self, url, retries=3, inspect=None):
+        """
+        Stream a file to a spooled Download; None on failure, HTML pages or oversized files.
+        Raises DownloadSkipped when inspect() flags it as a duplicate before the body arrives.
+        """
+        try:
+            return stream_download(url, self.impersonation, headers={'User-Agent': 'Mozilla/5.0'},
+                                   retries=retries, inspect=inspect)
+        except DownloadRejected as e:
+            logger.warning(f"Download rejected ({e}): {url}")
+            return None
+
+    def _build_filename(self, title, ext):
+        clean_title = re.sub(r'[^\w\s-]', '', title).strip()[:100]
+        return f"{clean_title}{ext}"
+
+    def _precheck(self, title):
+        """inspect() hook for download_file: name and size duplicate check from the first chunk"""
+        def inspect(kind, size):
+            filename = self._build_filename(title, EXTENSIONS.get(kind, ".srt"))
+            reason, match = self.dedup.find_duplicate_before_download(filename, size)
+            return (reason, match, filename, title) if reason else None
+        return inspect
+
+    def _download_harvested(self, url, params):
+        """Fast path: call admin-ajax with harvested params. None if the nonce was rejected."""
+        dl_url = f"{self.base_url}/wp-admin/admin-ajax.php?action=sub_download&sub_id={params['sub_id']}&nonce={params['nonce']}"
+        download = self.download_file(dl_url, retries=1, inspect=self._precheck(params.get('title') or "Unknown"))
+        # WordPress answers an expired nonce with -1/0, an HTML page or a JSON error
+        if download and ('json' in download.content_type or download.head.strip() in (b'-1', b'0', b'')):
+            download.close()
+            download = None
+        if not download:
+            with self.lock:
+                self.fast_path_stats['rejected'] += 1
+            logger.info(f"Harvested nonce rejected, fetching detail page: {url}")
+            return None
+        with self.lock:
+            self.fast_path_stats['hits'] += 1
+        return download
+
+    def _fail(self, url, error, permanent=False):
+        """Schedule a retry for url (or dead-letter it) and report the item as failed"""
+        status = self.d1.record_failure(url, error, permanent=permanent, source=self.source) if self.d1.enabled else None
+        with self.lock:
+            self.retry_stats['dead' if status == 'dead' else 'retry_scheduled'] += 1
+            if status == 'dead':
+                # Dead letters are in processed_urls now too - don't queue them again this run
+                self.processed_urls.add(canonicalize_url(url))
+        return False
+
+    def _process_one(self, url, harvested=None):
         """Download and upload a single subtitle"""
+        download = None
         try:
             # 0. Basic Validation
             if not url or 'subz.lk' not in url.lower():
                 logger.warning(f"Skipping invalid/non-subz URL: {url}")
-                self.d1.add_processed_url(url, False, "Invalid Source", source=self.source)
-                return False
+                return self._fail(url, "invalid_source", permanent=True)
 
-            # 1. Fetch detail page
-            res = self.get_page(url)
-            if not res:
-                logger.warning(f"Link Failed (404 or Timeout): {url}")
-                return False
-            
-            soup = BeautifulSoup(res.text, 'html.parser')
-            title_node = soup.find('h2', class_='subz_title') or soup.find('h1')
-            title = title_node.get_text(strip=True).replace(' Sinhala Subtitle', '') if title_node else "Unknown"
-            
-            # 2. Extract Download Params
-            dl_btn = soup.find('a', class_='sub-download')
-            if not dl_btn:
-                logger.warning(f"No Download Button: {url} (Title: {title})")
-                return False
-            
-            href = dl_btn.get('href', '')
-            sub_id = re.search(r'sub_id=(\d+)', href)
-            nonce = re.search(r'nonce=([^&]+)', href)
-            
-            if not sub_id or not nonce:
-                logger.warning(f"Missing ID/Nonce in button: {url} (Title: {title})")
-                return False
-            
-            # 3. Download File
-            dl_url = f"{self.base_url}/wp-admin/admin-ajax.php?action=sub_download&sub_id={sub_id.group(1)}&nonce={nonce.group(1)}"
-            file_res = self.get_page(dl_url)
-            if not file_res:
-                logger.warning(f"File Download Failed: {dl_url}")
-                return False
+            # 1. Reuse a previous download of this URL (e.g. after a reset or failed upload)
+            file_content, cached = self.file_cache.get_by_url(url)
+            if file_content is not None:
+                download = Download.from_bytes(file_content, url)
+                title = cached.get('title') or "Unknown"
+                logger.info(f"Cache Hit: {url} (Title: {title})")
+            else:
+                # 1a. Download params harvested during discovery - skip the detail page
+                if harvested and harvested.get('sub_id') and harvested.get('nonce'):
+                    download = self._download_harvested(url, harvested)
+                    title = harvested.get('title') or "Unknown"
+
+                if download is None:
+                    # 1b. Fetch detail page
+                    res = self.get_page(url)
+                    if not res:
+                        logger.warning(f"Link Failed (404 or Timeout): {url}")
+                        return self._fail(url, "page_fetch_failed")
+                
+                    soup = BeautifulSoup(res.text, 'html.parser')
+                    title_node = soup.find('h2', class_='subz_title') or soup.find('h1')
+                    title = title_node.get_text(strip=True).replace(' Sinhala Subtitle', '') if title_node else "Unknown"
+                
+                    # 2. Extract Download Params
+                    dl_btn = soup.find('a', class_='sub-download')
+                    if not dl_btn:
+                        logger.warning(f"No Download Button: {url} (Title: {title})")
+                        return self._fail(url, "no_download_button", permanent=True)
+                
+                    href = dl_btn.get('href', '')
+                    sub_id = re.search(r'sub_id=(\d+)', href)
+                    nonce = re.search(r'nonce=([^&]+)', href)
+                
+                    if not sub_id or not nonce:
+                        logger.warning(f"Missing ID/Nonce in button: {url} (Title: {title})")
+                        return self._fail(url, "missing_download_params", permanent=True)
+                
+                    # 3. Download File
+                    dl_url = f"{self.base_url}/wp-admin/admin-ajax.php?action=sub_download&sub_id={sub_id.group(1)}&nonce={nonce.group(1)}"
+                    download = self.download_file(dl_url, inspect=self._precheck(title))
+                    if not download:
+                        logger.warning(f"File Download Failed: {dl_url}")
+                        return self._fail(url, "download_failed")
+                self.file_cache.put_file(download.open(), download.sha256, download.size, source_url=url, title=title)
+            content_sha256 = download.sha256
             
             # 4. Handle Metadata & File naming
-            clean_title = re.sub(r'[^\w\s-]', '', title).strip()[:100]
-            ext = ".zip" if file_res.content[:4] == b'PK\x03\x04' else ".rar" if file_res.content[:4] == b'Rar!' else ".srt"
-            filename = f"{clean_title}{ext}"
+            filename = self._build_filename(title, download.extension(".srt"))
             norm_name = normalize_filename(filename)
             
             logger.info(f"Downloading: {title} -> {filename}")
 
             # 5. Duplicate check
-            with self.lock:
-                if norm_name in self.existing_filenames:
-                    logger.info(f"Skipping Duplicate (Filename): {filename}")
+            reason, match = self.dedup.find_duplicate(filename, content_sha256, normalized=norm_name)
+            if reason:
+                logger.info(f"Skipping Duplicate ({reason.title()}): {filename} matches {match}")
+                self.d1.add_processed_url(url, True, title, source=self.source)
+                with self.lock:
+                    self.processed_urls.add(canonicalize_url(url))
+                return True
+
+            # Near-duplicate check on the subtitle text itself (re-zipped, re-timed, watermarked copies)
+            track_hashes, near_match, skip = self.dedup.check_near_duplicate(download.open())
+            if near_match:
+                if skip:
+                    logger.info(f"Skipping Near-Duplicate: {filename} (matches {near_match[0]}, distance {near_match[1]})")
                     self.d1.add_processed_url(url, True, title, source=self.source)
-                    self.processed_urls.add(url)
+                    with self.lock:
+                        self.processed_urls.add(canonicalize_url(url))
                     return True
+                logger.info(f"Near-Duplicate Flagged: {filename} (matches {near_match[0]}, distance {near_match[1]})")
 
             # 6. Telegram Upload
             caption = f"<b>{title}</b>\n\nSource: Subz.lk\nLink: {url}"
-            file_info = self.telegram.send_document(file_res.content, filename, caption)
+            file_info = self.telegram.send_document(download.open(), filename, caption)
             
             if file_info:
                 if self.d1.enabled:
@@ -231,66 +390,96 @@ class SubzLkScraper:
                         file_unique_id=file_info.get('file_unique_id', ''),
                         filename=filename,
                         normalized_filename=norm_name,
-                        file_size=len(file_res.content),
+                        file_size=download.size,
                         title=title,
                         source_url=url,
                         category="",
                         message_id=file_info.get('message_id', 0),
-                        source=self.source
+                        source=self.source,
+                        content_sha256=content_sha256,
+                        subtitle_simhash=encode_hashes(track_hashes)
                     )
                     self.d1.add_processed_url(url, True, title, source=self.source)
                     with self.lock:
-                        self.processed_urls.add(url)
-                        self.existing_filenames.add(norm_name)
+                        self.processed_urls.add(canonicalize_url(url))
                         self.stats['processed'] += 1
+                self.dedup.record_upload(filename, file_info['file_id'], content_sha256, track_hashes,
+                                        normalized=norm_name, size=download.size)
                 logger.info(f"Successfully uploaded: {filename}")
                 return True
             
             logger.warning(f"Telegram Upload Failed: {filename}")
-            return False
+            return self._fail(url, "upload_failed")
+        except DownloadSkipped as e:
+            reason, match, filename, title = e.result
+            logger.info(f"Skipping Duplicate ({reason.title()}) before download: {filename} matches {match}")
+            self.d1.add_processed_url(url, True, title, source=self.source)
+            with self.lock:
+                self.processed_urls.add(canonicalize_url(url))
+            return True
         except Exception as e:
             logger.error(f"Critical error processing {url}: {e}", exc_info=True)
-            return False
+            return self._fail(url, type(e).__name__)
+        finally:
+            if download:
+                download.close()
 
 
-    def process_queue_mode(self, limit=None):
-        """Step 2: Take pending URLs from D1 and process in parallel"""
+    def process_queue_mode(self, limit=None, budget=None, announce=True):
+        """
+        Step 2: Take pending URLs from D1 and process them on one long-lived worker pool.
+        budget (deadline.RunBudget) stops it in time to finish in-flight items and report.
+        announce=False keeps the run out of the Telegram chat (scheduled processing of a few new items).
+        """
         logger.info(">>> STARTING PROCESSING PHASE (Queue Worker) <<<")
-        processed_count = 0
+        # Rows claimed by a run that died mid-batch go back to the queue
+        if stop_reason(budget):
+            return 0
+        self.d1.release_stale_claims(source=self.source)
         
-        while True:
-            if limit and processed_count >= limit: break
-            
-            batch = self.d1.get_pending_urls(limit=self.batch_size, source=self.source)
-            if not batch: break
-            
-            urls = [r['url'] for r in batch if r.get('url')]
-            logger.info(f"Processing Batch: {len(urls)} items with {self.num_workers} workers")
-            
-            # Start tracker if not already running (e.g. if we jumped straight to processing)
-            if not self.tracker.thread or not self.tracker.thread.is_alive():
-                self.tracker.start(self.d1.get_pending_count(source=self.source))
-                
-            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-                futures = {executor.submit(self._process_one, u): u for u in urls}
-                for future in as_completed(futures):
-                    res = future.result()
-                    self.tracker.update(success=res)
-                    processed_count += 1
-            
-            # Force log flush for Render
-            sys.stdout.flush()
-            time.sleep(random.uniform(2, 5)) # Batch cooldown
-            
-        self.tracker.stop()
+        pending = self.d1.get_pending_count(source=self.source, due_only=True)
+        if not pending:
+            return 0
+        # Start tracker if not already running (e.g. if we jumped straight to processing)
+        if not self.tracker.thread or not self.tracker.thread.is_alive():
+            self.tracker.start(pending, announce=announce)
+        
+        logger.info(f"Processing {pending} pending items with {self.num_workers} workers")
+        self.work_pool = WorkPool(
+            fetch_batch=lambda n: self.d1.claim_pending_urls(limit=n, source=self.source),
+            process=lambda row: self._process_one(row['url'], row if row.get('sub_id') else None),
+            num_workers=self.num_workers,
+            batch_size=self.batch_size,
+            on_result=lambda res: self.tracker.update(success=res),
+            name=self.source,
+            budget=budget
+        )
+        self.autoscaler = AutoScaler(
+            self.work_pool, self.min_workers, self.max_workers,
+            throttle_count=lambda: self.telegram.throttled + self.hedger.stats['throttled']
+        )
+        self.autoscaler.start()
+        try:
+            processed_count = self.work_pool.run(limit=limit)
+        finally:
+            self.autoscaler.stop()
+        leftovers = self.work_pool.take_leftovers()
+        if leftovers:
+            # Claimed by the prefetch but never started - straight back to the queue, not after the stale-claim timeout
+            self.d1.release_claims([row['url'] for row in leftovers], source=self.source)
+            logger.info(f"Stopped early: {len(leftovers)} claimed URLs returned to the queue")
+        
+        # Force log flush for Render
+        sys.stdout.flush()
+        self.tracker.stop(note=stop_reason(budget))
         return processed_count
 
-    def scrape_all_categories(self, limit=None):
+    def scrape_all_categories(self, limit=None, budget=None):
         """Unified Master Method - Full Historical Scrape"""
         logger.info(">>> STARTING FULL SCRAPE (Discovery + Processing) <<<")
         
         # 1. Discover everything - crawl ALL pages until 404 or empty
-        new_discovered = self.crawl_only()  # No limit_pages parameter for full scrape
+        new_discovered = self.crawl_only(budget=budget)  # No limit_pages parameter for full scrape
         
         # 2. Update stats and show pending queue size
         self.stats['discovered'] = self.d1.get_discovered_urls_count(source=self.source)
@@ -300,16 +489,21 @@ class SubzLkScraper:
         logger.info(f"Total discovered URLs: {self.stats['discovered']}, Pending to process: {pending}")
         
         # 3. Process the queue
-        return self.process_queue_mode(limit=limit)
+        return self.process_queue_mode(limit=limit, budget=budget)
 
 
-    def monitor_new_subtitles(self):
+    def monitor_new_subtitles(self, budget=None):
         """Quick check of homepage for immediate updates"""
         logger.info("Monitoring homepage for new subtitles...")
-        return self.crawl_only(limit_pages=1) # Just check first page of categories
+        return self.crawl_only(limit_pages=1, monitoring=True, budget=budget) # Just check first page of categories
 
 if __name__ == "__main__":
-    # Test block
+    parser = argparse.ArgumentParser(description="subz.lk scraper (D1 queue)")
+    parser.add_argument('--limit', type=int, default=10, help="items to process (0 for no limit)")
+    parser.add_argument('--deadline', type=parse_duration,
+                        help="time budget for the run, e.g. 340m or 5h40m")
+    args = parser.parse_args()
+    get_shutdown().install()
     s = SubzLkScraper(os.getenv('TELEGRAM_BOT_TOKEN'), os.getenv('TELEGRAM_CHAT_ID'))
     s.initialize()
-    s.scrape_all_categories(limit=10)
+    s.scrape_all_categories(limit=args.limit or None, budget=RunBudget(args.deadline) if args.deadline else None)
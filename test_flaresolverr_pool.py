@@ -0,0 +1,105 @@
+"""
+FlareSolverrPool against the local FlareSolverr stand-in (flaresolverr_stub.py)
+Run with: python -m pytest -q test_flaresolverr_pool.py
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from flaresolverr import FlareSolverrPool
+from flaresolverr_stub import start_stub_server
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = b'<html><title>ok</title></html>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def page_url():
+    """A page for the stub to 'solve', served locally"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+def make_stub(challenge_rate=0.0):
+    server, endpoint = start_stub_server(challenge_rate=challenge_rate)
+    return server, endpoint, server.RequestHandlerClass.state
+
+
+def test_checkout_and_return():
+    server, endpoint, state = make_stub()
+    pool = FlareSolverrPool(endpoint, size=2, health_interval=3600)
+    try:
+        assert pool.start() == 2
+        assert len(state.sessions) == 2
+        with pool.session() as slot:
+            assert slot['id'] in state.sessions
+            assert pool.idle.qsize() == 1
+        assert pool.idle.qsize() == 2
+    finally:
+        pool.close()
+        server.shutdown()
+
+
+def test_recycles_after_max_requests(page_url):
+    server, endpoint, state = make_stub()
+    pool = FlareSolverrPool(endpoint, size=1, max_requests=2, health_interval=3600)
+    try:
+        pool.start()
+        first_id = pool.sessions[0]['id']
+        assert pool.request_get(page_url)['status'] == 200
+        assert pool.stats['recycled'] == 0
+        assert pool.request_get(page_url)['status'] == 200
+        assert pool.stats['recycled'] == 1
+        assert pool.sessions[0]['id'] != first_id
+        assert first_id not in state.sessions
+        assert pool.sessions[0]['requests'] == 0
+    finally:
+        pool.close()
+        server.shutdown()
+
+
+def test_recycles_after_max_failures(page_url):
+    server, endpoint, state = make_stub(challenge_rate=1.0)
+    pool = FlareSolverrPool(endpoint, size=1, max_failures=2, health_interval=3600)
+    try:
+        pool.start()
+        first_id = pool.sessions[0]['id']
+        assert pool.request_get(page_url) is None
+        assert pool.sessions[0]['id'] == first_id
+        assert pool.request_get(page_url) is None
+        assert pool.stats['recycled'] == 1
+        assert pool.stats['failures'] == 2
+        assert pool.sessions[0]['id'] != first_id
+        assert pool.sessions[0]['failures'] == 0
+    finally:
+        pool.close()
+        server.shutdown()
+
+
+def test_close_destroys_every_session():
+    server, endpoint, state = make_stub()
+    pool = FlareSolverrPool(endpoint, size=3, health_interval=3600)
+    try:
+        pool.start()
+        assert len(state.sessions) == 3
+        pool.close()
+        assert state.sessions == set()
+        assert state.stats['destroyed'] == 3
+        # Safe to call again
+        pool.close()
+        assert state.stats['destroyed'] == 3
+    finally:
+        server.shutdown()
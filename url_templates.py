@@ -0,0 +1,157 @@
+"""
+Learned interstitial -> file URL templates.
+When an intermediate download page links to a file URL that is built from parts of the
+page's own URL (e.g. /sub-download/12345/ -> /files/12345.zip), remember the mapping so the
+file can be requested directly next time, skipping the interstitial fetch. A speculative
+fetch can't tell whether the file it got belongs to this page, so every VERIFY_EVERY-th use
+of a template goes through the interstitial instead, and a template the interstitial
+disagrees with is dropped.
+"""
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SEPARATORS = re.compile(r'([/?&=.\-_])')
+
+# A template must be confirmed by this many downloads before it is used
+MIN_CONFIRMATIONS = 2
+# Every this many predictions for a template, skip it and let the interstitial re-check it
+VERIFY_EVERY = 10
+
+
+def _split(url):
+    return _SEPARATORS.split(url)
+
+
+def _is_id(part):
+    """Numeric ids and long hash-like tokens; words like 'download' stay constant"""
+    return (len(part) >= 2 and part.isdigit()) or (len(part) >= 8 and any(c.isdigit() for c in part))
+
+
+class DownloadTemplateLearner:
+    def __init__(self, path=None):
+        self.path = path or os.getenv('ZOOM_DL_TEMPLATES', '.zoom_download_templates.json')
+        self.lock = threading.Lock()
+        # shape -> {'template', 'confirmations', 'hits', 'misses'}
+        self.templates = {}
+        self.stats = {'hits': 0, 'misses': 0, 'learned': 0, 'verified': 0, 'retired': 0}
+        self.last_save = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.templates = json.load(f)
+            logger.info(f"Loaded {len(self.templates)} download URL templates")
+        except Exception as e:
+            logger.warning(f"Download templates unreadable, starting fresh: {e}")
+            self.templates = {}
+
+    def _save(self):
+        with self.lock:
+            data = json.dumps(self.templates)
+            self.last_save = time.time()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save download templates: {e}")
+
+    def _derive(self, page_url, file_url):
+        """
+        Express file_url in terms of page_url's parts.
+        Returns (shape, template) or (None, None) when the file URL can't be derived from the page URL.
+        """
+        parts = _split(page_url)
+        # Only id-like parts vary between pages; longest first so '12345' wins over '123'
+        candidates = sorted((i for i, p in enumerate(parts) if _is_id(p)), key=lambda i: -len(parts[i]))
+        template = file_url.replace('{', '{{').replace('}', '}}')
+        variables = set()
+        for i in candidates:
+            token = parts[i]
+            if token in template and not any(token in parts[v] for v in variables):
+                template = template.replace(token, f'{{{i}}}')
+                variables.add(i)
+        if not variables:
+            return None, None
+        shape = ''.join('*' if i in variables else p for i, p in enumerate(parts))
+        return shape, template
+
+    def _entry_for(self, parts):
+        """Template entry whose shape fits these URL parts (caller holds the lock)"""
+        shape = self._shape_for(parts)
+        return self.templates[shape] if shape else None
+
+    def _shape_for(self, parts):
+        """Shape key of the template entry that fits these URL parts (caller holds the lock)"""
+        for shape, entry in self.templates.items():
+            shape_parts = _split(shape.replace('*', '\x00'))
+            if len(shape_parts) == len(parts) and all(s == '\x00' or s == p for s, p in zip(shape_parts, parts)):
+                return shape
+        return None
+
+    def predict(self, page_url):
+        """
+        Direct file URL for page_url if a confirmed template fits, else None.
+        Also None on every VERIFY_EVERY-th use, so the caller's interstitial download
+        (and learn()) checks the template against the real link.
+        """
+        parts = _split(page_url)
+        with self.lock:
+            entry = self._entry_for(parts)
+            # Templates that keep missing (site changed its file layout) are retired
+            if not entry or entry['confirmations'] < MIN_CONFIRMATIONS or entry['misses'] > entry['hits'] + 3:
+                return None
+            entry['uses'] = entry.get('uses', 0) + 1
+            if entry['uses'] % VERIFY_EVERY == 0:
+                self.stats['verified'] += 1
+                return None
+            try:
+                return entry['template'].format(*parts)
+            except (IndexError, KeyError, ValueError):
+                return None
+
+    def learn(self, page_url, file_url):
+        """
+        Record a successful interstitial download. A template for this page that would have
+        predicted a different file is dropped - its speculative hits may have been the wrong file.
+        """
+        shape, template = self._derive(page_url, file_url)
+        with self.lock:
+            known = self._shape_for(_split(page_url))
+            if known and (known != shape or self.templates[known]['template'] != template):
+                logger.warning(f"Download template {known} disagrees with {page_url} -> {file_url}, retiring it")
+                del self.templates[known]
+                self.stats['retired'] += 1
+            if not shape:
+                return
+            entry = self.templates.get(shape)
+            if entry and entry['template'] == template:
+                entry['confirmations'] += 1
+            else:
+                self.stats['learned'] += 1
+                logger.info(f"Learned download template: {shape} -> {template}")
+                self.templates[shape] = {'template': template, 'confirmations': 1, 'hits': 0, 'misses': 0}
+            due = time.time() - self.last_save > 30
+        if due:
+            self._save()
+
+    def record(self, page_url, hit):
+        """Count a speculative fetch; misses eventually retire a template"""
+        with self.lock:
+            self.stats['hits' if hit else 'misses'] += 1
+            entry = self._entry_for(_split(page_url))
+            if entry:
+                entry['hits' if hit else 'misses'] += 1
+
+    def flush(self):
+        self._save()
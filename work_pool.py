@@ -0,0 +1,190 @@
+"""
+Long-lived worker pool fed by a prefetching queue.
+Replaces a fresh ThreadPoolExecutor per batch: the next page of work is fetched in the
+background while the current one is still being processed, so workers never stand idle
+waiting for a batch's slowest item or for the next page to arrive. Busy and idle worker
+time are measured so the effect shows up in /status. The pool can be resized while it
+runs (see autoscale.py), and stops early for a time budget (deadline.py) or a shutdown
+signal (shutdown.py).
+"""
+import queue
+import threading
+import time
+import logging
+from shutdown import stop_reason
+
+logger = logging.getLogger(__name__)
+
+
+class WorkPool:
+    def __init__(self, fetch_batch, process, num_workers, batch_size=50, on_result=None, name="worker", budget=None):
+        """
+        fetch_batch(n) returns up to n new items ([] once the source is drained),
+        process(item) returns a truthy value on success, on_result(result) is called after each item.
+        budget (deadline.RunBudget) or a shutdown request stops the pool from starting new items;
+        whatever was fetched but not started is handed back by take_leftovers().
+        """
+        self.fetch_batch = fetch_batch
+        self.process = process
+        self.on_result = on_result
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.name = name
+        self.budget = budget
+
+        self.items = queue.Queue()
+        self.lock = threading.Lock()
+        self.drained = threading.Event()
+        self.stop_event = threading.Event()
+        self.workers = []
+        self.live = 0
+        self.claimed = 0
+        # Counters since the last take_window() call, for the autoscaler
+        self.window = {'completed': 0, 'errors': 0, 'busy': 0.0, 'idle': 0.0}
+        self.stats = {
+            'processed': 0, 'succeeded': 0, 'batches': 0,
+            'busy_seconds': 0.0, 'idle_seconds': 0.0, 'prefetch_seconds': 0.0
+        }
+
+    def _feed(self, limit):
+        """Top the queue up with the next page while the workers are still busy with the current one"""
+        while not self.stop_event.is_set():
+            if stop_reason(self.budget):
+                break
+            # Fetch the next page once the queue falls below this, well before it runs dry
+            if self.items.qsize() >= max(self.num_workers * 2, self.batch_size // 2):
+                time.sleep(0.2)
+                continue
+            want = self.batch_size if not limit else min(self.batch_size, limit - self.claimed)
+            if want <= 0:
+                break
+            started = time.time()
+            batch = self.fetch_batch(want)
+            with self.lock:
+                self.stats['prefetch_seconds'] += time.time() - started
+                if batch:
+                    self.stats['batches'] += 1
+            if not batch:
+                break
+            self.claimed += len(batch)
+            for item in batch:
+                self.items.put(item)
+        self.drained.set()
+
+    def _work(self):
+        retired = False
+        try:
+            retired = self._work_loop()
+        finally:
+            if not retired:
+                with self.lock:
+                    self.live -= 1
+
+    def _work_loop(self):
+        """Returns True when the worker retired because the pool shrank (live already decremented)"""
+        while not self.stop_event.is_set():
+            with self.lock:
+                # Shrunk by resize() - surplus workers retire between items, one decrement each,
+                # so a shrink by one retires exactly one worker
+                if self.live > self.num_workers:
+                    self.live -= 1
+                    return True
+            if stop_reason(self.budget):
+                return
+            waited = time.time()
+            try:
+                item = self.items.get(timeout=0.5)
+            except queue.Empty:
+                with self.lock:
+                    self.stats['idle_seconds'] += time.time() - waited
+                    self.window['idle'] += time.time() - waited
+                if self.drained.is_set() and self.items.empty():
+                    return
+                continue
+
+            started = time.time()
+            try:
+                result = self.process(item)
+            except Exception as e:
+                logger.error(f"{self.name} failed on {item}: {e}", exc_info=True)
+                result = False
+            if self.budget:
+                self.budget.observe(time.time() - started)
+            with self.lock:
+                self.stats['idle_seconds'] += started - waited
+                self.window['idle'] += started - waited
+                self.stats['busy_seconds'] += time.time() - started
+                self.window['busy'] += time.time() - started
+                self.stats['processed'] += 1
+                self.window['completed'] += 1
+                if result:
+                    self.stats['succeeded'] += 1
+                else:
+                    self.window['errors'] += 1
+                if self.on_result:
+                    self.on_result(result)
+
+    def run(self, limit=None):
+        """Process items until the source is drained (or limit items were taken); returns how many were processed"""
+        feeder = threading.Thread(target=self._feed, args=(limit,), name=f"{self.name}-feed", daemon=True)
+        feeder.start()
+        self.resize(self.num_workers)
+        while True:
+            with self.lock:
+                alive = [worker for worker in self.workers if worker.is_alive()]
+            if not alive:
+                break
+            alive[0].join(timeout=1)
+        self.stop_event.set()
+        feeder.join(timeout=5)
+
+        status = self.get_status()
+        logger.info(
+            f"{self.name} pool done: {status['processed']} items in {status['batches']} batches, "
+            f"workers {status['utilization']:.0%} busy ({status['idle_seconds']:.0f}s idle, "
+            f"{status['prefetch_seconds']:.0f}s of queue fetches overlapped with work)"
+        )
+        return status['processed']
+
+    def resize(self, num_workers):
+        """Grow immediately; shrinking lets surplus workers finish their current item first"""
+        with self.lock:
+            self.num_workers = max(1, num_workers)
+            if self.stop_event.is_set() or (self.drained.is_set() and self.items.empty()):
+                return
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            while self.live < self.num_workers:
+                self.live += 1
+                worker = threading.Thread(target=self._work, name=f"{self.name}-{len(self.workers)}", daemon=True)
+                self.workers.append(worker)
+                worker.start()
+
+    def take_leftovers(self):
+        """Items fetched but never started (the run stopped early) - for the caller to put back"""
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self.items.get_nowait())
+            except queue.Empty:
+                return leftovers
+
+    def take_window(self):
+        """Counters since the previous call (completed, errors, worker busy and idle time) - and reset them"""
+        with self.lock:
+            window = self.window
+            self.window = {'completed': 0, 'errors': 0, 'busy': 0.0, 'idle': 0.0}
+        return window
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_status(self):
+        with self.lock:
+            status = dict(self.stats)
+        total = status['busy_seconds'] + status['idle_seconds']
+        status['utilization'] = round(status['busy_seconds'] / total, 3) if total else 0.0
+        status['workers'] = self.live
+        status['queued'] = self.items.qsize()
+        for key in ('busy_seconds', 'idle_seconds', 'prefetch_seconds'):
+            status[key] = round(status[key], 1)
+        return status
@@ -4,15 +4,28 @@ Zoom.lk Dedicated Subtitle Scraper
 from curl_cffi import requests as curl_requests
 from bs4 import BeautifulSoup
 import os
+import atexit
 import time
 import logging
 import random
 import re
 import threading
 import sys
+import argparse
 from urllib.parse import urljoin
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from scraper_utils import CloudflareD1, TelegramUploader, ProgressTracker, normalize_filename
+from scraper_utils import CloudflareD1, TelegramUploader, ProgressTracker, normalize_filename, canonicalize_url, listing_post_date, queue_priority
+from file_cache import get_file_cache
+from subtitle_fingerprint import encode_hashes
+from dedup_service import get_dedup_service
+from impersonation import get_impersonation_selector
+from single_flight import get_single_flight
+from work_pool import WorkPool
+from autoscale import AutoScaler
+from hedging import get_hedged_fetcher, FETCH_TIMEOUT
+from deadline import RunBudget, parse_duration
+from shutdown import get_shutdown, stop_reason
+from downloads import Download, DownloadRejected, DownloadSkipped, EXTENSIONS, stream_download
+from url_templates import DownloadTemplateLearner
 
 # Force logs to stdout
 logging.basicConfig(
@@ -24,31 +37,47 @@ logger = logging.getLogger(__name__)
 
 class ZoomLkScraper:
     def __init__(self, telegram_token, telegram_chat_id, 
-                 cf_account_id=None, cf_api_token=None, d1_database_id=None):
+                 cf_account_id=None, cf_api_token=None, d1_database_id=None, dedup=None):
         self.base_url = 'https://zoom.lk'
         self.source = "zoom"
         self.num_workers = 10 # Increased for speed
         self.batch_size = 50
+        # The autoscaler moves the worker count between these while a queue run is going
+        self.min_workers, self.max_workers = 2, 20
         self.lock = threading.Lock()
         
-        # Browser impersonation
-        self.browser_versions = ["chrome110", "chrome116", "chrome120", "chrome124"]
+        # Browser impersonation profile, picked per host from observed success
+        self.impersonation = get_impersonation_selector()
+        self.single_flight = get_single_flight()
+        self.hedger = get_hedged_fetcher()
         
         # D1 Setup
         self.cf_account_id = cf_account_id or os.getenv('CF_ACCOUNT_ID')
         self.cf_api_token = cf_api_token or os.getenv('CF_API_TOKEN')
         self.d1_database_id = d1_database_id or os.getenv('D1_DATABASE_ID')
-        self.d1 = CloudflareD1(self.cf_account_id, self.cf_api_token, self.d1_database_id)
+        self.d1 = CloudflareD1(self.cf_account_id, self.cf_api_token, self.d1_database_id, tenant=self.source)
         
         # Telegram & Tracker
-        self.telegram = TelegramUploader(telegram_token, telegram_chat_id)
+        self.telegram = TelegramUploader(telegram_token, telegram_chat_id, tenant=self.source)
         self.tracker = ProgressTracker(self.telegram, interval=120)
         
+        # Local copy of every downloaded file, shared by all scrapers
+        self.file_cache = get_file_cache()
+        
+        # Duplicate indexes across all sources, shared by all scrapers
+        self.dedup = dedup or get_dedup_service()
+        
+        # Interstitial -> file URL patterns learned from past downloads
+        self.download_templates = DownloadTemplateLearner()
+        atexit.register(self.download_templates.flush)
+        
         # Runtime State
         self.stats = {'discovered': 0, 'processed': 0}
+        self.work_pool = None
+        self.autoscaler = None
+        self.retry_stats = {'retry_scheduled': 0, 'dead': 0}
         self.initialization_status = "pending"
         self.processed_urls = set()
-        self.existing_filenames = set()
 
     def initialize(self):
         """Perform all heavy D1 operations"""
@@ -59,11 +88,14 @@ class ZoomLkScraper:
             
             self.initialization_status = "loading_d1_history"
             if self.d1.enabled:
-                self.processed_urls = self.d1.get_all_processed_urls(source=self.source) or set()
+                self.processed_urls = {canonicalize_url(u) for u in self.d1.get_all_processed_urls(source=self.source) or ()}
                 # Also load excluded URLs (invalid/failed ones) to avoid re-looping
                 # (Assuming get_all_processed_urls covers them if we save them there)
                 
-                self.existing_filenames = self.d1.get_all_normalized_filenames(source=self.source) or set()
+                if not self.dedup.load_cloudflare_d1(self.d1):
+                    # Processing against a partial duplicate index would upload duplicates
+                    self.initialization_status = "error: duplicate index not loaded"
+                    return False
                 self.stats['discovered'] = self.d1.get_discovered_urls_count(source=self.source)
                 self.stats['processed'] = self.d1.get_processed_urls_count(source=self.source)
                 
@@ -76,33 +108,74 @@ class ZoomLkScraper:
             return False
 
     def get_page(self, url, retries=6):
+        """Fetch page; concurrent requests for the same canonical URL share one fetch"""
+        return self.single_flight.do(canonicalize_url(url), lambda: self._get_page(url, retries))
+
+    def _get_page(self, url, retries):
         """Fetch page with browser impersonation"""
         for attempt in range(retries):
+            target = self.impersonation.choose(url)
+            started = time.time()
             try:
-                response = curl_requests.get(
+                response = self.hedger.get(url, lambda: curl_requests.get(
                     url, 
-                    impersonate=random.choice(self.browser_versions),
-                    timeout=30,
+                    impersonate=target,
+                    timeout=FETCH_TIMEOUT,
                     headers={'User-Agent': 'Mozilla/5.0'}
-                )
+                ))
+                self.impersonation.record_response(url, target, response, time.time() - started)
                 if response.status_code == 200:
                     return response
                 if response.status_code == 404:
                     return None
             except Exception as e:
+                self.impersonation.record(url, target, 'error')
                 logger.warning(f"Retry {attempt+1}/{retries} for {url}: {e}")
                 time.sleep(random.uniform(2, 5))
         return None
 
-    def crawl_only(self, limit_pages=None):
-        """Discovery Phase: Crawl categories"""
+    def download_file(self, url, retries=3, allow_html=False, inspect=None):
+        """
+        Stream a file to a spooled Download; None on failure, HTML pages or oversized files.
+        Raises DownloadSkipped when inspect() flags it as a duplicate before the body arrives.
+        """
+        try:
+            return stream_download(url, self.impersonation, headers={'User-Agent': 'Mozilla/5.0'},
+                                   retries=retries, allow_html=allow_html, inspect=inspect)
+        except DownloadRejected as e:
+            logger.warning(f"Download rejected ({e}): {url}")
+            return None
+
+    def _build_filename(self, title, ext, url):
+        # Sanitize title but keep Sinhala characters (Unicode aware)
+        # Remove purely illegal filename characters: \ / : * ? " < > |
+        clean_title = re.sub(r'[\\/*?:"<>|]', '', title).strip()
+        # If title is still too long or empty, handle it
+        clean_title = clean_title[:200]
+        if not clean_title or clean_title == "Unknown":
+            # Fallback: Use last part of URL if title failed
+            clean_title = url.rstrip('/').split('/')[-1] or f"subtitle_{int(time.time())}"
+        return f"{clean_title}{ext}"
+
+    def _precheck(self, title, url):
+        """inspect() hook for download_file: name and size duplicate check from the first chunk"""
+        def inspect(kind, size):
+            filename = self._build_filename(title, EXTENSIONS.get(kind, ".srt"), url)
+            reason, match = self.dedup.find_duplicate_before_download(filename, size)
+            return (reason, match, filename, title) if reason else None
+        return inspect
+
+    def crawl_only(self, limit_pages=None, monitoring=False, budget=None):
+        """Discovery Phase: Crawl categories. monitoring=True queues finds ahead of the backfill"""
         logger.info(">>> STARTING DISCOVERY PHASE (Crawl Only) <<<")
         categories = ["/category/films/", "/category/tv-series/"]
         
-        self.tracker.start(0) 
+        # Monitoring runs alongside a backfill: it leaves the backfill's tracker and resume point alone
+        if not monitoring:
+            self.tracker.start(0)
         
         # Load resume state
-        resume_cat, resume_page = self.d1.get_state(source=self.source) if self.d1.enabled else (None, None)
+        resume_cat, resume_page = self.d1.get_state(source=self.source) if self.d1.enabled and not monitoring else (None, None)
         start_tracking = False if resume_cat else True
         
         total_new = 0
@@ -117,8 +190,14 @@ class ZoomLkScraper:
             
             while True:
                 if limit_pages and page > limit_pages: break
+                reason = stop_reason(budget)
+                if reason:
+                    # State is saved per page, the next run resumes here
+                    logger.info(f"{reason} during discovery at {category} page {page}")
+                    break
                 
-                self.tracker.update_page(category, page)
+                if not monitoring:
+                    self.tracker.update_page(category, page)
                 cat_url = f"{self.base_url}{category}"
                 fetch_url = cat_url if page == 1 else f"{cat_url.rstrip('/')}/page/{page}/"
                 
@@ -128,17 +207,19 @@ class ZoomLkScraper:
                 soup = BeautifulSoup(response.text, 'html.parser')
                 # Zoom.lk selector: h3.entry-title a (titles) or maybe a.td-image-wrap (thumbnails)
                 # Using h3.entry-title a is usually safer for text
-                links = [a['href'] for a in soup.select('h3.entry-title a')]
+                anchors = soup.select('h3.entry-title a')
                 
                 # Filter useful links (ensure they look like posts, not ads)
-                clean_links = []
-                for link in links:
-                    if link.startswith(self.base_url) and '/category/' not in link and '/page/' not in link:
-                         clean_links.append(link)
-                    elif link.startswith('/') and '/category/' not in link:
-                         clean_links.append(f"{self.base_url}{link}")
+                posted = {}
+                for a in anchors:
+                    link = a['href']
+                    if link.startswith('/') and '/category/' not in link:
+                        link = f"{self.base_url}{link}"
+                    elif not (link.startswith(self.base_url) and '/category/' not in link and '/page/' not in link):
+                        continue
+                    posted.setdefault(canonicalize_url(link), listing_post_date(a))
 
-                clean_links = list(set(clean_links))
+                clean_links = list(posted)
                 
                 new_on_page = 0
                 new_items_batch = []
@@ -146,19 +227,19 @@ class ZoomLkScraper:
                     if link not in self.processed_urls:
                         if self.d1.enabled:
                             # Add to batch list instead of individual calls
-                            new_items_batch.append((link, category, page))
+                            new_items_batch.append((link, category, page, queue_priority(page, monitoring, posted[link])))
                         new_on_page += 1
-                        total_new += 1
                 
-                # Batch Insert
+                # Batch Insert - only rows that actually went in count, not ones already pending, backing off or dead
                 if self.d1.enabled and new_items_batch:
-                    self.d1.add_discovered_urls_batch(new_items_batch, source=self.source)
+                    total_new += self.d1.add_discovered_urls_batch(new_items_batch, source=self.source)
 
                 logger.info(f"Category {category} Page {page}: Found {len(clean_links)} links ({new_on_page} NEW)")
                 
-                self.tracker.total_found = self.d1.get_pending_count(source=self.source)
+                if not monitoring:
+                    self.tracker.total_found = self.d1.get_pending_count(source=self.source)
                 
-                if self.d1.enabled:
+                if self.d1.enabled and not monitoring:
                     self.d1.save_state(category, page, source=self.source)
                 
                 if not clean_links:
@@ -172,135 +253,155 @@ class ZoomLkScraper:
                 page += 1
                 time.sleep(random.uniform(0.1, 0.3)) # Reduced sleep for speed
 
-        logger.info(f"Discovery complete. Total new URLs found: {total_new}")
-        self.tracker.stop()
+        logger.info(f"Discovery complete. Total new URLs queued: {total_new}")
+        if not monitoring:
+            self.tracker.stop()
         return total_new
 
+    def _fail(self, url, error, permanent=False):
+        """Schedule a retry for url (or dead-letter it) and report the item as failed"""
+        status = self.d1.record_failure(url, error, permanent=permanent, source=self.source) if self.d1.enabled else None
+        with self.lock:
+            self.retry_stats['dead' if status == 'dead' else 'retry_scheduled'] += 1
+            if status == 'dead':
+                # Dead letters are in processed_urls now too - don't queue them again this run
+                self.processed_urls.add(canonicalize_url(url))
+        return False
+
     def _process_one(self, url):
         """Download and upload a single subtitle"""
+        download = None
         try:
-            # 1. Fetch detail page
-            res = self.get_page(url)
-            if not res:
-                self.d1.add_processed_url(url, False, "404/Fail", source=self.source)
-                return False
+            # 1. Reuse a previous download of this URL (e.g. after a reset or failed upload)
+            file_content, cached = self.file_cache.get_by_url(url)
+            if file_content is not None:
+                download = Download.from_bytes(file_content, url)
+                title = cached.get('title') or "Unknown"
+                logger.info(f"Cache Hit: {url} (Title: {title})")
+            else:
+                # 1b. Fetch detail page
+                res = self.get_page(url)
+                if not res:
+                    return self._fail(url, "page_fetch_failed")
             
-            # Explicitly decode as UTF-8 to handle Sinhala characters
-            html_content = res.content.decode('utf-8', errors='replace')
-            soup = BeautifulSoup(html_content, 'html.parser')
+                # Explicitly decode as UTF-8 to handle Sinhala characters
+                html_content = res.content.decode('utf-8', errors='replace')
+                soup = BeautifulSoup(html_content, 'html.parser')
             
-            # Try new selector first (h1.tdb-title-text), fall back to old (h1.entry-title)
-            title_node = soup.select_one('h1.tdb-title-text') or soup.select_one('h1.entry-title')
-            title = title_node.get_text(strip=True) if title_node else "Unknown"
+                # Try new selector first (h1.tdb-title-text), fall back to old (h1.entry-title)
+                title_node = soup.select_one('h1.tdb-title-text') or soup.select_one('h1.entry-title')
+                title = title_node.get_text(strip=True) if title_node else "Unknown"
             
-            # 2. Find Download Button
-            # Zoom.lk typically has a button with class 'download-button'
-            # Or inspect link with 'sub-download' in href
-            dl_btn = soup.select_one('a.download-button')
+                # 2. Find Download Button
+                # Zoom.lk typically has a button with class 'download-button'
+                # Or inspect link with 'sub-download' in href
+                dl_btn = soup.select_one('a.download-button')
             
-            # Fallback search if class not found
-            if not dl_btn:
-                for a in soup.find_all('a', href=True):
-                    if 'sub-download' in a['href']:
-                        dl_btn = a
-                        break
+                # Fallback search if class not found
+                if not dl_btn:
+                    for a in soup.find_all('a', href=True):
+                        if 'sub-download' in a['href']:
+                            dl_btn = a
+                            break
             
-            if not dl_btn:
-                logger.warning(f"No Download Button: {url} (Title: {title})")
-                self.d1.add_processed_url(url, False, "No DL Button", source=self.source)
-                return False
+                if not dl_btn:
+                    logger.warning(f"No Download Button: {url} (Title: {title})")
+                    return self._fail(url, "no_download_button", permanent=True)
                 
-            dl_page_url = dl_btn['href']
+                dl_page_url = dl_btn['href']
             
-            # 3. Visit Download Page (if it's a redirect/intermediate page)
-            # Zoom.lk often has an intermediate page like /sub-download/12345/
-            # 3. Visit Download Page / Download File
-            logger.info(f"Visiting Download Page: {dl_page_url}")
-            dl_res = self.get_page(dl_page_url)
-            if not dl_res:
-                return False
+                # 2b. Speculative direct fetch when a learned template predicts the file URL
+                # (now and then predict() declines so the download page below re-checks the template)
+                speculative_url = self.download_templates.predict(dl_page_url)
+                if speculative_url:
+                    download = self.download_file(speculative_url, retries=1, inspect=self._precheck(title, url))
+                    if download:
+                        self.download_templates.record(dl_page_url, hit=True)
+                        logger.info(f"Speculative Download Hit: {speculative_url}")
+                    else:
+                        self.download_templates.record(dl_page_url, hit=False)
+                        logger.info(f"Speculative Download Miss: {speculative_url} - using download page")
 
-            # Initialize variables
-            file_content = None
-            final_dl_link = None
-            dl_soup = None
+                if download is None:
+                    # 3. Visit Download Page (if it's a redirect/intermediate page)
+                    # Zoom.lk often has an intermediate page like /sub-download/12345/
+                    # 3. Visit Download Page / Download File
+                    # Streamed too, since it is sometimes the file itself
+                    logger.info(f"Visiting Download Page: {dl_page_url}")
+                    dl_res = self.download_file(dl_page_url, allow_html=True, inspect=self._precheck(title, url))
+                    if not dl_res:
+                        return self._fail(url, "download_page_failed")
 
-            # Check content type
-            content_type = dl_res.headers.get('Content-Type', '').lower()
+                    # Check content type
+                    content_type = dl_res.content_type
             
-            if 'text/html' not in content_type:
-                # Direct download detected
-                file_content = dl_res.content
-                final_dl_link = dl_res.url
-                logger.info(f"Direct download detected: {final_dl_link} ({content_type})")
-            else:
-                # Top-level page, parse to find link
-                dl_soup = BeautifulSoup(dl_res.content, 'html.parser')
+                    if 'text/html' not in content_type and dl_res.kind != 'html':
+                        # Direct download detected
+                        download = dl_res
+                        logger.info(f"Direct download detected: {dl_page_url} ({content_type})")
+                    else:
+                        # Top-level page, parse to find link
+                        dl_soup = BeautifulSoup(dl_res.read(), 'html.parser')
+                        dl_res.close()
+                        final_dl_link = None
                 
-                # Method A: Look for explicit file extensions
-                for a in dl_soup.find_all('a', href=True):
-                    h = a['href'].lower()
-                    if h.endswith('.zip') or h.endswith('.rar') or h.endswith('.srt'):
-                        final_dl_link = a['href']
-                        break
+                        # Method A: Look for explicit file extensions
+                        for a in dl_soup.find_all('a', href=True):
+                            h = a['href'].lower()
+                            if h.endswith('.zip') or h.endswith('.rar') or h.endswith('.srt'):
+                                final_dl_link = a['href']
+                                break
                 
-                # Method B: Look for 'Download' button text
-                if not final_dl_link:
-                    for a in dl_soup.find_all('a', href=True):
-                        if 'download' in a.get_text(strip=True).lower():
-                            final_dl_link = a['href']
-                            break
+                        # Method B: Look for 'Download' button text
+                        if not final_dl_link:
+                            for a in dl_soup.find_all('a', href=True):
+                                if 'download' in a.get_text(strip=True).lower():
+                                    final_dl_link = a['href']
+                                    break
             
-            if not final_dl_link:
-                # Fallback: Maybe the dl_page_url WAS the file (if it was a redirect)? 
-                # But headers would show content-type. 
-                # Let's assume text/html means we missed the link.
-                if 'text/html' not in dl_res.headers.get('Content-Type', ''):
-                    # It was the file!
-                    file_content = dl_res.content
-                    final_dl_link = dl_page_url # for logging
-                else:
-                    logger.warning(f"Could not find final link on: {dl_page_url}")
-                    return False
-            else:
-                # 4. Download File
-                if not final_dl_link.startswith('http'):
-                    final_dl_link = urljoin(self.base_url, final_dl_link)
+                        if not final_dl_link:
+                            logger.warning(f"Could not find final link on: {dl_page_url}")
+                            return self._fail(url, "no_file_link", permanent=True)
+                        
+                        # 4. Download File
+                        if not final_dl_link.startswith('http'):
+                            final_dl_link = urljoin(self.base_url, final_dl_link)
                 
-                logger.info(f"Downloading File: {final_dl_link}")
-                file_res = self.get_page(final_dl_link)
-                if not file_res:
-                    return False
-                file_content = file_res.content
+                        logger.info(f"Downloading File: {final_dl_link}")
+                        download = self.download_file(final_dl_link, inspect=self._precheck(title, url))
+                        if not download:
+                            return self._fail(url, "download_failed")
+                        self.download_templates.learn(dl_page_url, final_dl_link)
+                self.file_cache.put_file(download.open(), download.sha256, download.size, source_url=url, title=title)
+            content_sha256 = download.sha256
 
             # 5. Metadata & Naming
-            if file_content[:4] == b'PK\x03\x04': ext = ".zip"
-            elif file_content[:4] == b'Rar!': ext = ".rar"
-            else: ext = ".srt" # Default/Fallback
-            
-            # Sanitize title but keep Sinhala characters (Unicode aware)
-            # Remove purely illegal filename characters: \ / : * ? " < > |
-            clean_title = re.sub(r'[\\/*?:"<>|]', '', title).strip()
-            # If title is still too long or empty, handle it
-            clean_title = clean_title[:200]
-            if not clean_title or clean_title == "Unknown":
-                # Fallback: Use last part of URL if title failed
-                clean_title = url.rstrip('/').split('/')[-1] or f"subtitle_{int(time.time())}"
-                
-            filename = f"{clean_title}{ext}"
+            filename = self._build_filename(title, download.extension(".srt"), url)
             norm_name = normalize_filename(filename)
             
             # 6. Duplicate Check
-            with self.lock:
-                if norm_name in self.existing_filenames:
-                    logger.info(f"Skipping Duplicate: {filename}")
+            reason, match = self.dedup.find_duplicate(filename, content_sha256, normalized=norm_name)
+            if reason:
+                logger.info(f"Skipping Duplicate ({reason.title()}): {filename} matches {match}")
+                self.d1.add_processed_url(url, True, title, source=self.source)
+                with self.lock:
+                    self.processed_urls.add(canonicalize_url(url))
+                return True
+
+            # Near-duplicate check on the subtitle text itself (re-zipped, re-timed, watermarked copies)
+            track_hashes, near_match, skip = self.dedup.check_near_duplicate(download.open())
+            if near_match:
+                if skip:
+                    logger.info(f"Skipping Near-Duplicate: {filename} (matches {near_match[0]}, distance {near_match[1]})")
                     self.d1.add_processed_url(url, True, title, source=self.source)
-                    self.processed_urls.add(url)
+                    with self.lock:
+                        self.processed_urls.add(canonicalize_url(url))
                     return True
-            
+                logger.info(f"Near-Duplicate Flagged: {filename} (matches {near_match[0]}, distance {near_match[1]})")
+
             # 7. Upload
             caption = f"<b>{title}</b>\n\nSource: Zoom.lk\nLink: {url}"
-            file_info = self.telegram.send_document(file_content, filename, caption)
+            file_info = self.telegram.send_document(download.open(), filename, caption)
             
             if file_info:
                 if self.d1.enabled:
@@ -309,61 +410,95 @@ class ZoomLkScraper:
                         file_unique_id=file_info.get('file_unique_id', ''),
                         filename=filename,
                         normalized_filename=norm_name,
-                        file_size=len(file_content),
+                        file_size=download.size,
                         title=title,
                         source_url=url,
                         category="",
                         message_id=file_info.get('message_id', 0),
-                        source=self.source
+                        source=self.source,
+                        content_sha256=content_sha256,
+                        subtitle_simhash=encode_hashes(track_hashes)
                     )
                     self.d1.add_processed_url(url, True, title, source=self.source)
                     with self.lock:
-                        self.processed_urls.add(url)
-                        self.existing_filenames.add(norm_name)
+                        self.processed_urls.add(canonicalize_url(url))
                         self.stats['processed'] += 1
+                self.dedup.record_upload(filename, file_info['file_id'], content_sha256, track_hashes,
+                                        normalized=norm_name, size=download.size)
                 return True
                 
-            return False
+            return self._fail(url, "upload_failed")
             
+        except DownloadSkipped as e:
+            reason, match, filename, title = e.result
+            logger.info(f"Skipping Duplicate ({reason.title()}) before download: {filename} matches {match}")
+            self.d1.add_processed_url(url, True, title, source=self.source)
+            with self.lock:
+                self.processed_urls.add(canonicalize_url(url))
+            return True
         except Exception as e:
             logger.error(f"Error processing {url}: {e}")
-            return False
+            return self._fail(url, type(e).__name__)
+        finally:
+            if download:
+                download.close()
 
-    def process_queue_mode(self, limit=None):
-        """Process pending URLs"""
+    def process_queue_mode(self, limit=None, budget=None, announce=True):
+        """
+        Process pending URLs on one long-lived worker pool; budget (deadline.RunBudget) may end it early.
+        announce=False keeps the run out of the Telegram chat (scheduled processing of a few new items).
+        """
         logger.info(">>> STARTING PROCESSING PHASE <<<")
-        processed_count = 0
+        if stop_reason(budget):
+            return 0
+        self.d1.release_stale_claims(source=self.source)
         
-        while True:
-            if limit and processed_count >= limit: break
-            
-            batch = self.d1.get_pending_urls(limit=self.batch_size, source=self.source)
-            if not batch: break
-            
-            urls = [r['url'] for r in batch if r.get('url')]
-            
-            if not self.tracker.thread or not self.tracker.thread.is_alive():
-                self.tracker.start(self.d1.get_pending_count(source=self.source))
-                
-            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-                futures = {executor.submit(self._process_one, u): u for u in urls}
-                for future in as_completed(futures):
-                    res = future.result()
-                    self.tracker.update(success=res)
-                    processed_count += 1
-            
-            sys.stdout.flush()
-            time.sleep(2)
-            
-        self.tracker.stop()
+        pending = self.d1.get_pending_count(source=self.source, due_only=True)
+        if not pending:
+            return 0
+        if not self.tracker.thread or not self.tracker.thread.is_alive():
+            self.tracker.start(pending, announce=announce)
+        
+        self.work_pool = WorkPool(
+            fetch_batch=lambda n: self.d1.claim_pending_urls(limit=n, source=self.source),
+            process=lambda row: self._process_one(row['url']),
+            num_workers=self.num_workers,
+            batch_size=self.batch_size,
+            on_result=lambda res: self.tracker.update(success=res),
+            name=self.source,
+            budget=budget
+        )
+        self.autoscaler = AutoScaler(
+            self.work_pool, self.min_workers, self.max_workers,
+            throttle_count=lambda: self.telegram.throttled + self.hedger.stats['throttled']
+        )
+        self.autoscaler.start()
+        try:
+            processed_count = self.work_pool.run(limit=limit)
+        finally:
+            self.autoscaler.stop()
+        leftovers = self.work_pool.take_leftovers()
+        if leftovers:
+            # Claimed by the prefetch but never started - straight back to the queue, not after the stale-claim timeout
+            self.d1.release_claims([row['url'] for row in leftovers], source=self.source)
+            logger.info(f"Stopped early: {len(leftovers)} claimed URLs returned to the queue")
+        
+        sys.stdout.flush()
+        self.tracker.stop(note=stop_reason(budget))
         return processed_count
 
-    def scrape_all_categories(self, limit=None):
+    def scrape_all_categories(self, limit=None, budget=None):
         """Full Scrape"""
-        self.crawl_only()
-        return self.process_queue_mode(limit=limit)
+        self.crawl_only(budget=budget)
+        return self.process_queue_mode(limit=limit, budget=budget)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="zoom.lk scraper (D1 queue)")
+    parser.add_argument('--limit', type=int, default=10, help="items to process (0 for no limit)")
+    parser.add_argument('--deadline', type=parse_duration,
+                        help="time budget for the run, e.g. 340m or 5h40m")
+    args = parser.parse_args()
+    get_shutdown().install()
     s = ZoomLkScraper(os.getenv('TELEGRAM_BOT_TOKEN'), os.getenv('TELEGRAM_CHAT_ID'))
     s.initialize()
-    s.scrape_all_categories(limit=10)
+    s.scrape_all_categories(limit=args.limit or None, budget=RunBudget(args.deadline) if args.deadline else None)